@@ -1,18 +1,22 @@
 # OverUnderPrediction.py
 
 import math
-from dataclasses import dataclass
-from typing import Dict, Tuple, Optional
+import time
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, Tuple, Optional
 
+import numpy as np
 import pandas as pd
-import nfl_data_py as nfl
 
 # Local modules
 import nfl_api                       # uses config.defensive_* and line/defense calcs
-import nfl_player_stats_v2 as nps    # L10, L10_Average, player_vs_team_average, etc.
 import config                        # factors_by_position_stat + defensive_*_factors
 import traceback
+from derived_cache import derived_cache, inputs, loading, trace
+from fact_table import HISTORY_SEASONS, GameSlice, season_facts
+from ingest import stored_aggregates
 from predictionHelpers import get_red_zone_usage, pointsAllowed, get_player_position, calculate_weapons_grade, get_player_id
+from tracing import span
 
 # ---------- Utils
 
@@ -47,6 +51,38 @@ class PredictionResult:
     decision: str
     contributions: Dict[str, float]   # percentage point deltas
     notes: Dict[str, str]             # context per factor + fallback messages
+    # per signal function: seconds, cache_hits, computed (artifacts rebuilt), loads [(what, seconds)]
+    timings: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+    from_cache: bool = False          # timings are from the computation that was cached
+
+
+def _timed(timings: Dict[str, Dict[str, Any]], name: str, fn, *args):
+    """Call fn(*args), recording its time, cache hits and data loads under `name`."""
+    start = time.perf_counter()
+    with trace() as t, span(name, kind="factor"):
+        try:
+            return fn(*args)
+        finally:
+            timings[name] = {
+                "seconds": round(time.perf_counter() - start, 4),
+                "cache_hits": t.hits,
+                "computed": [str(k) for k in t.computed],
+                "loads": [(what, round(seconds, 4)) for what, seconds in t.loads],
+            }
+
+
+def format_timings(result: "PredictionResult", top: int = 12) -> str:
+    """Slowest signal functions first, one line each."""
+    rows = sorted(result.timings.items(), key=lambda kv: -kv[1]["seconds"])[:top]
+    lines = []
+    for name, t in rows:
+        line = f"{name:28s} {t['seconds']:7.3f}s  hits {t['cache_hits']:<3d} computed {len(t['computed'])}"
+        if t["loads"]:
+            line += "  loads: " + ", ".join(f"{what} {seconds:.2f}s" for what, seconds in t["loads"])
+        lines.append(line)
+    total = sum(t["seconds"] for t in result.timings.values())
+    lines.append(f"{'total':28s} {total:7.3f}s" + ("  (served from cache)" if result.from_cache else ""))
+    return "\n".join(lines)
 
 
 # ---------- Mapping helpers
@@ -62,22 +98,39 @@ def _stat_context(stat_line: str) -> str:
     return "rush"
 
 
-def _position_of_player(player_name: str, season: int) -> Optional[str]:
+def player_games(player_name: str, season: int) -> Optional[GameSlice]:
+    """
+    The player's games from HISTORY_SEASONS[0] through `season`: the one slice the
+    history-based signals (and !card) read. None when the weekly data can't be loaded.
+    """
+    try:
+        return season_facts(season).games_for(player_name).between(HISTORY_SEASONS[0], season)
+    except Exception:
+        return None
+
+
+def _l10_average(recent: Optional[GameSlice], stat: str) -> float:
+    """Mean of `stat` over the recent games; 0 without games or the stat (as nfl_player_stats_v2.L10_Average)."""
+    if recent is None or recent.empty or not recent.facts.has_stat(stat):
+        return 0
+    return float(np.nanmean(recent.stat(stat)))
+
+
+def _position_of_player(player_name: str, this_season: Optional[GameSlice]) -> Optional[str]:
     """
     Infer the player's position from weekly data, then roster. Safe when offline.
     """
+    import nfl_data_py as nfl
     try:
-        weekly = nfl.import_weekly_data([season])
-        rows = weekly[weekly["player_display_name"] == player_name]
-        if not rows.empty:
-            pos = rows["position"].dropna()
-            if not pos.empty:
-                return str(pos.mode().iloc[0]).upper()
+        pos = this_season.most_common_position()
+        if pos:
+            return pos.upper()
     except Exception:
         pass
 
     try:
-        players = nfl.import_players()
+        with loading("nfl.import_players"):
+            players = nfl.import_players()
         prows = players[players["display_name"] == player_name]
         if not prows.empty:
             pos = prows["position"].dropna()
@@ -88,21 +141,12 @@ def _position_of_player(player_name: str, season: int) -> Optional[str]:
     return None
 
 
-def _team_of_player(player_name: str, season: int) -> Optional[str]:
+def _team_of_player(this_season: Optional[GameSlice]) -> Optional[str]:
     """
     Infer player's (most frequent) team in a given season from weekly data. Safe when offline.
     """
     try:
-        weekly = nfl.import_weekly_data([season])
-        rows = weekly[weekly["player_display_name"] == player_name]
-        if rows.empty:
-            return None
-        if "recent_team" in rows.columns:
-            return str(rows["recent_team"].mode().iloc[0])
-        if "posteam" in rows.columns:
-            p = rows["posteam"].dropna()
-            if not p.empty:
-                return str(p.mode().iloc[0])
+        return this_season.most_common_team()
     except Exception:
         pass
     return None
@@ -181,28 +225,28 @@ def _usage_rate_adjustment(
         return norm, f"pass_rate={pass_rate:.2%}, norm={norm:.2f}"
 
 
-def _recent_form_adjustment(player_name: str, stat_line: str, season: int, line_value: float) -> Tuple[float, str]:
+def _recent_form_adjustment(recent: Optional[GameSlice], stat_line: str, line_value: float) -> Tuple[float, str]:
     try:
-        recent_avg = nps.L10_Average(player_name, stat_line, season)
+        recent_avg = _l10_average(recent, stat_line)
         rel = _clip(_safe_div(recent_avg - line_value, max(line_value, 1e-6)), -1.0, 1.0)
         return rel, f"L10_avg={recent_avg:.2f}, line={line_value}, rel={rel:.2f}"
     except Exception as e:
         return 0.0, f"Skipped: recent form unavailable ({e.__class__.__name__})"
 
 
-def _vs_team_adjustment(player_name: str, stat_line: str, opp_team: str, line_value: float) -> Tuple[float, str]:
+def _vs_team_adjustment(games: Optional[GameSlice], stat_line: str, opp_team: str, line_value: float) -> Tuple[float, str]:
     try:
-        vs_avg_dict = nps.player_vs_team_average(opp_team, player_name, stat_line)
-        vs_avg = list(vs_avg_dict.values())[0] if vs_avg_dict else 0.0
+        vs_games = games.vs(opp_team)
+        vs_avg = float(vs_games.stat(stat_line).mean()) if not vs_games.empty else 0.0
         rel = _clip(_safe_div(vs_avg - line_value, max(line_value, 1e-6)), -1.0, 1.0)
         return rel, f"vs_{opp_team}_avg={vs_avg:.2f}, line={line_value}, rel={rel:.2f}"
     except Exception as e:
         return 0.0, f"Skipped: vs-team history unavailable ({e.__class__.__name__})"
     
-def _yards_per_carry_adjustment(player_name: str, season: int, line_value: float) -> Tuple[float, str]:
+def _yards_per_carry_adjustment(recent: Optional[GameSlice], line_value: float) -> Tuple[float, str]:
     try:
-        recent_yards = nps.L10_Average(player_name, "rushing_yards", season)
-        recent_carries = nps.L10_Average(player_name, "carries", season)
+        recent_yards = _l10_average(recent, "rushing_yards")
+        recent_carries = _l10_average(recent, "carries")
 
         if recent_carries == 0: 
             return 0.0, "Skipped: no recent carries"
@@ -219,14 +263,14 @@ def _yards_per_carry_adjustment(player_name: str, season: int, line_value: float
     except Exception as e:
         return 0.0, f"Skipped: yards_per_carry unavailable ({e.__class__.__name__})"
 
-def _carries_adjustment(player_name: str, season: int, stat_line: str, line_value: float) -> Tuple[float,str]:
+def _carries_adjustment(recent: Optional[GameSlice], stat_line: str, line_value: float) -> Tuple[float,str]:
     try:
-        recent_carries = nps.L10_Average(player_name, "carries", season)
+        recent_carries = _l10_average(recent, "carries")
         if recent_carries == 0:
             return 0.0, "Skipped: no recent carries"
         
         if "rushing" in stat_line:
-            recent_yards = nps.L10_Average(player_name, "rushing_yards", season)
+            recent_yards = _l10_average(recent, "rushing_yards")
             recent_ypc = _safe_div(recent_yards, recent_carries, 0.0)
 
             if recent_ypc == 0: 
@@ -378,19 +422,19 @@ def _blitz_rate_adjustment(pbp: pd.DataFrame, player_team: Optional[str]) -> tup
             f"pass_plays={total_pass_plays}, raw_rate={raw_rate:.2f}, norm={norm:.2f}")
     return norm, note
 
-def _rush_attempts_adjustment(player_name: str, season: int, stat_line: str, line_value: float) -> tuple[float, str]:
+def _rush_attempts_adjustment(recent: Optional[GameSlice], stat_line: str, line_value: float) -> tuple[float, str]:
     """
     Estimate the rush attempt signal for a player in [-1,1].
     Compares recent L10 carries vs. the implied line.
     """
     try:
-        recent_carries = nps.L10_Average(player_name, "carries", season)
+        recent_carries = _l10_average(recent, "carries")
         if recent_carries == 0:
             return 0.0, "Skipped: no recent carries"
 
         # If the stat line is rushing-related, compute implied attempts
         if "rush" in stat_line:
-            recent_yards = nps.L10_Average(player_name, "rushing_yards", season)
+            recent_yards = _l10_average(recent, "rushing_yards")
             ypc = recent_yards / max(recent_carries, 1e-6)
 
             implied_attempts = line_value / max(ypc, 1e-6)
@@ -442,8 +486,10 @@ def _yac_avg_adjustment(pbp: pd.DataFrame, player_name: str, player_team: str) -
         return 0.0, f"Skipped: YAC calculation failed ({e.__class__.__name__})"
 
 def _qb_size_adjustment(player_name: str) -> tuple[float, str]:
+    import nfl_data_py as nfl
     try:
-        players = nfl.import_players()
+        with loading("nfl.import_players"):
+            players = nfl.import_players()
         qb = players[players['display_name'] == player_name]
         if qb.empty or qb.iloc[0]['position'] != 'QB':
             return 0.0, "Skipped: not a QB or player not found"
@@ -476,7 +522,7 @@ def _load_pbp_with_fallback(season: int) -> Tuple[Optional[pd.DataFrame], int, s
     """
     # 1) Try requested season
     try:
-        pbp = nfl_api.load_data(season)
+        pbp = nfl_api.load_data(season, projected=True)
         if isinstance(pbp, pd.DataFrame) and not pbp.empty and "defteam" in pbp.columns:
             return pbp, season, f"Loaded PBP for {season}"
     except Exception as e:
@@ -485,7 +531,7 @@ def _load_pbp_with_fallback(season: int) -> Tuple[Optional[pd.DataFrame], int, s
     # 2) Fallback to previous season
     prev = season - 1
     try:
-        pbp_prev = nfl_api.load_data(prev)
+        pbp_prev = nfl_api.load_data(prev, projected=True)
         if isinstance(pbp_prev, pd.DataFrame) and not pbp_prev.empty and "defteam" in pbp_prev.columns:
             return pbp_prev, prev, f"No PBP for {season}; fell back to {prev}"
     except Exception as e:
@@ -495,6 +541,42 @@ def _load_pbp_with_fallback(season: int) -> Tuple[Optional[pd.DataFrame], int, s
     return None, season, f"No PBP available for {season} (or {prev}). Offline or data unavailable."
 
 
+def _season_tables(season: int):
+    """
+    (pbp, season_used, message, defensive_df, off_line_df) through the dependency cache,
+    so the tables are built once per season and rebuilt only when that season's data changes.
+    The team tables are finalized from the season's incremental aggregates when the local
+    store has the season (a sync then updates 32-row partials instead of rescanning pbp).
+    """
+    pbp_key = ("pbp", season)
+    pbp, used, msg = derived_cache.cached(
+        pbp_key, inputs([season, season - 1]), lambda: _load_pbp_with_fallback(season)
+    )
+    if pbp is None:
+        derived_cache.discard(pbp_key)  # don't pin the offline fallback; retry next time
+        return None, used, msg, None, None
+
+    aggregates = stored_aggregates(used) if used == season else None
+    depends_on = [pbp_key] + ([("aggregates", season)] if aggregates is not None else [])
+    try:
+        defensive_df = derived_cache.cached(
+            ("defensive", season), inputs([used]),
+            (aggregates.defensive_df if aggregates is not None else lambda: nfl_api.calculate_defensive_stats(pbp)),
+            depends_on=depends_on
+        )
+    except Exception:
+        defensive_df = None
+    try:
+        off_line_df = derived_cache.cached(
+            ("oline", season), inputs([used]),
+            (aggregates.off_line_df if aggregates is not None else lambda: nfl_api.calculate_offensive_line_metrics(pbp)),
+            depends_on=depends_on
+        )
+    except Exception:
+        off_line_df = None
+    return pbp, used, msg, defensive_df, off_line_df
+
+
 # ---------- Core predictor
 
 def predict_over_under(
@@ -502,34 +584,55 @@ def predict_over_under(
     stat_line: str,
     line_value: float,
     opponent_team: str,
-    season: int = 2024
+    season: int = 2024,
+    games: Optional[GameSlice] = None
 ) -> PredictionResult:
     """
     Returns a probability-based OVER/UNDER prediction with factor breakdown.
-    Robust to offline/no-data situations.
+    Robust to offline/no-data situations. Results are cached until the season's
+    data (or this player's history) changes. `games` is player_games(player_name, season)
+    when the caller already has it (!card shows the same games next to the prediction).
     """
+    key = ("prediction", player_name, stat_line.lower().replace(" ", "_"), float(line_value), opponent_team, season)
+    with trace() as t:
+        result = derived_cache.cached(
+            key,
+            inputs(HISTORY_SEASONS + (season, season - 1), players=[player_name]),
+            lambda: _predict_over_under(player_name, stat_line, line_value, opponent_team, season, games),
+            depends_on=[("pbp", season)],
+        )
+    if derived_cache.peek(("pbp", season)) is None:
+        derived_cache.discard(key)  # computed without PBP (offline); don't keep it
+    if key not in t.computed:
+        result = replace(result, from_cache=True)
+    return result
+
+
+def _predict_over_under(
+    player_name: str,
+    stat_line: str,
+    line_value: float,
+    opponent_team: str,
+    season: int,
+    games: Optional[GameSlice] = None
+) -> PredictionResult:
     # Normalize
     stat_line = stat_line.lower().replace(" ", "_")
     stat_ctx = _stat_context(stat_line)
 
-    # Data pulls (robust)
-    pbp, pbp_season_used, pbp_msg = _load_pbp_with_fallback(season)
+    timings: Dict[str, Dict[str, Any]] = {}
 
-    if pbp is not None:
-        try:
-            defensive_df = nfl_api.calculate_defensive_stats(pbp)
-        except Exception:
-            defensive_df = None
-        try:
-            off_line_df = nfl_api.calculate_offensive_line_metrics(pbp)
-        except Exception:
-            off_line_df = None
-    else:
-        defensive_df = None
-        off_line_df = None
+    # Data pulls (robust, cached per season)
+    pbp, pbp_season_used, pbp_msg, defensive_df, off_line_df = _timed(timings, "_season_tables", _season_tables, season)
 
-    player_team = _team_of_player(player_name, season)
-    player_pos = (_position_of_player(player_name, season) or "").upper()
+    # Every history-based signal reads this one slice of the player's games
+    if games is None:
+        games = _timed(timings, "player_games", player_games, player_name, season)
+    this_season = games.between(season, season) if games is not None else None
+    recent = this_season.tail(10) if this_season is not None else None
+
+    player_team = _timed(timings, "_team_of_player", _team_of_player, this_season)
+    player_pos = (_timed(timings, "_position_of_player", _position_of_player, player_name, this_season) or "").upper()
 
     # Choose weights for this player's position+stat
     factors_cfg = None
@@ -556,33 +659,37 @@ def predict_over_under(
 
     # ----- Build normalized signals in [-1,1] -----
 
+    # Each signal is timed into `timings` (see _timed)
+    def timed(fn, *args):
+        return _timed(timings, fn.__name__, fn, *args)
+
     # 1) Defense difficulty (rush/pass)
-    def_sig, def_note = _defense_adjustment(opponent_team, defensive_df, stat_ctx)
+    def_sig, def_note = timed(_defense_adjustment, opponent_team, defensive_df, stat_ctx)
 
     # 2) Offensive line strength of player's team
-    oline_sig, oline_note = _oline_adjustment(player_team, off_line_df)
+    oline_sig, oline_note = timed(_oline_adjustment, player_team, off_line_df)
 
     # 3) Team usage tendency (pass_rate / rush_rate) for player's team
-    usage_sig, usage_note = _usage_rate_adjustment(pbp, player_team, stat_ctx)
+    usage_sig, usage_note = timed(_usage_rate_adjustment, pbp, player_team, stat_ctx)
 
     # 4) Recent form (L10 vs line)
-    recent_sig, recent_note = _recent_form_adjustment(player_name, stat_line, season, line_value)
+    recent_sig, recent_note = timed(_recent_form_adjustment, recent, stat_line, line_value)
 
     # 5) Opponent history (player vs opponent)
-    vs_sig, vs_note = _vs_team_adjustment(player_name, stat_line, opponent_team, line_value)
-
-    ypc_sig, ypc_note = _yards_per_carry_adjustment(player_name, season, line_value)
-    carries_sig, carries_note = _carries_adjustment(player_name, season, stat_line, line_value)
-    rz_sig, rz_note = _red_zone_adjustment(pbp, player_name, player_team)
-    points_sig, points_note = _points_allowed_adjustment(opponent_team, pointsAllowed(pbp, opponent_team))
-    weapons_grade_sig, _weapons_grade_note = _weapons_grade_adjustment(pbp, player_team, player_name)
-    air_yards_sig, air_yards_note = _air_yards_adjustment(pbp, player_team, player_name)
-    pressure_sig, pressure_note = _pressure_rate_adjustment(pbp, player_team, player_name)
-    td_int_sig, td_int_note = _td_int_ratio_adjustment(pbp, player_team, player_name)
-    blitz_sig, blitz_note = _blitz_rate_adjustment(pbp, player_team)
-    rush_attempts_sig, rush_attempts_note = _rush_attempts_adjustment(player_name, season, stat_line, line_value)
-    yac_sig, yac_note = _yac_avg_adjustment(pbp, player_name, player_team)
-    qb_size_sig, qb_size_note = _qb_size_adjustment(player_name)
+    vs_sig, vs_note = timed(_vs_team_adjustment, games, stat_line, opponent_team, line_value)
+
+    ypc_sig, ypc_note = timed(_yards_per_carry_adjustment, recent, line_value)
+    carries_sig, carries_note = timed(_carries_adjustment, recent, stat_line, line_value)
+    rz_sig, rz_note = timed(_red_zone_adjustment, pbp, player_name, player_team)
+    points_sig, points_note = timed(_points_allowed_adjustment, opponent_team, timed(pointsAllowed, pbp, opponent_team))
+    weapons_grade_sig, _weapons_grade_note = timed(_weapons_grade_adjustment, pbp, player_team, player_name)
+    air_yards_sig, air_yards_note = timed(_air_yards_adjustment, pbp, player_team, player_name)
+    pressure_sig, pressure_note = timed(_pressure_rate_adjustment, pbp, player_team, player_name)
+    td_int_sig, td_int_note = timed(_td_int_ratio_adjustment, pbp, player_team, player_name)
+    blitz_sig, blitz_note = timed(_blitz_rate_adjustment, pbp, player_team)
+    rush_attempts_sig, rush_attempts_note = timed(_rush_attempts_adjustment, recent, stat_line, line_value)
+    yac_sig, yac_note = timed(_yac_avg_adjustment, pbp, player_name, player_team)
+    qb_size_sig, qb_size_note = timed(_qb_size_adjustment, player_name)
 
     # Map signals to weight keys
     signals: Dict[str, Tuple[float, str]] = {
@@ -660,7 +767,8 @@ def predict_over_under(
         under_probability=round(under_p, 4),
         decision=("OVER" if over_p >= under_p else "UNDER"),
         contributions=contributions_pp,
-        notes=notes
+        notes=notes,
+        timings=timings
     )
 
 
@@ -686,3 +794,5 @@ if __name__ == "__main__":
     print("\n--- Notes ---")
     for k, v in pred.notes.items():
         print(f"{k:20s} {v}")
+    print("\n--- Timings ---")
+    print(format_timings(pred, top=len(pred.timings)))
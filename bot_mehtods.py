@@ -1,11 +1,15 @@
-import nfl_data_py as nfl
+from fact_table import history_facts, recent_facts
+from nfl_api import (
+    calculate_offensive_stats_seasons,
+    calculate_offensive_line_metrics_seasons,
+    calculate_defensive_stats_seasons,
+    season_team_partials,
+    team_trend,
+    adjusted_rush_defense_metric
+)
 import pandas as pd
-from collections import defaultdict
-from nfl_player_stats_v2 import custom_stats  # Assuming you have this already
-import matplotlib.pyplot as plt
-import numpy as np
+from chart_render import render_bar_chart, last10_spec, vs_team_spec
 import io
-import seaborn as sns
 
 # def L10(playerName, statLine, lineNumber, OA):
 #     statLine = statLine.lower().replace(' ', '_')  # Normalize stat line name
@@ -55,41 +59,16 @@ def L10(playerName, statLine, lineNumber, OA):
     statLine = statLine.lower().replace(' ', '_')  # Normalize stat line name
 
     current_season = 2024
-    collected_games = pd.DataFrame()
 
-    # Try loading current season first
-    schedule = nfl.import_weekly_data([current_season])
-    player_games = schedule[schedule['player_display_name'] == playerName]
-    player_games = player_games.sort_values(by='week', ascending=False)
+    # Most recent 10 games, reaching back into previous seasons for short careers
+    games = recent_facts().games_for(playerName).between(2005, current_season).tail(10)  # choose earliest season limit
+    if len(games) < 10:  # fewer than 10 in the recent seasons: the rest are further back
+        games = history_facts().games_for(playerName).between(2005, current_season).tail(10)
+    display_stat = statLine
 
-    collected_games = player_games.head(10)
+    # Gather last 10 game stat values with opponent teams (oldest first)
+    results = list(zip(games.opponents(), games.stat_list(display_stat)))
 
-    # If less than 10 games, load previous seasons one by one
-    season_to_load = current_season - 1
-    while len(collected_games) < 10 and season_to_load >= 2005:  # choose earliest season limit
-        schedule_prev = nfl.import_weekly_data([season_to_load])
-        player_prev = schedule_prev[schedule_prev['player_display_name'] == playerName]
-        player_prev = player_prev.sort_values(by='week', ascending=False)
-
-        # Add games from previous season up to remaining slots needed
-        needed = 10 - len(collected_games)
-        collected_games = pd.concat([collected_games, player_prev.head(needed)], ignore_index=True)
-
-        season_to_load -= 1
-
-    # Sort combined games by season and week descending to keep most recent first
-    collected_games = collected_games.sort_values(by=['season', 'week'], ascending=[False, False]).head(10)
-
-    display_stat = custom_stats(collected_games, statLine)  # Get the correct stat column name
-
-    # Gather last 10 game stat values with opponent teams
-    results = []
-    for _, row in collected_games.iterrows():
-        stat_value = row[display_stat]
-        opponent = row['opponent_team']
-        results.append((opponent, stat_value))
-
-    results.reverse()  # Reverse to show most recent first
     # Display last 10 games results
     print(f"Last 10 games for {playerName} - Stat: {display_stat}")
     for i, (opp, val) in enumerate(results, 1):
@@ -154,56 +133,10 @@ def L10(playerName, statLine, lineNumber, OA):
 #     return buf
 
 
-def plot_last_10_results(results, line_number, oa, player_name, stat_name):
-    # Extract opponent names and performance values
-    opponents = [opp for opp, _ in results]
-    values = [val for _, val in results]
-    indices = np.arange(len(results))
-
-    # Determine bar colors based on Over/Under, using muted colors for a sleek look
-    if oa.lower() == 'over':
-        colors = ['#4CAF50' if val > line_number else '#F44336' for val in values]  # Green for over, Red for under
-    else:
-        colors = ['#4CAF50' if val < line_number else '#F44336' for val in values]  # Green for under, Red for over
-
-    # Create the plot
-    fig, ax = plt.subplots(figsize=(12, 6))
-
-    # Bar plot with clean color scheme
-    bars = ax.bar(indices, values, color=colors, width=0.6, edgecolor='black', linewidth=1.2)
-
-    # Add horizontal line to indicate the threshold
-    ax.axhline(line_number, color='black', linestyle='--', linewidth=2)
-
-    # Add the line number text near the dashed line
-    ax.text(len(results) - 0.5, line_number + 0.5, f'Line: {line_number}', ha='right', va='bottom', fontsize=12, color='black')
-
-    # Add data labels on top of the bars for exact value display
-    for i, bar in enumerate(bars):
-        height = bar.get_height()
-        ax.text(bar.get_x() + bar.get_width() / 2, height + 0.15, f'{height:.1f}', ha='center', va='bottom', fontsize=10)
-
-    # Title and labels with more modern typography
-    ax.set_title(f"{player_name} - Last 10 Games ({stat_name.title()})", fontsize=16, weight='bold', color='black')
-    ax.set_xlabel("Opponent", fontsize=14, color='black')
-    ax.set_ylabel(stat_name.title(), fontsize=14, color='black')
-
-    # Improve x-tick labels (opponent names), smaller and more spaced out
-    ax.set_xticks(indices)
-    ax.set_xticklabels(opponents, rotation=45, ha='right', fontsize=12, color='black')
-
-    # Add a subtle grid for better readability
-    ax.grid(True, axis='y', linestyle='--', alpha=0.4)
-
-    # Adjust layout for better spacing and fitting
-    plt.tight_layout()
-
-    # Save the plot to a BytesIO stream
-    buf = io.BytesIO()
-    fig.savefig(buf, format='png', dpi=300)
-    plt.close(fig)
-    buf.seek(0)
-    return buf
+def plot_last_10_results(results, line_number, oa, player_name, stat_name, high_res=False):
+    # Drawn on a cached figure template (see chart_render); the bot renders in its worker pool instead
+    spec = last10_spec(results, line_number, oa, player_name, stat_name)
+    return io.BytesIO(render_bar_chart(high_res=high_res, **spec))
 
 
 
@@ -247,26 +180,13 @@ def plot_last_10_results(results, line_number, oa, player_name, stat_name):
 #     }
 
 def get_player_career_span(playerName, start_year=2000, end_year=2024, chunk_size=5):
-    # Search in chunks of years, moving backward, until no more data for player found
-    seasons_found = []
-    for year_start in range(end_year - chunk_size + 1, start_year - 1, -chunk_size):
-        year_end = year_start + chunk_size - 1
-        if year_end > end_year:
-            year_end = end_year
-        
-        years = list(range(year_start, year_end + 1))
-        data_chunk = nfl.import_weekly_data(years)
-        player_data = data_chunk[data_chunk['player_display_name'] == playerName]
-        
-        if not player_data.empty:
-            seasons_found.extend(player_data['season'].unique().tolist())
-        else:
-            # If no data in this chunk, assume no earlier data — can stop early
-            if seasons_found:
-                break
-
-    if seasons_found:
-        return min(seasons_found), max(seasons_found)
+    # First and last season the player appears in, read from the player's fact-table slice
+    # (chunk_size is kept for callers; the whole history is indexed once instead of scanned in chunks)
+    games = history_facts().games_for(playerName).between(start_year, end_year)
+
+    if not games.empty:
+        seasons = games.seasons
+        return int(seasons.min()), int(seasons.max())
     else:
         return None, None
 
@@ -279,24 +199,16 @@ def h2h(playerName, statLine, lineNumber, OA, opp):
     if min_season is None or max_season is None:
         return None  # Player not found at all
     
-    # Load all seasons in career span
-    all_data = nfl.import_weekly_data(list(range(min_season, max_season + 1)))
-    
-    player_games = all_data[
-        (all_data['player_display_name'] == playerName) &
-        (all_data['opponent_team'] == opp)
-    ]
+    # Player's games vs opponent within the career span
+    player_games = history_facts().games_vs(playerName, opp).between(min_season, max_season)
 
     if player_games.empty:
         return None  # No data for that matchup
 
-    display_stat = custom_stats(player_games, statLine)
+    display_stat = statLine
 
-    results = []
-    for _, row in player_games.iterrows():
-        stat_value = row[display_stat]
-        game_label = f"Wk {row['week']} {row['season']}"  # e.g., "Wk 5 2021"
-        results.append((game_label, stat_value))
+    # e.g., ("Wk 5 2021", value)
+    results = list(zip(player_games.labels(), player_games.stat_list(display_stat)))
 
     # Over/Under calculation
     if OA.lower() == 'over':
@@ -356,31 +268,19 @@ def h2h_last_10_vs_team(playerName, statLine, lineNumber, OA, opp):
     if min_season is None or max_season is None:
         return None  # Player not found
 
-    # Load all seasons in career span
-    all_data = nfl.import_weekly_data(list(range(min_season, max_season + 1)))
-
-    # Filter player's games vs opponent
-    player_games = all_data[
-        (all_data['player_display_name'] == playerName) & 
-        (all_data['opponent_team'] == opp)
-    ]
+    # Filter player's games vs opponent (already oldest to newest)
+    player_games = history_facts().games_vs(playerName, opp).between(min_season, max_season)
 
     if player_games.empty:
         return None
 
-    # Sort by season and week ascending (oldest to newest)
-    player_games = player_games.sort_values(by=['season', 'week'], ascending=True)
-
     # Keep only the last 10 games vs the opponent
     last_10_games = player_games.tail(10)
 
-    display_stat = custom_stats(last_10_games, statLine)
+    display_stat = statLine
 
-    results = []
-    for _, row in last_10_games.iterrows():
-        stat_value = row[display_stat]
-        game_label = f"Wk {row['week']} {row['season']}"  # e.g. "Wk 5 2021"
-        results.append((game_label, stat_value))
+    # e.g. ("Wk 5 2021", value)
+    results = list(zip(last_10_games.labels(), last_10_games.stat_list(display_stat)))
 
     if OA.lower() == 'over':
         count = sum(1 for _, val in results if val > lineNumber)
@@ -398,52 +298,83 @@ def h2h_last_10_vs_team(playerName, statLine, lineNumber, OA, opp):
         'OA': OA.lower()
     }
 
-def plot_vs_team_results(results, line_number, oa, player_name, stat_name, opp_team):
-    labels = [label for label, _ in results]
-    values = [val for _, val in results]
-    indices = np.arange(len(results))
+def plot_vs_team_results(results, line_number, oa, player_name, stat_name, opp_team, high_res=False):
+    spec = vs_team_spec(results, line_number, oa, player_name, stat_name, opp_team)
+    return io.BytesIO(render_bar_chart(high_res=high_res, **spec))
 
-    # Determine bar colors based on Over/Under, using a muted color palette
-    if oa.lower() == 'over':
-        colors = ['#4CAF50' if val > line_number else '#F44336' for val in values]  # Green for over, Red for under
+def _over_under_percentage(results, lineNumber, OA):
+    if OA.lower() == 'over':
+        count = sum(1 for _, val in results if val > lineNumber)
+    elif OA.lower() == 'under':
+        count = sum(1 for _, val in results if val < lineNumber)
     else:
-        colors = ['#4CAF50' if val < line_number else '#F44336' for val in values]  # Green for under, Red for over
-
-    # Create the plot
-    fig, ax = plt.subplots(figsize=(12, 6))
-
-    # Bar plot with clean color scheme
-    bars = ax.bar(indices, values, color=colors, width=0.6, edgecolor='black', linewidth=1.2)
-
-    # Add horizontal line to indicate the threshold
-    ax.axhline(line_number, color='black', linestyle='--', linewidth=2)
-
-    # Add the line number text near the dashed line
-    ax.text(len(results) - 1, line_number + 0.5, f'Line: {line_number}', ha='right', va='bottom', fontsize=12, color='black')
+        raise ValueError("OA must be 'over' or 'under'")
+    return (count / len(results)) * 100 if results else 0
 
-    # Add data labels on top of the bars for exact value display
-    for i, bar in enumerate(bars):
-        height = bar.get_height()
-        ax.text(bar.get_x() + bar.get_width() / 2, height + 0.15, f'{height:.1f}', ha='center', va='bottom', fontsize=10)
+def prop_card(playerName, statLine, lineNumber, OA, opp, season=2024):
+    # Everything !card shows, from one slice of the player's games (through `season`) in the
+    # shared fact table: last 10 games, last 10 vs the opponent, and the over/under prediction
+    from OverUnderPrediction import player_games, predict_over_under
 
-    # Title and labels with modern typography
-    ax.set_title(f"{player_name} vs {opp_team} – {stat_name.title()} by Game", fontsize=16, weight='bold', color='black')
-    ax.set_xlabel("Game Date (Week & Season)", fontsize=14, color='black')
-    ax.set_ylabel(stat_name.title(), fontsize=14, color='black')
+    statLine = statLine.lower().replace(' ', '_')
+    games = player_games(playerName, season)
+    if games is None or games.empty:
+        return None
 
-    # Improve x-tick labels (game dates), rotate for readability
-    ax.set_xticks(indices)
-    ax.set_xticklabels(labels, rotation=45, ha='right', fontsize=12, color='black')
+    last_10 = games.between(2005, season).tail(10)
+    vs_last_10 = games.vs(opp).tail(10)
 
-    # Add a subtle grid for better readability
-    ax.grid(True, axis='y', linestyle='--', alpha=0.4)
+    l10_results = list(zip(last_10.opponents(), last_10.stat_list(statLine)))
+    vs_results = list(zip(vs_last_10.labels(), vs_last_10.stat_list(statLine)))
 
-    # Adjust layout for better spacing and fitting
-    plt.tight_layout()
+    return {
+        'last10': {'results': l10_results, 'percentage': _over_under_percentage(l10_results, lineNumber, OA)},
+        'vs_team': {'results': vs_results, 'percentage': _over_under_percentage(vs_results, lineNumber, OA)},
+        'prediction': predict_over_under(playerName, statLine, lineNumber, opp, season, games),
+        'line': lineNumber,
+        'OA': OA.lower()
+    }
 
-    # Save the plot to a BytesIO stream
-    buf = io.BytesIO()
-    fig.savefig(buf, format='png', dpi=300)
-    plt.close(fig)
-    buf.seek(0)
-    return buf
+def team_stats_message(team, seasons):
+    """Single season: the season summary. Range: combined totals plus a season-by-season trend."""
+    trend = team_trend(seasons, team)
+    if trend.empty:
+        return None
+    label = f"{seasons[0]}" if len(seasons) == 1 else f"{seasons[0]}-{seasons[-1]}"
+
+    pass_rate, rush_rate = calculate_offensive_stats_seasons(seasons, team)
+    off_line_df = calculate_offensive_line_metrics_seasons(seasons)
+    defensive_df = calculate_defensive_stats_seasons(seasons)
+    user_def_row = defensive_df[defensive_df['team'] == team]
+    adjusted_metric, bias_factor = adjusted_rush_defense_metric(team, defensive_df)
+
+    msg = (
+        f"**{team} Stats for {label} Season{'s' if len(seasons) > 1 else ''}:**\n"
+        f"Pass Rate: {pass_rate:.2%}\n"
+        f"Rush Rate: {rush_rate:.2%}\n"
+        f"Offensive Line Metric: {off_line_df.loc[team, 'off_line_metric']:.4f}\n"
+        f"Rush Yards Allowed{' (per season)' if len(seasons) > 1 else ''}: "
+        f"{int(user_def_row['rush_yards_allowed'].values[0])}\n"
+        f"Adjusted Rush Defense Metric: {adjusted_metric:.2f}\n"
+    )
+    if len(seasons) == 1:
+        return msg
+
+    lines = [f"{'Season':<6} {'Pass%':>6} {'OL rk':>5} {'RushYA':>6} {'rk':>3} {'PtsA':>5} {'rk':>3}"]
+    for season, row in trend.iterrows():
+        ol_rank = row.get('off_line_rank')
+        lines.append(
+            f"{season:<6} {row['pass_rate']:>6.1%} {'-' if pd.isna(ol_rank) else int(ol_rank):>5} "
+            f"{int(row['rush_yards_allowed']):>6} {int(row['rush_rank']):>3} "
+            f"{int(row['points_allowed']):>5} {int(row['points_allowed_rank']):>3}"
+        )
+    first, last = trend.iloc[0], trend.iloc[-1]
+    change = (
+        f"Pass rate {first['pass_rate']:.1%} → {last['pass_rate']:.1%}, "
+        f"rush defense rank {int(first['rush_rank'])} → {int(last['rush_rank'])}, "
+        f"points allowed rank {int(first['points_allowed_rank'])} → {int(last['points_allowed_rank'])}"
+    )
+    return msg + "\n**Trend** (ranks within each season)\n```\n" + "\n".join(lines) + "\n```\n" + change
+
+def team_names(season):
+    return sorted(season_team_partials(season)['defense'].index)
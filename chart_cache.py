@@ -0,0 +1,127 @@
+# chart_cache.py
+#
+# Content-addressed disk cache for rendered chart images. The key is a hash of
+# everything that determines the pixels (chart data, labels, line, style version,
+# dpi, format), so a repeated !last10 / !h2h for the same prop re-uploads the stored
+# bytes without touching matplotlib. Bounded by size; least-recently-used files go first.
+
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, Optional
+
+from data_store import STORE_DIR
+
+CHART_CACHE_DIR = os.getenv("NFL_CHART_CACHE", os.path.join(STORE_DIR, "charts"))
+CHART_CACHE_MB = float(os.getenv("CHART_CACHE_MB", "256"))
+
+
+def chart_key(spec: dict, **style) -> str:
+    """Stable hash of a chart spec plus rendering parameters (dpi, format, style version)."""
+    payload = json.dumps({"spec": spec, "style": style}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ChartCache:
+    def __init__(self, root: str = CHART_CACHE_DIR, max_bytes: int = int(CHART_CACHE_MB * 1024 * 1024)):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._sizes: Optional[Dict[str, int]] = None   # path -> bytes, scanned on first use
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.render_seconds = 0.0      # total time spent rendering misses
+        self.saved_seconds = 0.0       # hits x average render time at the time of the hit
+
+    def _path(self, key: str, ext: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.{ext}")
+
+    def _scan(self) -> Dict[str, int]:
+        if self._sizes is None:
+            sizes = {}
+            for dirpath, _, names in os.walk(self.root):
+                for name in names:
+                    if not name.endswith(".tmp"):
+                        path = os.path.join(dirpath, name)
+                        sizes[path] = os.path.getsize(path)
+            self._sizes = sizes
+        return self._sizes
+
+    def _average_render(self) -> float:
+        return self.render_seconds / self.misses if self.misses else 0.0
+
+    def get(self, key: str, ext: str) -> Optional[bytes]:
+        path = self._path(key, ext)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # mtime = last use, for LRU eviction
+        except OSError:
+            return None
+        with self._lock:
+            self.hits += 1
+            self.saved_seconds += self._average_render()
+        return data
+
+    def put(self, key: str, ext: str, data: bytes, render_seconds: float) -> None:
+        """Store a rendered image; best-effort, the caller already has the bytes to send."""
+        path = self._path(key, ext)
+        tmp = path + ".tmp"
+        with self._lock:
+            self.misses += 1
+            self.render_seconds += render_seconds
+        try:
+            with self._lock:
+                sizes = self._scan()
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"Chart cache write failed: {e}")
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            return
+        with self._lock:
+            sizes[path] = len(data)
+            self._evict(keep=path)
+
+    def _evict(self, keep: str) -> None:
+        sizes = self._sizes
+        total = sum(sizes.values())
+        if total <= self.max_bytes:
+            return
+        by_age = sorted(sizes, key=lambda p: os.path.getmtime(p) if os.path.exists(p) else 0)
+        for path in by_age:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= sizes.pop(path)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "files": len(self._sizes) if self._sizes is not None else None,
+                "bytes": sum(self._sizes.values()) if self._sizes is not None else None,
+                "max_bytes": self.max_bytes,
+                "evictions": self.evictions,
+                "avg_render_seconds": round(self._average_render(), 4),
+                "saved_seconds": round(self.saved_seconds, 2),
+            }
+
+
+chart_cache = ChartCache()
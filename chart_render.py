@@ -0,0 +1,340 @@
+# chart_render.py
+#
+# Bar-chart and prop-card rendering for the L10 / H2H / card commands, off the event loop.
+#
+# Charts are drawn in a small pool of worker processes. Each worker keeps pre-built
+# figure templates (one per bar count) and only updates bar heights, colors, labels
+# and the line on each request, instead of building a figure and running
+# tight_layout every time. Output defaults to a Discord-sized image (1200x600) quantized
+# to a small palette, which is a fraction of the old 300-dpi RGBA PNG; high-res is opt-in.
+
+import asyncio
+import io
+import math
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from chart_cache import chart_cache, chart_key
+from metrics import note_cache, stage
+
+# 12x6 in at 100 dpi = 1200x600, about what Discord shows inline; HIGH_RES_DPI when asked for
+DEFAULT_DPI = 100
+HIGH_RES_DPI = 200
+FIGSIZE = (12, 6)
+CARD_FIGSIZE = (14, 8)
+
+# "png" (palette-quantized) or "webp"
+CHART_FORMAT = os.getenv("CHART_FORMAT", "png").lower()
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", "2"))
+
+# Bump when the template's look changes so cached images from the old style aren't reused
+STYLE_VERSION = 1
+
+OVER_COLOR = "#4CAF50"
+UNDER_COLOR = "#F44336"
+
+
+def bar_colors(values: Sequence[float], line_number: float, oa: str) -> List[str]:
+    """Green when the game hit the side of the line that was picked, red otherwise."""
+    if oa.lower() == "over":
+        return [OVER_COLOR if val > line_number else UNDER_COLOR for val in values]
+    return [OVER_COLOR if val < line_number else UNDER_COLOR for val in values]
+
+
+# ---------- Templates (one set per process)
+
+def _agg_figure(figsize):
+    import matplotlib
+    matplotlib.use("Agg")  # headless server backend
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+class _BarPanel:
+    """`n` bars, the line and the text artists on one axes, created once and updated per chart."""
+
+    def __init__(self, ax, n: int, title_size: int = 16, label_size: int = 14):
+        self.ax, self.n = ax, n
+        self.title_size, self.label_size = title_size, label_size
+        indices = list(range(n))
+        self.bars = ax.bar(indices, [0] * n, width=0.6, edgecolor="black", linewidth=1.2)
+        self.line = ax.axhline(0, color="black", linestyle="--", linewidth=2)
+        self.line_text = ax.text(0, 0, "", ha="right", va="bottom", fontsize=12, color="black")
+        self.value_texts = [ax.text(i, 0, "", ha="center", va="bottom", fontsize=10) for i in indices]
+        self.empty_text = ax.text(0.5, 0.5, "", transform=ax.transAxes, ha="center", va="center", fontsize=14)
+        ax.set_xticks(indices)
+        ax.grid(True, axis="y", linestyle="--", alpha=0.4)
+        ax.set_xlim(-0.6, max(n, 1) - 0.4)
+
+    def draw(self, labels, values, line_number, oa, title, xlabel, ylabel, line_label_x, empty_message=""):
+        ax = self.ax
+        for bar, text, value, color in zip(self.bars, self.value_texts, values,
+                                           bar_colors(values, line_number, oa)):
+            # Ratio stats (racr, wopr, ...) are NaN when undefined: empty bar labelled n/a
+            known = math.isfinite(value)
+            bar.set_height(value if known else 0)
+            bar.set_facecolor(color)
+            text.set_y((value if known else 0) + 0.15)
+            text.set_text(f"{value:.1f}" if known else "n/a")
+        self.empty_text.set_text(empty_message if not values else "")
+
+        self.line.set_ydata([line_number, line_number])
+        self.line_text.set_position((line_label_x, line_number + 0.5))
+        self.line_text.set_text(f"Line: {line_number}")
+
+        finite = [v for v in values if math.isfinite(v)]
+        top = max(max(finite, default=0), line_number)
+        bottom = min(min(finite, default=0), 0)
+        ax.set_ylim(bottom * 1.1, top * 1.12 + 1)
+
+        ax.set_title(title, fontsize=self.title_size, weight="bold", color="black")
+        ax.set_xlabel(xlabel, fontsize=self.label_size, color="black")
+        ax.set_ylabel(ylabel, fontsize=self.label_size, color="black")
+        ax.set_xticklabels(labels, rotation=45, ha="right", fontsize=12, color="black")
+
+
+class _Template:
+    """Single bar chart (L10 / H2H)."""
+
+    def __init__(self, n: int):
+        self.fig = _agg_figure(FIGSIZE)
+        # Fixed margins instead of tight_layout per render (room for 45° tick labels)
+        self.fig.subplots_adjust(left=0.07, right=0.98, top=0.91, bottom=0.2)
+        self.panel = _BarPanel(self.fig.add_subplot(), n)
+
+    def draw(self, *args):
+        self.panel.draw(*args)
+
+
+class _CardTemplate:
+    """Prop card: last-10 and vs-opponent bar panels on the left, prediction summary on the right."""
+
+    def __init__(self, n_last: int, n_vs: int):
+        self.fig = _agg_figure(CARD_FIGSIZE)
+        grid = self.fig.add_gridspec(2, 3, left=0.06, right=0.98, top=0.9, bottom=0.12,
+                                     hspace=0.75, wspace=0.3)
+        self.last10 = _BarPanel(self.fig.add_subplot(grid[0, :2]), n_last, title_size=13, label_size=11)
+        self.vs_team = _BarPanel(self.fig.add_subplot(grid[1, :2]), n_vs, title_size=13, label_size=11)
+        summary_ax = self.fig.add_subplot(grid[:, 2])
+        summary_ax.axis("off")
+        self.heading = self.fig.suptitle("", fontsize=17, weight="bold")
+        self.decision = summary_ax.text(0.0, 0.97, "", fontsize=22, weight="bold", va="top")
+        self.summary = summary_ax.text(0.0, 0.82, "", fontsize=11, va="top", family="monospace")
+
+    def draw(self, player_name, stat_name, line_number, oa, opp_team, last10, vs_team, prediction):
+        self.heading.set_text(f"{player_name} – {stat_name.title()} {oa.title()} {line_number} vs {opp_team}")
+        self.last10.draw(
+            [opp for opp, _ in last10["results"]], [float(v) for _, v in last10["results"]],
+            line_number, oa, f"Last 10: {oa} {last10['percentage']:.0f}%", "Opponent",
+            stat_name.title(), len(last10["results"]) - 0.5, "No recent games",
+        )
+        self.vs_team.draw(
+            [label for label, _ in vs_team["results"]], [float(v) for _, v in vs_team["results"]],
+            line_number, oa, f"Last {len(vs_team['results'])} vs {opp_team}: {oa} {vs_team['percentage']:.0f}%",
+            "Game (Week & Season)", stat_name.title(), len(vs_team["results"]) - 1, f"No games vs {opp_team}",
+        )
+        self.decision.set_text(prediction["decision"])
+        self.decision.set_color(OVER_COLOR if prediction["decision"] == "OVER" else UNDER_COLOR)
+        lines = [f"OVER  {prediction['over_probability']:.1%}",
+                 f"UNDER {prediction['under_probability']:.1%}",
+                 "", "Top factors (pp):"]
+        lines += [f"{name[:18]:18s} {pp:+6.2f}" for name, pp in prediction["top_factors"]]
+        self.summary.set_text("\n".join(lines))
+
+
+_templates: Dict[tuple, object] = {}
+_templates_lock = threading.Lock()
+
+
+def _encode(fig, dpi: int, fmt: str) -> bytes:
+    from PIL import Image
+
+    fig.set_dpi(dpi)
+    fig.canvas.draw()
+    width, height = fig.canvas.get_width_height()
+    image = Image.frombuffer("RGBA", (width, height), fig.canvas.buffer_rgba(), "raw", "RGBA", 0, 1)
+    buf = io.BytesIO()
+    if fmt == "webp":
+        image.convert("RGB").save(buf, format="WEBP", quality=85, method=4)
+    else:
+        # Flat colors + anti-aliased text: a 64-color palette is visually identical and ~10x smaller
+        image.convert("RGB").quantize(colors=64).save(buf, format="PNG", optimize=True)
+    return buf.getvalue()
+
+
+def render_bar_chart(labels: Sequence[str], values: Sequence[float], line_number: float, oa: str,
+                     title: str, xlabel: str, ylabel: str, line_label_x: Optional[float] = None,
+                     high_res: bool = False, fmt: str = CHART_FORMAT) -> bytes:
+    """Render one over/under bar chart in this process and return the encoded image."""
+    values = [float(v) for v in values]
+    n = len(values)
+    if line_label_x is None:
+        line_label_x = n - 0.5
+    with _templates_lock:
+        template = _templates.get(("bars", n))
+        if template is None:
+            template = _templates[("bars", n)] = _Template(n)
+        template.draw(list(labels), values, line_number, oa, title, xlabel, ylabel, line_label_x)
+        return _encode(template.fig, HIGH_RES_DPI if high_res else DEFAULT_DPI, fmt)
+
+
+def render_card(player_name: str, stat_name: str, line_number: float, oa: str, opp_team: str,
+                last10: dict, vs_team: dict, prediction: dict,
+                high_res: bool = False, fmt: str = CHART_FORMAT) -> bytes:
+    """Render a prop card (see card_spec) in this process and return the encoded image."""
+    key = ("card", len(last10["results"]), len(vs_team["results"]))
+    with _templates_lock:
+        template = _templates.get(key)
+        if template is None:
+            template = _templates[key] = _CardTemplate(key[1], key[2])
+        template.draw(player_name, stat_name, line_number, oa, opp_team, last10, vs_team, prediction)
+        return _encode(template.fig, HIGH_RES_DPI if high_res else DEFAULT_DPI, fmt)
+
+
+# ---------- Chart specs (shared by the pool and the in-process helpers in bot_mehtods)
+
+def last10_spec(results, line_number, oa, player_name, stat_name) -> dict:
+    return dict(
+        labels=[opp for opp, _ in results],
+        values=[val for _, val in results],
+        line_number=line_number,
+        oa=oa,
+        title=f"{player_name} - Last 10 Games ({stat_name.title()})",
+        xlabel="Opponent",
+        ylabel=stat_name.title(),
+        line_label_x=len(results) - 0.5,
+    )
+
+
+def vs_team_spec(results, line_number, oa, player_name, stat_name, opp_team) -> dict:
+    return dict(
+        labels=[label for label, _ in results],
+        values=[val for _, val in results],
+        line_number=line_number,
+        oa=oa,
+        title=f"{player_name} vs {opp_team} – {stat_name.title()} by Game",
+        xlabel="Game Date (Week & Season)",
+        ylabel=stat_name.title(),
+        line_label_x=len(results) - 1,
+    )
+
+
+def card_spec(card, player_name, stat_name, opp_team, top_n=6) -> dict:
+    """Spec for a prop card from bot_mehtods.prop_card output (plain data, so it pickles to the workers)."""
+    prediction = card["prediction"]
+    top = sorted(prediction.contributions.items(), key=lambda kv: abs(kv[1]), reverse=True)[:top_n]
+    return dict(
+        kind="card",
+        player_name=player_name,
+        stat_name=stat_name,
+        line_number=card["line"],
+        oa=card["OA"],
+        opp_team=opp_team,
+        last10=card["last10"],
+        vs_team=card["vs_team"],
+        prediction={
+            "decision": prediction.decision,
+            "over_probability": prediction.over_probability,
+            "under_probability": prediction.under_probability,
+            "top_factors": top,
+        },
+    )
+
+
+def chart_filename(name: str, fmt: str = CHART_FORMAT) -> str:
+    return f"{name}.{'webp' if fmt == 'webp' else 'png'}"
+
+
+# ---------- Worker pool
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _warm_worker() -> None:
+    # Import matplotlib / Pillow and build the common 10-bar template before the first request
+    _templates[("bars", 10)] = _Template(10)
+    import PIL.Image  # noqa: F401
+
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    global _pool
+    if RENDER_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            import multiprocessing
+            # spawn: the bot process runs threads (warm-up, discord), which fork doesn't copy safely
+            _pool = ProcessPoolExecutor(max_workers=RENDER_WORKERS,
+                                        mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=_warm_worker)
+        return _pool
+
+
+def _ping() -> None:
+    pass
+
+
+def start_render_pool() -> None:
+    """Start the workers (and their template warm-up) ahead of the first chart."""
+    pool = _get_pool()
+    if pool is not None:
+        for _ in range(RENDER_WORKERS):  # workers are spawned on demand; submit so they start now
+            pool.submit(_ping)
+
+
+def shutdown_render_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+async def render_chart(spec: dict, high_res: bool = False, fmt: str = CHART_FORMAT) -> Tuple[bytes, str]:
+    """
+    Render `spec` (last10_spec / vs_team_spec / card_spec) in the worker pool. Returns (image bytes, extension).
+    Identical charts are served from the disk cache; falls back to a thread in this
+    process if the pool is disabled or a worker died.
+    """
+    ext = "webp" if fmt == "webp" else "png"
+    dpi = HIGH_RES_DPI if high_res else DEFAULT_DPI
+    key = chart_key(spec, dpi=dpi, fmt=ext, style=STYLE_VERSION)
+    with stage("render"):
+        cached = await asyncio.to_thread(chart_cache.get, key, ext)
+        note_cache(cached is not None)
+        if cached is not None:
+            return cached, ext
+
+        start = time.perf_counter()
+        data = await _render_off_loop(spec, high_res, fmt)
+    await asyncio.to_thread(chart_cache.put, key, ext, data, time.perf_counter() - start)
+    return data, ext
+
+
+async def _render_off_loop(spec: dict, high_res: bool, fmt: str) -> bytes:
+    global _pool
+    pool = _get_pool()
+    if pool is not None:
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(pool, _render_spec, spec, high_res, fmt)
+        except BrokenProcessPool:
+            with _pool_lock:
+                _pool = None  # recreated on the next chart
+    return await asyncio.to_thread(_render_spec, spec, high_res, fmt)
+
+
+def _render_spec(spec: dict, high_res: bool, fmt: str) -> bytes:
+    spec = dict(spec)
+    if spec.pop("kind", "bars") == "card":
+        return render_card(high_res=high_res, fmt=fmt, **spec)
+    return render_bar_chart(high_res=high_res, fmt=fmt, **spec)
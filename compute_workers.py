@@ -0,0 +1,444 @@
+# compute_workers.py
+#
+# Split between the Discord front end and the compute. With BOT_COMPUTE_WORKERS=N the
+# bot process only holds the gateway connection, parses commands and renders charts;
+# every stat lookup / prediction is forwarded as a normalized request (operation name +
+# arguments) over a local queue to N worker processes. Workers restore the season from
+# its snapshot: play-by-play is reopened from the memory-mapped local store and the fact
+# arrays are memory-mapped from the bundle, so they share those pages through the page
+# cache instead of each holding a copy (team tables and rosters are small private copies).
+#
+# A worker whose warm-up fails reports it and exits; it is respawned with a growing
+# delay, and while no worker is warm the front end runs operations in-process instead.
+#
+# Each worker has its own request queue, and the front end tracks which requests it sent
+# to which worker. Workers can be restarted (!workers restart) without touching the
+# gateway: replacements warm up first, then the old workers drain their queue and exit.
+# A worker that dies fails the requests sent to it (and only those) and is replaced.
+# broadcast() runs an operation once in every worker, e.g. to apply a data sync.
+#
+# With BOT_COMPUTE_WORKERS=0 (the default) operations run in-process on a thread.
+#
+# Either way, results of the operations listed in result_cache.RESULT_TTLS are looked up
+# in (and stored to) the shared SQLite result cache first, so any process's work serves all.
+#
+# Requests made inside a trace are traced in the worker too; its spans come back with the
+# result and are attached under the caller's compute span (see tracing.py). Requests made
+# inside a profile session (!profile) skip the result cache and run under the profiler,
+# which reports back the same way (see profiling.py).
+
+import asyncio
+import importlib
+import itertools
+import multiprocessing as mp
+import os
+import pickle
+import queue
+import threading
+import time
+from contextlib import nullcontext
+from dataclasses import is_dataclass, replace
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from metrics import note_cache, stage
+from profiling import current_session, run_profiled
+from result_cache import RESULT_TTLS, data_versions, result_cache, result_key, seasons_read
+from season_context import CURRENT_SEASON
+from tracing import adopt, collect, current_trace, span
+
+COMPUTE_WORKERS = int(os.getenv("BOT_COMPUTE_WORKERS", "0"))
+
+# Operation name -> (module, function). Arguments and results must pickle.
+OPS: Dict[str, Tuple[str, str]] = {
+    "last10": ("bot_mehtods", "L10"),
+    "h2h": ("bot_mehtods", "h2h"),
+    "h2h_last_10": ("bot_mehtods", "h2h_last_10_vs_team"),
+    "prop_card": ("bot_mehtods", "prop_card"),
+    "team_stats": ("bot_mehtods", "team_stats_message"),
+    "team_names": ("bot_mehtods", "team_names"),
+    "predict_over_under": ("OverUnderPrediction", "predict_over_under"),
+    "predict_stat": ("prediction", "predict_stat"),
+    "apply_sync": ("ingest", "apply_changes"),   # broadcast after a data sync
+}
+
+# Seconds between worker liveness checks
+MONITOR_INTERVAL = 1.0
+
+# Longest delay before respawning after failed warm-ups (doubles per consecutive failure)
+MAX_RESPAWN_DELAY = 60.0
+
+_MISSING = object()
+
+
+class WorkerDied(RuntimeError):
+    """The worker running a request exited before answering."""
+
+
+def _resolve(op: str):
+    module, name = OPS[op]
+    return getattr(importlib.import_module(module), name)
+
+
+def _profile_label(op: str, args: tuple, kwargs: dict, where: str) -> str:
+    call = ", ".join([repr(a) for a in args] + [f"{k}={v!r}" for k, v in kwargs.items()])
+    return f"{op}({call[:200]}) [{where}]"
+
+
+# ---------- Worker process
+
+def _worker_main(index: int, requests, results, stop, current, served, season: int) -> None:
+    from season_context import _restore_or_build
+
+    start = time.perf_counter()
+    try:
+        _restore_or_build(season)
+    except Exception as e:  # a cold worker would download on the request path: report and exit
+        results.put(("failed", index, (os.getpid(), f"{e.__class__.__name__}: {e}")))
+        return
+    results.put(("ready", index, (os.getpid(), round(time.perf_counter() - start, 2))))
+
+    while True:
+        try:
+            request_id, op, args, kwargs, options = requests.get(timeout=0.5)
+        except queue.Empty:
+            # Retired: nothing is sent to this worker any more, so an empty queue means done
+            if stop.is_set():
+                break
+            continue
+        current.value = request_id
+        try:
+            # Pickle here so an unpicklable result fails this request, not the queue's feeder thread
+            with collect(f"worker {op}", worker=index) if options["trace"] else nullcontext([]) as spans:
+                if options["profile"]:
+                    value, report = run_profiled(options["profile"], _resolve(op), *args, **kwargs)
+                else:
+                    value, report = _resolve(op)(*args, **kwargs), None
+                payload = pickle.dumps(value)
+            results.put(("ok", request_id, (payload, spans, report)))
+        except Exception as e:
+            try:
+                error = pickle.dumps(e)
+            except Exception:
+                error = None
+            results.put(("error", request_id, (error, f"{e.__class__.__name__}: {e}")))
+        finally:
+            current.value = 0
+            served.value += 1
+
+
+# ---------- Front end
+
+class _Worker:
+    def __init__(self, index: int, process, requests, stop, current, served):
+        self.index = index
+        self.process = process
+        self.requests = requests  # this worker's own queue
+        self.stop = stop
+        self.current = current    # id of the request being run (0 when idle)
+        self.served = served
+        self.in_flight: Set[int] = set()   # ids sent to this worker and not answered yet
+        self.ready = False
+        self.warm_seconds: Optional[float] = None
+        self.warm_error: Optional[str] = None
+        self.retiring = False
+
+
+class ComputeClient:
+    def __init__(self, workers: int = COMPUTE_WORKERS):
+        self.size = workers
+        self._ctx = mp.get_context("spawn")
+        self._results = None
+        self._season: Optional[int] = None
+        self._workers: Dict[int, _Worker] = {}
+        self._indexes = itertools.count()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        # request id -> (future, loop, worker index)
+        self._pending: Dict[int, Tuple[asyncio.Future, asyncio.AbstractEventLoop, int]] = {}
+        self._monitor: Optional[threading.Thread] = None
+        self.calls = 0
+        self.failures = 0
+        self.respawns = 0
+        self.restarts = 0
+        self.warm_failures = 0             # consecutive failed warm-ups
+        self._owed = 0                     # respawns waiting out the delay
+        self._respawn_at = 0.0
+
+    @property
+    def started(self) -> bool:
+        return self._monitor is not None
+
+    def is_ready(self) -> bool:
+        """True when requests can be served: in-process, or at least one worker has warmed up."""
+        if not self.started:
+            return True
+        with self._lock:
+            return any(w.ready and not w.retiring for w in self._workers.values())
+
+    def start(self, season: int) -> None:
+        """Spawn the workers (no-op when in-process or already started)."""
+        if self.size <= 0 or self.started:
+            return
+        self._season = season
+        self._results = self._ctx.Queue()
+        with self._lock:
+            for _ in range(self.size):
+                self._spawn()
+        self._monitor = threading.Thread(target=self._monitor_loop, name="compute-monitor", daemon=True)
+        self._monitor.start()
+
+    def _spawn(self) -> _Worker:
+        index = next(self._indexes)
+        requests = self._ctx.Queue()
+        stop = self._ctx.Event()
+        current = self._ctx.Value("q", 0, lock=False)
+        served = self._ctx.Value("q", 0, lock=False)
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(index, requests, self._results, stop, current, served, self._season),
+            name=f"compute-{index}", daemon=True)
+        process.start()
+        worker = self._workers[index] = _Worker(index, process, requests, stop, current, served)
+        return worker
+
+    def _pick(self) -> _Worker:
+        """Least-loaded live worker, preferring warm ones (caller holds the lock)."""
+        candidates = [w for w in self._workers.values() if not w.retiring]
+        return min(candidates, key=lambda w: (not w.ready, len(w.in_flight), w.index))
+
+    def restart(self) -> None:
+        """Rolling restart: spawn a fresh set, then retire the current workers once idle."""
+        if not self.started:
+            return
+        with self._lock:
+            old = [w for w in self._workers.values() if not w.retiring]
+            for _ in range(self.size):
+                self._spawn()
+            for worker in old:
+                worker.retiring = True
+            self.restarts += 1
+
+    # ---------- Results (monitor thread)
+
+    def _forget(self, request_id: int):
+        """Drop a request from the pending table and its worker's in-flight set (caller holds the lock)."""
+        entry = self._pending.pop(request_id, None)
+        if entry is not None:
+            worker = self._workers.get(entry[2])
+            if worker is not None:
+                worker.in_flight.discard(request_id)
+        return entry
+
+    def _settle(self, request_id: int, ok: bool, value: Any) -> None:
+        with self._lock:
+            entry = self._forget(request_id)
+        if entry is None:  # caller gave up (cancelled / timed out)
+            return
+        future, loop, _ = entry
+
+        def apply():
+            if future.done():
+                return
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+        loop.call_soon_threadsafe(apply)
+
+    def _handle(self, kind: str, key: int, value: Any) -> None:
+        if kind == "ready":
+            with self._lock:
+                worker = self._workers.get(key)
+                if worker is not None:
+                    worker.ready = True
+                    worker.warm_seconds = value[1]
+                    # Once the replacements are warm, retiring workers drain their queue and exit
+                    current = [w for w in self._workers.values() if not w.retiring]
+                    if all(w.ready for w in current):
+                        for other in self._workers.values():
+                            if other.retiring:
+                                other.stop.set()
+                self.warm_failures = 0
+            print(f"Compute worker {key} ready (pid {value[0]}, warm-up {value[1]}s)")
+        elif kind == "failed":
+            with self._lock:
+                worker = self._workers.get(key)
+                if worker is not None:
+                    worker.warm_error = value[1]
+                self.warm_failures += 1
+            print(f"Compute worker {key} warm-up failed (pid {value[0]}): {value[1]}")
+        elif kind == "ok":
+            payload, spans, report = value
+            self._settle(key, True, (pickle.loads(payload), spans, report))
+        elif kind == "error":
+            error, text = value
+            exc = None
+            if error is not None:
+                try:
+                    exc = pickle.loads(error)
+                except Exception:
+                    pass
+            with self._lock:
+                self.failures += 1
+            self._settle(key, False, exc if isinstance(exc, Exception) else RuntimeError(text))
+
+    def _reap(self) -> None:
+        """Replace workers that died and fail the requests they were running; drop retired ones."""
+        lost: List[Tuple[int, int]] = []
+        with self._lock:
+            for index, worker in list(self._workers.items()):
+                if worker.process.is_alive():
+                    continue
+                del self._workers[index]
+                # Everything sent to it is lost: the one it was running and any still queued
+                lost.extend((rid, index) for rid in worker.in_flight)
+                worker.requests.cancel_join_thread()
+                worker.requests.close()
+                if worker.retiring and not worker.in_flight:
+                    continue
+                print(f"Compute worker {index} exited (code {worker.process.exitcode})"
+                      + (f" with {len(worker.in_flight)} request(s) in flight" if worker.in_flight else "")
+                      + ("" if worker.retiring else "; respawning"))
+                if worker.retiring:
+                    continue
+                self.respawns += 1
+                if worker.ready:
+                    self._spawn()
+                else:  # died warming up; failing again right away would just spin: back off
+                    if worker.warm_error is None:  # crashed without reporting
+                        self.warm_failures += 1
+                    self._owed += 1
+                    delay = min(MAX_RESPAWN_DELAY, 2.0 ** self.warm_failures)
+                    self._respawn_at = time.monotonic() + delay
+            if self._owed and time.monotonic() >= self._respawn_at:
+                for _ in range(self._owed):
+                    self._spawn()
+                self._owed = 0
+        for rid, index in lost:
+            self._settle(rid, False, WorkerDied(f"compute worker {index} exited"))
+
+    def _monitor_loop(self) -> None:
+        last_check = time.monotonic()
+        while True:
+            try:
+                kind, key, value = self._results.get(timeout=MONITOR_INTERVAL)
+                self._handle(kind, key, value)
+            except queue.Empty:
+                pass
+            except Exception as e:
+                print(f"Compute monitor: {e.__class__.__name__}: {e}")
+            if time.monotonic() - last_check >= MONITOR_INTERVAL:
+                last_check = time.monotonic()
+                self._reap()
+
+    # ---------- Calls (event loop)
+
+    async def call(self, op: str, *args, **kwargs) -> Any:
+        """Result of operation `op`: from the shared result cache, else computed by `_run`."""
+        self.calls += 1
+        # A profiled call has to do the work, so it bypasses the cache
+        ttl = RESULT_TTLS.get(op) if current_session() is None else None
+        if ttl is None:
+            with stage("compute"):
+                return await self._run(op, *args, **kwargs)
+
+        def lookup():
+            with span("result_cache"):
+                key = result_key(op, args, kwargs, data_versions(seasons_read(op, args, kwargs, CURRENT_SEASON)))
+                return key, result_cache.get(key, _MISSING)
+
+        with stage("compute"):
+            key, value = await asyncio.to_thread(lookup)
+            note_cache(value is not _MISSING)
+            if value is not _MISSING:
+                # e.g. a PredictionResult: its timings belong to the run that was cached
+                if is_dataclass(value) and hasattr(value, "from_cache"):
+                    value = replace(value, from_cache=True)
+                return value
+            value = await self._run(op, *args, **kwargs)
+        # Store in the background; the caller doesn't wait on the write
+        asyncio.get_running_loop().run_in_executor(None, result_cache.put, key, op, value, ttl)
+        return value
+
+    async def broadcast(self, op: str, *args, **kwargs) -> List[Any]:
+        """
+        Run `op` once in every live worker (e.g. apply_sync); one result or exception per
+        worker. In-process there are no workers: the caller's own process is the compute.
+        """
+        if not self.started:
+            return []
+        if op not in OPS:
+            raise KeyError(f"unknown compute operation {op!r}")
+        with self._lock:
+            workers = [w for w in self._workers.values() if not w.retiring]
+        return await asyncio.gather(*(self._send(w, op, args, kwargs, None) for w in workers),
+                                    return_exceptions=True)
+
+    def _fall_back(self) -> bool:
+        """True when warm-ups have failed and no worker is warm: compute in-process meanwhile."""
+        with self._lock:
+            return self.warm_failures > 0 and not any(w.ready and not w.retiring for w in self._workers.values())
+
+    async def _run(self, op: str, *args, **kwargs) -> Any:
+        """Run operation `op` on a worker (or a thread when in-process) and return its result."""
+        session = current_session()
+        if not self.started or self._fall_back():
+            if session is None:
+                return await asyncio.to_thread(_resolve(op), *args, **kwargs)
+            value, report = await asyncio.to_thread(run_profiled, session.mode, _resolve(op), *args, **kwargs)
+            session.record(_profile_label(op, args, kwargs, "in-process"), report)
+            return value
+        if op not in OPS:
+            raise KeyError(f"unknown compute operation {op!r}")
+        return await self._send(None, op, args, kwargs, session)
+
+    async def _send(self, worker: Optional[_Worker], op: str, args: tuple, kwargs: dict, session) -> Any:
+        """Send a request to `worker` (default: the least loaded) and await its result."""
+        future = asyncio.get_running_loop().create_future()
+        request_id = next(self._ids)
+        with self._lock:
+            if worker is None:
+                worker = self._pick()
+            elif self._workers.get(worker.index) is not worker:
+                raise WorkerDied(f"compute worker {worker.index} exited")
+            worker.in_flight.add(request_id)
+            self._pending[request_id] = (future, asyncio.get_running_loop(), worker.index)
+        options = {"trace": current_trace() is not None, "profile": session.mode if session else None}
+        # If the worker dies before reading this, _reap fails the request (it is in worker.in_flight)
+        try:
+            worker.requests.put((request_id, op, args, kwargs, options))
+        except ValueError:  # already reaped and its queue closed; the future holds WorkerDied
+            pass
+        try:
+            value, spans, report = await future
+            adopt(spans)
+            if session is not None and report is not None:
+                session.record(_profile_label(op, args, kwargs, "worker"), report)
+            return value
+        finally:
+            with self._lock:
+                self._forget(request_id)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            workers = [
+                {"index": w.index, "pid": w.process.pid, "alive": w.process.is_alive(), "ready": w.ready,
+                 "retiring": w.retiring, "busy": w.current.value != 0, "in_flight": len(w.in_flight),
+                 "served": w.served.value, "warm_seconds": w.warm_seconds, "warm_error": w.warm_error}
+                for w in self._workers.values()
+            ]
+            in_flight = len(self._pending)
+        return {
+            "mode": "processes" if self.started else "in-process",
+            "size": self.size,
+            "workers": workers,
+            "in_flight": in_flight,
+            "calls": self.calls,
+            "failures": self.failures,
+            "respawns": self.respawns,
+            "restarts": self.restarts,
+            "warm_failures": self.warm_failures,
+        }
+
+
+compute = ComputeClient()
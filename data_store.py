@@ -0,0 +1,161 @@
+# data_store.py
+
+import json
+import os
+import time
+from typing import List, Optional
+
+import pandas as pd
+
+from tracing import span
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # store disabled; callers fall back to downloading
+    pa = None
+    feather = None
+
+# Root of the local store (shared by every bot / worker process on the box)
+STORE_DIR = os.getenv("NFL_DATA_STORE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+
+
+def store_available() -> bool:
+    return pa is not None
+
+
+def _normalize_schema(table: "pa.Table") -> "pa.Table":
+    """
+    Give every week file the same schema: pandas picks categorical code widths and integer
+    downcasts per frame, so a single appended week would otherwise differ from the season.
+    """
+    fields = []
+    for field in table.schema:
+        t = field.type
+        if pa.types.is_dictionary(t):
+            value_type = pa.string() if pa.types.is_null(t.value_type) else t.value_type
+            t = pa.dictionary(pa.int32(), value_type)
+        elif pa.types.is_signed_integer(t):
+            t = pa.int32()
+        elif pa.types.is_floating(t):
+            t = pa.float32()
+        fields.append(pa.field(field.name, t))
+    return table.cast(pa.schema(fields))
+
+
+def to_store_table(df: pd.DataFrame) -> "pa.Table":
+    """A frame as it is written to a week file."""
+    return _normalize_schema(pa.Table.from_pandas(df, preserve_index=False))
+
+
+def content_hash(table: "pa.Table") -> int:
+    """Hash of a week's values as stored; compare with to_store_table() of fresh rows."""
+    return int(pd.util.hash_pandas_object(table.to_pandas(), index=False).sum())
+
+
+class SeasonStore:
+    """
+    Local Arrow IPC (Feather v2) store laid out as <root>/<dataset>/<season>/week_XX.arrow.
+
+    Files are written uncompressed and opened memory-mapped, so every process reading
+    a season maps the same OS page-cache pages instead of holding its own copy.
+    One file per week lets new weeks be appended without rewriting the season. A
+    manifest listing the weeks is written last, so a season whose download was cut off
+    part-way doesn't count as stored.
+    """
+
+    def __init__(self, dataset: str, root: str = STORE_DIR):
+        self.dataset = dataset
+        self.root = os.path.join(root, dataset)
+
+    def season_dir(self, season: int) -> str:
+        return os.path.join(self.root, str(season))
+
+    def _week_path(self, season: int, week: int) -> str:
+        return os.path.join(self.season_dir(season), f"week_{int(week):02d}.arrow")
+
+    def _manifest_path(self, season: int) -> str:
+        return os.path.join(self.season_dir(season), "manifest.json")
+
+    def weeks(self, season: int) -> List[int]:
+        """Weeks already stored for a season (sorted)."""
+        path = self.season_dir(season)
+        if not os.path.isdir(path):
+            return []
+        weeks = []
+        for name in os.listdir(path):
+            if name.startswith("week_") and name.endswith(".arrow"):
+                weeks.append(int(name[5:-6]))
+        return sorted(weeks)
+
+    def last_written(self, season: int) -> Optional[float]:
+        """Time (epoch seconds) the newest week file of a season was written, None if none are stored."""
+        times = [os.path.getmtime(self._week_path(season, week)) for week in self.weeks(season)]
+        return max(times) if times else None
+
+    def version(self, season: int) -> Optional[float]:
+        """When the season's last write finished (from its manifest); None if it isn't stored."""
+        try:
+            with open(self._manifest_path(season), encoding="utf-8") as f:
+                return json.load(f)["written"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def has_season(self, season: int) -> bool:
+        """True once a write of the season has completed (its manifest exists) and its weeks are all present."""
+        try:
+            with open(self._manifest_path(season), encoding="utf-8") as f:
+                listed = json.load(f)["weeks"]
+        except (OSError, ValueError, KeyError):
+            return False
+        return bool(listed) and set(listed) <= set(self.weeks(season))
+
+    def write_weeks(self, season: int, df: pd.DataFrame) -> List[int]:
+        """Write one file per week in df (replacing those weeks). Returns the weeks written."""
+        if not store_available():
+            raise RuntimeError("pyarrow is not installed; local store unavailable")
+
+        os.makedirs(self.season_dir(season), exist_ok=True)
+        written = []
+        for week, part in df.groupby("week", observed=True):
+            path = self._week_path(season, week)
+            tmp = path + ".tmp"
+            # Uncompressed so the file can be mapped zero-copy; rename makes the write atomic for readers
+            table = to_store_table(part)
+            feather.write_feather(table, tmp, compression="uncompressed")
+            os.replace(tmp, path)
+            written.append(int(week))
+        # Last: the season only counts as stored once every week file is in place
+        manifest = self._manifest_path(season)
+        with open(manifest + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"weeks": self.weeks(season), "written": time.time()}, f)
+        os.replace(manifest + ".tmp", manifest)
+        return written
+
+    def open_table(self, season: int, weeks: Optional[List[int]] = None) -> Optional["pa.Table"]:
+        """Memory-map the season's week files into one Arrow table (no copy)."""
+        if not store_available():
+            return None
+        weeks = self.weeks(season) if weeks is None else weeks
+        tables = []
+        with span(f"store {self.dataset}", kind="load", season=season, weeks=len(weeks)):
+            for week in weeks:
+                source = pa.memory_map(self._week_path(season, week), "r")
+                tables.append(pa.ipc.open_file(source).read_all())
+        if not tables:
+            return None
+        return pa.concat_tables(tables, promote_options="permissive") if len(tables) > 1 else tables[0]
+
+    def read_season(self, season: int, weeks: Optional[List[int]] = None) -> Optional[pd.DataFrame]:
+        """
+        Season as a pandas frame backed by the mapped pages where possible
+        (split_blocks keeps null-free numeric columns zero-copy; they come back read-only).
+        """
+        table = self.open_table(season, weeks)
+        if table is None:
+            return None
+        return table.to_pandas(split_blocks=True)
+
+
+pbp_store = SeasonStore("pbp")
+weekly_store = SeasonStore("weekly")
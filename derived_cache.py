@@ -0,0 +1,411 @@
+# derived_cache.py
+#
+# Dependency-tracked cache for derived artifacts (fact tables, defensive / O-line
+# tables, season aggregates, prediction results). Each artifact declares the data it
+# was computed from; a data change invalidates exactly the artifacts whose inputs it
+# touches (plus anything built on top of them), and they are recomputed lazily on
+# the next request instead of flushing everything.
+#
+# Resident values are also held to a byte budget: when the frames and arrays they hold
+# exceed NFL_CACHE_BUDGET_MB, least-recently-used artifacts (and whatever was built
+# on top of them) are evicted and reloaded from the local store on next use. Artifacts
+# nothing is built on (one per predicted prop, ...) are also capped by count at
+# NFL_CACHE_MAX_ENTRIES, least recently used first, and invalidated or evicted
+# artifacts are removed from the graph rather than kept as empty entries.
+#
+# trace() collects the cache hits, recomputed artifacts and timed data loads (see
+# loading()) of the code inside it, for per-factor prediction timings.
+
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, FrozenSet, Hashable, Iterable, Iterator, List, Optional, Set, Tuple
+
+from tracing import span
+
+# Resident byte budget for cached values; 0 disables eviction
+DEFAULT_BUDGET_MB = 2048
+BUDGET_BYTES = int(float(os.getenv("NFL_CACHE_BUDGET_MB", DEFAULT_BUDGET_MB)) * 1024 * 1024)
+
+# Entry count past which least-recently-used artifacts with no dependents are dropped; 0 disables
+MAX_ENTRIES = int(os.getenv("NFL_CACHE_MAX_ENTRIES", "20000"))
+
+
+@dataclass(frozen=True)
+class Inputs:
+    """What an artifact was computed from. None means "all" (every week / team / player)."""
+    seasons: Tuple[int, ...] = ()
+    weeks: Optional[Tuple[int, int]] = None       # inclusive week range
+    teams: Optional[FrozenSet[str]] = None
+    players: Optional[FrozenSet[str]] = None
+
+    def touched_by(self, season: int, weeks: Optional[Iterable[int]] = None,
+                   teams: Optional[Iterable[str]] = None,
+                   players: Optional[Iterable[str]] = None) -> bool:
+        if season not in self.seasons:
+            return False
+        if weeks is not None and self.weeks is not None:
+            lo, hi = self.weeks
+            if not any(lo <= w <= hi for w in weeks):
+                return False
+        if teams is not None and self.teams is not None and not self.teams & set(teams):
+            return False
+        if players is not None and self.players is not None and not self.players & set(players):
+            return False
+        return True
+
+
+def inputs(seasons: Iterable[int], weeks: Optional[Tuple[int, int]] = None,
+           teams: Optional[Iterable[str]] = None, players: Optional[Iterable[str]] = None) -> Inputs:
+    return Inputs(
+        seasons=tuple(sorted(set(seasons))),
+        weeks=weeks,
+        teams=None if teams is None else frozenset(t for t in teams if t),
+        players=None if players is None else frozenset(p for p in players if p),
+    )
+
+
+def _leaves(value: Any, depth: int = 0) -> Dict[int, int]:
+    """
+    {id: bytes} of the frames / arrays / fact tables a value holds. Keyed by id so an
+    object shared by several artifacts (e.g. pbp inside a SeasonContext) counts once.
+    """
+    if value is None or isinstance(value, (str, bytes, int, float, bool)) or depth > 3:
+        return {}
+    if hasattr(value, "memory_usage") and hasattr(value, "columns"):       # DataFrame
+        return {id(value): int(value.memory_usage(index=True, deep=True).sum())}
+    if hasattr(value, "memory_usage") and hasattr(value, "index"):         # Series
+        return {id(value): int(value.memory_usage(index=True, deep=True))}
+    nbytes = getattr(value, "nbytes", None)
+    if isinstance(nbytes, int):                                             # ndarray
+        return {id(value): nbytes}
+    if callable(nbytes):                                                    # PlayerGameFacts
+        return {id(value): int(nbytes())}
+    if isinstance(value, dict):
+        children = value.values()
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        children = value
+    elif hasattr(value, "__dict__"):                                        # SeasonContext, SeasonAggregates, ...
+        children = vars(value).values()
+    else:
+        return {}
+    found: Dict[int, int] = {}
+    for child in children:
+        found.update(_leaves(child, depth + 1))
+    return found
+
+
+@dataclass
+class _Entry:
+    inputs: Inputs
+    depends_on: Tuple[Hashable, ...] = ()
+    value: Any = None
+    valid: bool = False
+    lock: threading.Lock = field(default_factory=threading.Lock)
+    leaves: Dict[int, int] = field(default_factory=dict)
+    last_used: int = 0
+
+
+class DerivedCache:
+    def __init__(self, budget_bytes: int = BUDGET_BYTES, max_entries: int = MAX_ENTRIES):
+        self._entries: Dict[Hashable, _Entry] = {}
+        self._dependents: Dict[Hashable, Set[Hashable]] = {}
+        self._lock = threading.RLock()
+        self._clock = 0
+        # season -> count of invalidations touching it; a computation that started before
+        # one may have read pre-change data, so its result is not kept
+        self._generations: Dict[int, int] = {}
+        self.budget_bytes = budget_bytes
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+
+    def _touch(self, entry: _Entry) -> None:
+        self._clock += 1
+        entry.last_used = self._clock
+
+    def _generation(self, inputs: Inputs) -> Tuple[int, ...]:
+        return tuple(self._generations.get(season, 0) for season in inputs.seasons)
+
+    def _store(self, key: Hashable, entry: _Entry, value: Any, generation: Optional[Tuple[int, ...]] = None) -> None:
+        """
+        Set a fresh value, record what it holds, and evict others if over budget. With
+        `generation` (taken when the computation started), a value whose seasons were
+        invalidated meanwhile is not kept: the entry stays invalid and is recomputed.
+        """
+        leaves = _leaves(value)
+        with self._lock:
+            if generation is not None and (self._generation(entry.inputs) != generation
+                                           or self._entries.get(key) is not entry):
+                return
+            entry.value, entry.valid, entry.leaves = value, True, leaves
+            self._touch(entry)
+            self._enforce_budget(protect=key)
+            self._enforce_entry_cap(protect=key)
+
+    def cached(self, key: Hashable, inputs: Inputs, compute: Callable[[], Any],
+               depends_on: Iterable[Hashable] = ()) -> Any:
+        """
+        Return the artifact for `key`, computing it if missing or invalidated.
+        Concurrent callers for the same key wait for one computation.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = _Entry(inputs=inputs, depends_on=tuple(depends_on))
+                self._entries[key] = entry
+                for dep in entry.depends_on:
+                    self._dependents.setdefault(dep, set()).add(key)
+            if entry.valid:
+                self.hits += 1
+                self._touch(entry)
+                _traced(lambda t: t.hit())
+                return entry.value
+
+        # The caller's own `compute` is used, never one stored on the entry: entries don't
+        # hold closures (over frames an eviction should release) and an eviction on another
+        # thread can't pull the function out from under this call
+        with entry.lock:
+            if not entry.valid:
+                self.misses += 1
+                _traced(lambda t: t.computed.append(key))
+                with self._lock:
+                    generation = self._generation(entry.inputs)
+                value = compute()
+                self._store(key, entry, value, generation)
+                return value
+            _traced(lambda t: t.hit())
+            return entry.value
+
+    def peek(self, key: Hashable) -> Any:
+        """Current value if valid, without computing."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry.value if entry is not None and entry.valid else None
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Mark an existing artifact fresh with a value updated in place (e.g. incrementally)."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._store(key, entry, value)
+
+    def discard(self, key: Hashable) -> None:
+        """Drop a value that should not be kept (e.g. an offline fallback); dependents go with it."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            self._drop(key)
+
+    def _remove(self, key: Hashable) -> None:
+        """Delete an entry and its edges to what it depends on (caller holds the lock)."""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        # A caller already holding the entry sees it invalid and computes afresh
+        entry.value, entry.valid, entry.leaves = None, False, {}
+        for dep in entry.depends_on:
+            dependents = self._dependents.get(dep)
+            if dependents is not None:
+                dependents.discard(key)
+                if not dependents:
+                    del self._dependents[dep]
+
+    def _drop(self, key: Hashable) -> List[Hashable]:
+        """Remove `key` and, transitively, everything built on it. Returns the keys that held values."""
+        dropped = []
+        stack = [key]
+        while stack:
+            dep_key = stack.pop()
+            dep = self._entries.get(dep_key)
+            if dep is None or (not dep.valid and dep_key != key):
+                continue
+            if dep.valid:
+                dropped.append(dep_key)
+            stack.extend(self._dependents.get(dep_key, ()))
+            self._remove(dep_key)
+        return dropped
+
+    # ---------- Byte budget
+
+    def _resident(self) -> Dict[int, int]:
+        held: Dict[int, int] = {}
+        for e in self._entries.values():
+            if e.valid:
+                held.update(e.leaves)
+        return held
+
+    def resident_bytes(self) -> int:
+        with self._lock:
+            return sum(self._resident().values())
+
+    def _enforce_budget(self, protect: Hashable) -> None:
+        """Evict least-recently-used values (never `protect` or one mid-computation) until under budget."""
+        if not self.budget_bytes:
+            return
+        used = sum(self._resident().values())
+        if used <= self.budget_bytes:
+            return
+        candidates = sorted(
+            (e.last_used, k) for k, e in self._entries.items()
+            if e.valid and k != protect and not e.lock.locked()
+        )
+        for _, key in candidates:
+            if used <= self.budget_bytes:
+                break
+            entry = self._entries.get(key)
+            if entry is None or not entry.valid:   # already dropped as a dependent of an earlier eviction
+                continue
+            self.evictions += len(self._drop(key))
+            after = sum(self._resident().values())
+            self.evicted_bytes += used - after
+            used = after
+        if used > self.budget_bytes:
+            print(f"Derived cache over budget: {used / 2**20:.0f} MB resident, "
+                  f"budget {self.budget_bytes / 2**20:.0f} MB")
+
+    def _enforce_entry_cap(self, protect: Hashable) -> None:
+        """
+        Past max_entries, remove least-recently-used artifacts nothing depends on (never
+        `protect` or one mid-computation) down to 90% of the cap, so the sort is amortized.
+        """
+        if not self.max_entries or len(self._entries) <= self.max_entries:
+            return
+        candidates = sorted(
+            (e.last_used, k) for k, e in self._entries.items()
+            if k != protect and not e.lock.locked() and not self._dependents.get(k)
+        )
+        excess = len(self._entries) - int(self.max_entries * 0.9)
+        for _, key in candidates[:excess]:
+            if self._entries[key].valid:
+                self.evictions += 1
+            self._remove(key)
+
+    def usage(self) -> List[Tuple[Hashable, int]]:
+        """(key, bytes held) for each resident artifact, largest first; shared objects count for each holder."""
+        with self._lock:
+            rows = [(k, sum(e.leaves.values())) for k, e in self._entries.items() if e.valid]
+        return sorted(rows, key=lambda r: r[1], reverse=True)
+
+    def usage_by_dataset(self) -> Dict[Tuple[str, str], int]:
+        """
+        Resident bytes per (dataset, season): the key's first element and its season, if any.
+        Each object counts once, for the smallest artifact holding it (the base table rather
+        than a context bundling it).
+        """
+        with self._lock:
+            holders = sorted(((k, e.leaves) for k, e in self._entries.items() if e.valid),
+                             key=lambda kv: sum(kv[1].values()))
+            seen: Set[int] = set()
+            totals: Dict[Tuple[str, str], int] = {}
+            for key, leaves in holders:
+                parts = key if isinstance(key, tuple) else (key,)
+                season = str(parts[1]) if len(parts) > 1 and isinstance(parts[1], int) else ""
+                label = (str(parts[0]), season)
+                for obj_id, size in leaves.items():
+                    if obj_id not in seen:
+                        seen.add(obj_id)
+                        totals[label] = totals.get(label, 0) + size
+        return totals
+
+    def invalidate(self, season: int, weeks: Optional[Iterable[int]] = None,
+                   teams: Optional[Iterable[str]] = None, players: Optional[Iterable[str]] = None,
+                   keep: Iterable[Hashable] = ()) -> List[Hashable]:
+        """
+        Invalidate artifacts whose inputs overlap the change, then everything that depends
+        on them. Values are dropped; recomputation happens on the next `cached` call.
+        Keys in `keep` were already updated by the caller and are left valid. Computations
+        of the season still running don't keep their results (see _store).
+        """
+        weeks = None if weeks is None else list(weeks)
+        teams = None if teams is None else set(teams)
+        players = None if players is None else set(players)
+        keep = set(keep)
+
+        with self._lock:
+            self._generations[season] = self._generations.get(season, 0) + 1
+            stack = [k for k, e in self._entries.items()
+                     if e.valid and k not in keep and e.inputs.touched_by(season, weeks, teams, players)]
+            stack += [d for k in keep for d in self._dependents.get(k, ())]
+            invalidated = []
+            while stack:
+                key = stack.pop()
+                entry = self._entries.get(key)
+                if entry is None or not entry.valid or key in keep:
+                    continue
+                invalidated.append(key)
+                stack.extend(self._dependents.get(key, ()))
+                self._remove(key)
+            self.invalidations += len(invalidated)
+        return invalidated
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            valid = sum(1 for e in self._entries.values() if e.valid)
+            return {
+                "entries": len(self._entries),
+                "valid": valid,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "resident_bytes": sum(self._resident().values()),
+                "budget_bytes": self.budget_bytes,
+                "max_entries": self.max_entries,
+                "evictions": self.evictions,
+                "evicted_bytes": self.evicted_bytes,
+            }
+
+
+# Process-wide graph shared by the loaders and the predictor
+derived_cache = DerivedCache()
+
+
+# ---------- Tracing
+
+class Trace:
+    def __init__(self):
+        self.hits = 0
+        self.computed: List[Hashable] = []            # artifacts (re)computed inside the trace
+        self.loads: List[Tuple[str, float]] = []      # (what, seconds) data loads
+
+    def hit(self) -> None:
+        self.hits += 1
+
+
+# Active traces, innermost last (an outer trace also sees what inner ones record)
+_traces: contextvars.ContextVar[Tuple[Trace, ...]] = contextvars.ContextVar("derived_cache_traces", default=())
+
+
+def _traced(record: Callable[[Trace], None]) -> None:
+    for t in _traces.get():
+        record(t)
+
+
+@contextmanager
+def trace() -> Iterator[Trace]:
+    """Record cache hits, recomputations and data loads made inside the block."""
+    t = Trace()
+    token = _traces.set(_traces.get() + (t,))
+    try:
+        yield t
+    finally:
+        _traces.reset(token)
+
+
+@contextmanager
+def loading(what: str) -> Iterator[None]:
+    """Mark the block as a data load (download / uncached read) for active traces."""
+    start = time.perf_counter()
+    try:
+        with span(f"load {what}", kind="load"):
+            yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _traced(lambda t: t.loads.append((what, elapsed)))
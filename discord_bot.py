@@ -4,50 +4,206 @@ load_dotenv()
 
 import discord
 from discord.ext import commands
-import nfl_data_py as nfl
-import pandas as pd
 import config  # your config file with weights/factors
 from config import defensive_rushing_factors
-from nfl_api import (
-    load_data,
-    check_team_exists,
-    calculate_offensive_stats,
-    calculate_offensive_line_metrics,
-    calculate_defensive_stats,
-    adjusted_rush_defense_metric
-)
-from bot_mehtods import L10, plot_last_10_results, h2h, plot_vs_team_results, h2h_last_10_vs_team
+from fact_table import history_facts, recent_facts
+from chart_render import render_chart, last10_spec, vs_team_spec, card_spec, start_render_pool
 import io
-import matplotlib.pyplot as plt
+import copy
 import time
-from prediction import predict_stat
-from OverUnderPrediction import predict_over_under
+import asyncio
+from jobs import job_queue, QUEUED, RUNNING, DONE, FAILED, CANCELLED, TIMED_OUT, FINISHED
+from scheduler import scheduler, RateLimited
+import traceback
+from OverUnderPrediction import format_timings
+from compute_workers import compute
+from metrics import loop_lag, metrics, start_command, stage
+from http_server import rss_bytes, start_http_server
+from derived_cache import derived_cache
+from result_cache import result_cache
+from chart_cache import chart_cache
+from data_store import pbp_store, weekly_store
+from ingest import apply_changes, fetch_changes
+from loop_watchdog import watchdog
+from profiling import CPU, MODES, profile_requests
+from season_context import CURRENT_SEASON, get_context, start_warm_up, is_ready, wait_until_ready, warm_up_state
 
 intents = discord.Intents.default()
 intents.message_content = True  # required for reading messages in new discord.py versions
 
 bot = commands.Bot(command_prefix="!", intents=intents)
 
+# Minutes between automatic syncs of the current season's data (0: only on !sync)
+SYNC_MINUTES = float(os.getenv("BOT_SYNC_MINUTES", "0"))
+_sync_task = None
+_sync_lock = asyncio.Lock()   # one sync at a time (scheduled and !sync)
+
 # Reuse your existing functions here (load_data, check_team_exists, calculate_offensive_stats, etc.)
 # Or import them if you put them in a separate module
 
 @bot.event
 async def on_ready():
     print(f'Logged in as {bot.user}')
+    # Connect first, then load the season context in the background (no-op on reconnects).
+    # With compute workers the front end stays thin: it only needs the fact table for name checks.
+    compute.start(CURRENT_SEASON)
+    start_warm_up(facts_only=compute.started)
+    start_render_pool()
+    # Prometheus metrics + liveness / readiness for monitoring (see http_server.py)
+    loop_lag.start()
+    watchdog.start(asyncio.get_running_loop())
+    start_http_server(asyncio.get_running_loop())
+    global _sync_task
+    if SYNC_MINUTES > 0 and _sync_task is None:
+        _sync_task = asyncio.create_task(_sync_periodically())
+
+class Throttled(commands.CommandError):
+    """Raised by the before-invoke hook when the scheduler rejects a command."""
+
+    def __init__(self, limited: RateLimited):
+        super().__init__(str(limited))
+        self.limited = limited
+
+def _guild_id(ctx):
+    return ctx.guild.id if ctx.guild else None
+
+@bot.before_invoke
+async def before_command(ctx):
+    # Latency histograms per command and stage (see metrics.py)
+    ctx.timer = start_command(ctx.command.name)
+
+    # Commands that arrive during warm-up wait for it instead of starting duplicate loads
+    if not is_ready():
+        with stage("data_load"):
+            await wait_until_ready()
+
+    # Per-user / per-guild rate limits by cost class (see scheduler.py)
+    try:
+        wait = scheduler.admit(ctx.command.name, ctx.author.id, _guild_id(ctx),
+                               pending=len(job_queue.active(owner=ctx.author.id)))
+    except RateLimited as e:
+        raise Throttled(e)
+    if wait > 0:
+        with stage("queue"):
+            await ctx.send(f"⏳ Busy — your `!{ctx.command.name}` starts in {wait:.0f}s.")
+            await asyncio.sleep(wait)
+
+@bot.after_invoke
+async def after_command(ctx):
+    # Jobs finish their timer when the result is posted (see run_as_job)
+    timer = getattr(ctx, "timer", None)
+    if timer is not None and not timer.deferred:
+        timer.finish("error" if ctx.command_failed else "ok")
+
+@bot.event
+async def on_command_error(ctx, error):
+    timer = getattr(ctx, "timer", None)
+    if timer is not None:
+        timer.finish("throttled" if isinstance(error, Throttled) else "error")
+    if isinstance(error, Throttled):
+        limited = error.limited
+        retry = f" Try again in {limited.retry_after:.0f}s." if limited.retry_after else ""
+        await ctx.send(f"🚦 Slow down: {limited}.{retry}")
+        return
+    if ctx.command is not None and ctx.command.has_error_handler():
+        return
+    traceback.print_exception(type(error), error, error.__traceback__)
+
+# Charts are Discord-sized by default; a trailing `; hd` field asks for the high-res version
+HIGH_RES_FLAGS = ("hd", "hires", "high res")
+
+def _split_args(args, count):
+    """Split `a; b; ...` into `count` fields plus an optional high-res flag. Raises ValueError."""
+    with stage("parse"):
+        fields = [x.strip() for x in args.split(';')]
+        high_res = len(fields) == count + 1 and fields[-1].lower() in HIGH_RES_FLAGS
+        if high_res:
+            fields = fields[:-1]
+        if len(fields) != count:
+            raise ValueError(f"expected {count} fields")
+        return fields, high_res
+
+# ---------- Background jobs
+# Heavy commands reply with a placeholder at once and run as a job; the placeholder
+# is edited with progress and then replaced by the result.
+
+PROGRESS_EDIT_INTERVAL = 1.5  # seconds between progress edits (Discord rate-limits edits)
+
+async def run_as_job(ctx, job_type, label, work):
+    """
+    Queue `work(job)` (an async function returning (content, image_bytes or None, filename))
+    and keep a placeholder message in sync with it.
+    """
+    message = await ctx.send(f"⏳ {label} — queued")
+    edit_lock = asyncio.Lock()
+    timer = getattr(ctx, "timer", None)
+    if timer is not None:
+        timer.deferred = True
+    status = {"last_edit": 0.0, "final": False}
+
+    async def on_update(job):
+        final = job.state in FINISHED
+        async with edit_lock:
+            if status["final"]:
+                return
+            if not final and time.monotonic() - status["last_edit"] < PROGRESS_EDIT_INTERVAL and job.progress:
+                return
+            status["last_edit"], status["final"] = time.monotonic(), final
+            if final and timer is not None:
+                timer.add("queue", (job.started or job.finished) - job.created)
+
+            if job.state == DONE:
+                content, image, filename = job.result
+                attachments = [discord.File(fp=io.BytesIO(image), filename=filename)] if image else []
+                with stage("send"):
+                    await message.edit(content=content, attachments=attachments)
+            elif job.state == FAILED:
+                await message.edit(content=f"⚠️ {label} failed: `{job.error}`")
+            elif job.state == TIMED_OUT:
+                await message.edit(content=f"⌛ {label} timed out ({job.error}). Try again in a bit.")
+            elif job.state == CANCELLED:
+                await message.edit(content=f"🛑 {label} cancelled.")
+            else:
+                progress = f" · {job.progress}" if job.progress else ""
+                await message.edit(content=f"⏳ {label} — {job.state}{progress} (job #{job.id}, `!cancel {job.id}`)")
+            if final and timer is not None:
+                timer.finish(job.state)
+
+    return job_queue.submit(job_type, ctx.author.id, label, work, on_update, guild=_guild_id(ctx))
+
+@bot.command(name="jobs")
+async def jobs_command(ctx):
+    active = job_queue.active(owner=ctx.author.id)
+    if not active:
+        await ctx.send("No jobs running.")
+        return
+    lines = [f"#{j.id} `{j.type}` {j.label} — {j.state} {j.elapsed:.0f}s" + (f" · {j.progress}" if j.progress else "")
+             for j in active]
+    await ctx.send("\n".join(lines))
+
+@bot.command(name="cancel")
+async def cancel_command(ctx, job_id: int):
+    # Owners can cancel anyone's job; everyone else only their own
+    owner = None if await bot.is_owner(ctx.author) else ctx.author.id
+    if job_queue.cancel(job_id, owner=owner):
+        await ctx.send(f"🛑 Cancelling job #{job_id}.")
+    else:
+        await ctx.send(f"No running job #{job_id} of yours.")
 
 @bot.command(name="predict_over_under")
 async def predict_over_under_command(ctx, *args):
-    start_time = time.time()
-
     try:
-        raw_input = " ".join(args)
+        # `--timing` anywhere adds the per-factor timing breakdown
+        show_timing = "--timing" in args
+        raw_input = " ".join(a for a in args if a != "--timing")
         params = [param.strip() for param in raw_input.split(';')]
 
         if len(params) != 4:
             await ctx.send(
                 "❌ Invalid format.\n"
                 "Use: `Player Name; Stat Line; Line Number; Opponent Team; Season`\n"
-                "Example: `Aaron Rodgers; passing yards; 250; MIN; 2024`"
+                "Example: `Aaron Rodgers; passing yards; 250; MIN; 2024`\n"
+                "Add `--timing` for a per-factor timing breakdown."
             )
             return
         
@@ -57,14 +213,18 @@ async def predict_over_under_command(ctx, *args):
         opponentTeam = params[3]
         season = 2024
 
-        # Call the correct predict_over_under function here
-        result = predict_over_under(
-            player_name=playerName,
-            stat_line=statLine,
-            line_value=lineNumber,
-            opponent_team=opponentTeam,
-            season=season
-        )
+        # Call the correct predict_over_under function here (in a fair-share compute slot, off the event loop)
+        queued = time.perf_counter()
+        async with scheduler.slot("predict_over_under", ctx.author.id, _guild_id(ctx)):
+            ctx.timer.add("queue", time.perf_counter() - queued)
+            result = await compute.call(
+                "predict_over_under",
+                player_name=playerName,
+                stat_line=statLine,
+                line_value=lineNumber,
+                opponent_team=opponentTeam,
+                season=season
+            )
 
         # Create an embed message
         embed = discord.Embed(
@@ -93,10 +253,10 @@ async def predict_over_under_command(ctx, *args):
         # embed.add_field(name="Contributions (pp)", value=format_contributions(result.contributions), inline=False)
 
         # Send the embed back to the Discord channel
-        await ctx.send(embed=embed)
-
-        elapsed = time.time() - start_time
-        #await ctx.send(f"⏱️ Command completed in {elapsed:.2f} seconds.")
+        with stage("send"):
+            await ctx.send(embed=embed)
+            if show_timing:
+                await ctx.send(f"⏱️ Factor timings:\n```\n{format_timings(result)[:1900]}\n```")
 
     except Exception as e:
         await ctx.send(f"❌ Error: {e}")
@@ -109,103 +269,86 @@ async def predict(ctx, playerName: str, statLine: str, opponentTeam: str, player
     !predict RB "Bijan Robinson" rushing_yards KC ATL
     !predict QB "Patrick Mahomes" passing_tds BUF KC
     """
-
-    start_time = time.time()
-
     try:
-        result = predict_stat(
-            player_name=playerName,
-            stat_type=statLine,
-            opp_team=opponentTeam,
-            player_team=playerTeam
-        )
+        queued = time.perf_counter()
+        async with scheduler.slot("predict_stat", ctx.author.id, _guild_id(ctx)):
+            ctx.timer.add("queue", time.perf_counter() - queued)
+            result = await compute.call(
+                "predict_stat",
+                player_name=playerName,
+                stat_type=statLine,
+                opp_team=opponentTeam,
+                player_team=playerTeam
+            )
 
-        elapsed = time.time() - start_time
-        await ctx.send(
-            f"📊 **{result['player']}** ({result['position']}) — {result['stat']} projection:\n"
-            f"Base: {result['base_projection']:.2f}\n"
-            f"Adjusted: {result['adjusted_projection']:.2f}"
-        )
-        #await ctx.send(f"⏱️ Command completed in {elapsed:.2f} seconds.")
+        with stage("send"):
+            await ctx.send(
+                f"📊 **{result['player']}** ({result['position']}) — {result['stat']} projection:\n"
+                f"Base: {result['base_projection']:.2f}\n"
+                f"Adjusted: {result['adjusted_projection']:.2f}"
+            )
 
     except ValueError as e:
         await ctx.send(f"❌ Error: {e}")
 
 @bot.command(name="h2hl10")
 async def h2hl10(ctx, *, args):
-    start_time = time.time()
     try:
-        playerName, statLine, lineNumber, OA, oppTeam = [x.strip() for x in args.split(';')]
+        (playerName, statLine, lineNumber, OA, oppTeam), high_res = _split_args(args, 5)
         lineNumber = float(lineNumber)
     except Exception:
         await ctx.send(
             "❌ Invalid format.\n"
-            "Use: `Player Name; Stat Line; Line Number; Over/Under; Opponent Team`\n"
+            "Use: `Player Name; Stat Line; Line Number; Over/Under; Opponent Team` (add `; hd` for high-res)\n"
             "Example: `Aaron Rodgers; passing yards; 250; over; MIN`"
         )
         return
 
-    try:
-        stats = h2h_last_10_vs_team(playerName, statLine, lineNumber, OA, oppTeam)
+    async def work(job):
+        job.report("reading game history")
+        stats = await compute.call("h2h_last_10", playerName, statLine, lineNumber, OA, oppTeam)
         if stats is None:
-            await ctx.send(f"⚠️ No data found for {playerName} against {oppTeam}.")
-            return
-    except Exception as e:
-        await ctx.send(f"⚠️ Error processing data: {e}")
-        return
-
-    try:
-        image_buf = plot_vs_team_results(
-            results=stats['results'],
-            line_number=stats['line'],
-            oa=stats['OA'],
-            player_name=playerName,
-            stat_name=statLine,
-            opp_team=oppTeam
-        )
-        file = discord.File(fp=image_buf, filename="h2hl10.png")
-        await ctx.send(
-            content=(
-                f"📊 **Last 10 games for `{playerName}` vs `{oppTeam}` – `{statLine.title()}`**\n"
-                f"{playerName} went **{stats['OA']} {stats['line']}** "
-                f"{stats['percentage']:.1f}% of these games."
-            ),
-            file=file
+            return f"⚠️ No data found for {playerName} against {oppTeam}.", None, None
+
+        job.report("rendering chart")
+        spec = vs_team_spec(stats['results'], stats['line'], stats['OA'], playerName, statLine, oppTeam)
+        image, ext = await render_chart(spec, high_res=high_res)
+        content = (
+            f"📊 **Last 10 games for `{playerName}` vs `{oppTeam}` – `{statLine.title()}`**\n"
+            f"{playerName} went **{stats['OA']} {stats['line']}** "
+            f"{stats['percentage']:.1f}% of these games."
         )
-    except Exception as e:
-        await ctx.send(f"📉 Could not generate graph: {e}")
-    
-    elapsed = time.time() - start_time
-    #await ctx.send(f"⏱️ Command completed in {elapsed:.2f} seconds.")
+        return content, image, f"h2hl10.{ext}"
+
+    await run_as_job(ctx, "h2h", f"`!h2hl10` {playerName} vs {oppTeam}", work)
 
 
 @bot.command(name="h2h")
 async def vs_team(ctx, *, args):
-    start_time = time.time()
     try:
-        playerName, statLine, lineNumber, OA, oppTeam = [x.strip() for x in args.split(';')]
+        (playerName, statLine, lineNumber, OA, oppTeam), high_res = _split_args(args, 5)
         lineNumber = float(lineNumber)
     except Exception:
         await ctx.send(
             "❌ Invalid format.\n"
-            "Use: `Player Name; Stat Line; Line Number; Over/Under; Opponent Team`\n"
+            "Use: `Player Name; Stat Line; Line Number; Over/Under; Opponent Team` (add `; hd` for high-res)\n"
             "Example: `Aaron Rodgers; passing yards; 250; over; CHI`"
         )
         return
 
     try:
-        all_data = nfl.import_weekly_data(list(range(2005, 2025)))
+        with stage("data_load"):
+            facts = await asyncio.to_thread(history_facts)
     except Exception as e:
         await ctx.send(f"❌ Failed to load NFL data: {e}")
         return
 
-    if playerName not in all_data['player_display_name'].unique():
+    if not facts.has_player(playerName):
         await ctx.send(f"❌ Player `{playerName}` not found in historical data.")
         return
 
-    valid_stats = all_data.columns.tolist()
     stat_clean = statLine.lower().replace(' ', '_')
-    if stat_clean not in valid_stats:
+    if not facts.has_stat(stat_clean):
         await ctx.send(f"❌ `{statLine}` is not a valid stat.")
         return
 
@@ -213,81 +356,65 @@ async def vs_team(ctx, *, args):
         await ctx.send("❌ Please specify `over` or `under` as the fourth argument.")
         return
 
-    # Process the stat history
-    try:
-        stats = h2h(playerName, statLine, lineNumber, OA, oppTeam)
-    except Exception as e:
-        await ctx.send(f"⚠️ Error during analysis: `{e}`")
-        return
-
-    if not stats:
-        await ctx.send(f"ℹ️ No games found for `{playerName}` vs `{oppTeam}`.")
-        return
-
-    # Generate plot
-    try:
-        image_buf = plot_vs_team_results(
-            results=stats['results'],
-            line_number=stats['line'],
-            oa=stats['OA'],
-            player_name=playerName,
-            stat_name=statLine,
-            opp_team=oppTeam
-        )
-
-        file = discord.File(fp=image_buf, filename="vsteam.png")
-        await ctx.send(
-            content=(
-                f"📊 **{playerName} vs {oppTeam} – `{statLine.title()}`**\n"
-                f"{playerName} went **{stats['OA']} {stats['line']}** "
-                f"{stats['percentage']:.1f}% of the {len(stats['results'])} games."
-            ),
-            file=file
+    async def work(job):
+        # Process the stat history
+        job.report("reading game history")
+        stats = await compute.call("h2h", playerName, statLine, lineNumber, OA, oppTeam)
+        if not stats:
+            return f"ℹ️ No games found for `{playerName}` vs `{oppTeam}`.", None, None
+
+        # Generate plot
+        job.report(f"rendering {len(stats['results'])} games")
+        spec = vs_team_spec(stats['results'], stats['line'], stats['OA'], playerName, statLine, oppTeam)
+        image, ext = await render_chart(spec, high_res=high_res)
+        content = (
+            f"📊 **{playerName} vs {oppTeam} – `{statLine.title()}`**\n"
+            f"{playerName} went **{stats['OA']} {stats['line']}** "
+            f"{stats['percentage']:.1f}% of the {len(stats['results'])} games."
         )
+        return content, image, f"vsteam.{ext}"
 
-    except Exception as e:
-        await ctx.send(f"📉 Could not generate graph: {e}")
-
-    elapsed = time.time() - start_time
-    #await ctx.send(f"⏱️ Command completed in {elapsed:.2f} seconds.")
+    await run_as_job(ctx, "h2h", f"`!h2h` {playerName} vs {oppTeam}", work)
 
 
 @bot.command(name="last10")
 async def last10(ctx, *, args):
     try:
-        playerName, statLine, lineNumber, OA = [x.strip() for x in args.split(';')]
+        (playerName, statLine, lineNumber, OA), high_res = _split_args(args, 4)
         lineNumber = float(lineNumber)
     except Exception:
         await ctx.send(
             "❌ Invalid format.\n"
-            "Use: `Player Name; Stat Line; Line Number; Over/Under`\n"
+            "Use: `Player Name; Stat Line; Line Number; Over/Under` (add `; hd` for high-res)\n"
             "Example: `Patrick Mahomes; passing yards; 300; over`"
         )
         return
 
-    # Load 2024 data once here to use for player check
+    # Shared fact table (loaded once per process) for the player check; the recent seasons
+    # answer it while the full history is still being built
     try:
-        schedule = nfl.import_weekly_data([2024])
+        with stage("data_load"):
+            facts = await asyncio.to_thread(recent_facts)
+            if not facts.has_player(playerName):
+                facts = await asyncio.to_thread(history_facts)
     except Exception as e:
         await ctx.send(f"❌ Failed to load NFL data: {e}")
         return
 
     # Player existence check
-    if playerName not in schedule['player_display_name'].unique():
-        all_players = sorted(schedule['player_display_name'].unique().tolist())
-        suggestions = [p for p in all_players if playerName.lower() in p.lower()]
+    if not facts.has_player(playerName):
+        suggestions = [p for p in facts.players if playerName.lower() in p.lower()]
         suggestion_msg = "\nMaybe you meant:\n" + "\n".join(suggestions[:5]) if suggestions else ""
         await ctx.send(f"❌ Player `{playerName}` not found.{suggestion_msg}")
         return
 
     # Stat check – get valid columns
-    valid_stats = schedule.columns.tolist()
     stat_clean = statLine.lower().replace(' ', '_')
-    if stat_clean not in valid_stats:
+    if not facts.has_stat(stat_clean):
         # Filter useful player stat fields
         exclude = ['player_id', 'player_name', 'player_display_name', 'season', 'week',
                    'team', 'opponent_team', 'headshot_url', 'recent_team', 'season_type']
-        allowed_stats = [s for s in valid_stats if s not in exclude and not s.startswith('team')]
+        allowed_stats = [s for s in facts.stat_names if s not in exclude and not s.startswith('team')]
 
         await ctx.send(
             f"❌ `{statLine}` is not a valid stat.\n"
@@ -301,84 +428,317 @@ async def last10(ctx, *, args):
         await ctx.send("❌ Please specify `over` or `under` as the last argument.")
         return
 
-    # All checks passed – try to run the function
-    try:
-        stats = L10(playerName, statLine, lineNumber, OA)
-    except Exception as e:
-        await ctx.send(f"⚠️ Unexpected error while processing: `{e}`")
-        return
-    try:
-        image_buf = plot_last_10_results(
-        results=stats['results'],
-        line_number=stats['line'],
-        oa=stats['OA'],
-        player_name=playerName,
-        stat_name=statLine
-    )
+    # All checks passed – run it as a job
+    async def work(job):
+        job.report("reading game history")
+        stats = await compute.call("last10", playerName, statLine, lineNumber, OA)
 
+        # Rendered in the chart worker pool, off the event loop
+        job.report("rendering chart")
+        spec = last10_spec(stats['results'], stats['line'], stats['OA'], playerName, statLine)
+        image, ext = await render_chart(spec, high_res=high_res)
+
+        # Caption plus the game-by-game list
+        content = f"📊 **Last 10 games for `{playerName}` – `{statLine.title()}`**\n"
+        for i, (opp, val) in enumerate(stats['results'], 1):
+            content += f"Game {i}: vs {opp} - `{statLine}` = {val}\n"
+        content += (
+            f"\n➡️ `{playerName}` went **{stats['OA']} {stats['line']}** "
+            f"{stats['percentage']:.1f}% of the last 10 games."
+        )
+        return content, image, f"last10.{ext}"
 
-        # Create discord File and send it
-        file = discord.File(fp=image_buf, filename="last10.png")
+    await run_as_job(ctx, "last10", f"`!last10` {playerName}", work)
+
+
+
+@bot.command(name="card")
+async def card(ctx, *, args):
+    # Last 10, last 10 vs the opponent and the over/under prediction in one image
+    try:
+        (playerName, statLine, lineNumber, OA, oppTeam), high_res = _split_args(args, 5)
+        lineNumber = float(lineNumber)
+        oppTeam = oppTeam.upper()
+    except Exception:
         await ctx.send(
-            content=(
-                f"📊 **Last 10 games for `{playerName}` – `{statLine.title()}`**\n"
-                f"{playerName} went **{stats['OA']} {stats['line']}** "
-                f"{stats['percentage']:.1f}% of the last 10 games."
-            ),
-            file=file
+            "❌ Invalid format.\n"
+            "Use: `Player Name; Stat Line; Line Number; Over/Under; Opponent Team` (add `; hd` for high-res)\n"
+            "Example: `Bijan Robinson; rushing yards; 85.5; over; KC`"
         )
+        return
 
+    try:
+        with stage("data_load"):
+            facts = await asyncio.to_thread(history_facts)
     except Exception as e:
-        await ctx.send(f"📉 Could not generate graph: {e}")
+        await ctx.send(f"❌ Failed to load NFL data: {e}")
+        return
 
-    # Format response
-    response = f"**Last 10 games for {playerName} - `{statLine.title()}`**\n"
-    
-    if 'results' in stats:
-        for i, (opp, val) in enumerate(stats['results'], 1):
-            response += f"Game {i}: vs {opp} - `{statLine}` = {val}\n"
+    if not facts.has_player(playerName):
+        suggestions = [p for p in facts.players if playerName.lower() in p.lower()]
+        suggestion_msg = "\nMaybe you meant:\n" + "\n".join(suggestions[:5]) if suggestions else ""
+        await ctx.send(f"❌ Player `{playerName}` not found.{suggestion_msg}")
+        return
+    if not facts.has_stat(statLine.lower().replace(' ', '_')):
+        await ctx.send(f"❌ `{statLine}` is not a valid stat.")
+        return
+    if OA.lower() not in ['over', 'under']:
+        await ctx.send("❌ Please specify `over` or `under` as the fourth argument.")
+        return
 
-    response += (
-        f"\n➡️ `{playerName}` went **{stats['OA']} {stats['line']}** "
-        f"{stats['percentage']:.1f}% of the last 10 games."
-    )
+    async def work(job):
+        job.report("reading game history + prediction")
+        stats = await compute.call("prop_card", playerName, statLine, lineNumber, OA, oppTeam)
 
-    await ctx.send(response)
+        job.report("rendering card")
+        image, ext = await render_chart(card_spec(stats, playerName, statLine, oppTeam), high_res=high_res)
+
+        pred = stats['prediction']
+        content = (
+            f"🃏 **{playerName} – `{statLine.title()}` {stats['OA']} {stats['line']} vs {oppTeam}**\n"
+            f"Last 10: {stats['last10']['percentage']:.0f}% · "
+            f"vs {oppTeam}: {stats['vs_team']['percentage']:.0f}% ({len(stats['vs_team']['results'])} games) · "
+            f"Model: **{pred.decision}** ({pred.over_probability:.1%} over)"
+        )
+        return content, image, f"card.{ext}"
 
+    await run_as_job(ctx, "card", f"`!card` {playerName} vs {oppTeam}", work)
 
+def _parse_season_range(text):
+    """'2024' -> [2024]; '2018-2024' -> [2018, ..., 2024]."""
+    first, _, last = text.partition("-")
+    first, last = int(first), int(last or first)
+    if first > last:
+        first, last = last, first
+    return list(range(first, last + 1))
 
 @bot.command(name="nflstats")
-async def nfl_stats(ctx, team_abbr: str):
-    season = 2024
+async def nfl_stats(ctx, team_abbr: str, seasons: str = "2024"):
+    # !nflstats KC            -> 2024
+    # !nflstats KC 2018-2024  -> combined + season-by-season trend
     team = team_abbr.upper()
+    try:
+        season_list = _parse_season_range(seasons)
+    except ValueError:
+        await ctx.send("❌ Seasons must be a year or a range, e.g. `2024` or `2018-2024`.")
+        return
+    if season_list[0] < 1999 or season_list[-1] > CURRENT_SEASON:
+        await ctx.send(f"❌ Play-by-play is available for 1999-{CURRENT_SEASON}.")
+        return
+
+    # Streams one season (one stored week) at a time, as a background job
+    async def work(job):
+        job.report(f"aggregating {len(season_list)} season{'s' if len(season_list) > 1 else ''}")
+        msg = await compute.call("team_stats", team, season_list)
+        if msg is None:
+            all_teams = await compute.call("team_names", season_list[-1])
+            return f"Team '{team}' not found. Available teams: {', '.join(all_teams)}", None, None
+        return msg, None, None
+
+    await run_as_job(ctx, "nflstats", f"`!nflstats` {team} {seasons}", work)
+
+@bot.command(name="snapshot")
+@commands.is_owner()
+async def snapshot_command(ctx, season: int = CURRENT_SEASON):
+    # Save the warmed season so the next startup restores it instead of rebuilding
+    from snapshot import save_snapshot
+
+    start_time = time.time()
+    try:
+        path = await asyncio.to_thread(lambda: save_snapshot(get_context(season)))
+    except Exception as e:
+        await ctx.send(f"⚠️ Snapshot failed: {e}")
+        return
+    await ctx.send(f"💾 Saved {season} snapshot to `{path}` in {time.time() - start_time:.1f}s")
 
-    pbp = load_data(season)
-    exists, all_teams = check_team_exists(pbp, team)
-    if not exists:
-        await ctx.send(f"Team '{team}' not found. Available teams: {', '.join(all_teams)}")
+async def sync_data(season):
+    """
+    Write the season's new / re-published weeks to the store once, then fold them into
+    this process's caches and every compute worker's. Returns (summary, invalidated
+    keys here, worker failures).
+    """
+    async with _sync_lock:
+        changes = await asyncio.to_thread(fetch_changes, season)
+        invalidated = await asyncio.to_thread(apply_changes, changes)
+        results = await compute.broadcast("apply_sync", changes)
+    return changes.summary, invalidated, [r for r in results if isinstance(r, BaseException)]
+
+async def _sync_periodically():
+    while True:
+        await asyncio.sleep(SYNC_MINUTES * 60)
+        try:
+            summary, invalidated, failed = await sync_data(CURRENT_SEASON)
+        except Exception as e:
+            print(f"Scheduled sync failed: {e.__class__.__name__}: {e}")
+            continue
+        print(f"Scheduled sync of {CURRENT_SEASON}: {summary['pbp_rows']} pbp / {summary['weekly_rows']} weekly rows, "
+              f"{len(invalidated)} artifacts invalidated" + (f", {len(failed)} worker(s) failed" if failed else ""))
+
+@bot.command(name="sync")
+@commands.is_owner()
+async def sync_command(ctx, season: int = CURRENT_SEASON):
+    # Pull new / corrected weeks into the store and every serving process without a restart
+    start_time = time.time()
+    try:
+        summary, invalidated, failed = await sync_data(season)
+    except Exception as e:
+        await ctx.send(f"⚠️ Sync failed: {e}")
         return
+    changed = summary["pbp_new_weeks"] + summary["pbp_republished_weeks"]
+    weekly = summary["weekly_new_weeks"] + summary["weekly_republished_weeks"]
+    msg = (f"🔁 Synced {season} in {time.time() - start_time:.1f}s: pbp weeks {changed or 'none'}, "
+           f"weekly weeks {weekly or 'none'}; {len(invalidated)} cached artifacts invalidated")
+    if failed:
+        msg += f"\n⚠️ {len(failed)} compute worker(s) didn't apply it: `{failed[0]}`"
+    await ctx.send(msg)
 
-    pass_rate, rush_rate = calculate_offensive_stats(pbp, team)
-    off_line_df = calculate_offensive_line_metrics(pbp)
-    defensive_df = calculate_defensive_stats(pbp)
-    user_def_row = defensive_df[defensive_df['team'] == team]
-    if user_def_row.empty:
-        await ctx.send(f"Defensive stats for team '{team}' not found.")
+@bot.command(name="workers")
+@commands.is_owner()
+async def workers_command(ctx, action: str = ""):
+    # !workers          -> compute worker status
+    # !workers restart  -> rolling restart (the gateway connection stays up)
+    if action == "restart":
+        if not compute.started:
+            await ctx.send("Compute runs in-process (BOT_COMPUTE_WORKERS=0); nothing to restart.")
+            return
+        compute.restart()
+        await ctx.send("🔄 Restarting compute workers; the current ones finish their requests first.")
         return
+    stats = compute.stats()
+    lines = [f"Compute: {stats['mode']} · {stats['calls']} calls · {stats['in_flight']} in flight · "
+             f"{stats['failures']} failed · {stats['respawns']} respawned"]
+    for w in stats["workers"]:
+        state = "retiring" if w["retiring"] else "ready" if w["ready"] else "warming"
+        lines.append(f"#{w['index']} pid {w['pid']} — {state}, {w['served']} served")
+    await ctx.send("\n".join(lines))
+
+def _mb(size):
+    return "?" if size is None else f"{size / 2**20:,.0f} MB"
+
+def _ago(timestamp):
+    return f"<t:{int(timestamp)}:R>" if timestamp else "never"
+
+def _perf_snapshot():
+    # Everything here may touch disk or walk the caches, so it runs off the event loop
+    return {
+        "caches": {"derived": derived_cache.stats(), "result": result_cache.stats(), "chart": chart_cache.stats()},
+        "usage": derived_cache.usage_by_dataset(),
+        "rss": rss_bytes(),
+        "stored": {store.dataset: store.last_written(CURRENT_SEASON) for store in (pbp_store, weekly_store)},
+    }
+
+@bot.command(name="perf")
+@commands.is_owner()
+async def perf_command(ctx):
+    # Live health for game days: latency, caches, memory, queues, workers, data freshness
+    snap = await asyncio.to_thread(_perf_snapshot)
+    warm = warm_up_state()
+    jobs, sched, workers = job_queue.stats(), scheduler.stats(), compute.stats()
+
+    healthy = warm["state"] == "ready" and compute.is_ready() and loop_lag.last < watchdog.threshold
+    embed = discord.Embed(
+        title="Bot performance",
+        description=f"Warm-up: {warm['state']}" + (f" ({warm['error']})" if warm["error"] else ""),
+        color=discord.Color.green() if healthy else discord.Color.orange() if warm["state"] != "failed" else discord.Color.red()
+    )
 
-    # Calculate adjusted rush defense metric similarly if you want
-    adjusted_metric, bias_factor = adjusted_rush_defense_metric(team, defensive_df)
-
-    # Format your output nicely
-    msg = (
-        f"**{team} Stats for {season} Season:**\n"
-        f"Pass Rate: {pass_rate:.2%}\n"
-        f"Rush Rate: {rush_rate:.2%}\n"
-        f"Offensive Line Metric: {off_line_df.loc[team, 'off_line_metric']:.4f}\n"
-        f"Rush Yards Allowed: {int(user_def_row['rush_yards_allowed'].values[0])}\n"
-        f"Adjusted Rush Defense Metric: {adjusted_metric:.2f}\n"
+    rows = metrics.summary("command_seconds", by=("command",))[:8]
+    embed.add_field(
+        name="Latency (p50 / p95 / p99)",
+        value="\n".join(f"`!{r['command']}` {r['p50']:.2f}s / {r['p95']:.2f}s / {r['p99']:.2f}s ({r['count']}×)"
+                        for r in rows) or "no commands yet",
+        inline=False
     )
-    await ctx.send(msg)
+
+    lines = []
+    for name, s in snap["caches"].items():
+        lookups = s["hits"] + s["misses"]
+        size = s["resident_bytes"] if name == "derived" else s["bytes"]
+        limit = s["budget_bytes"] if name == "derived" else s["max_bytes"]
+        hit_rate = f"{s['hits'] / lookups:.0%} hit" if lookups else "no lookups"
+        lines.append(f"{name}: {_mb(size)} / {_mb(limit)} · {hit_rate} · {s['evictions']} evicted")
+    embed.add_field(name="Caches", value="\n".join(lines), inline=False)
+
+    usage = sorted(snap["usage"].items(), key=lambda kv: -kv[1])[:8]
+    embed.add_field(
+        name=f"Memory (process {_mb(snap['rss'])})",
+        value="\n".join(f"{dataset} {season}: {_mb(size)}" for (dataset, season), size in usage) or "nothing cached",
+        inline=False
+    )
+
+    queued = sum(states[QUEUED] for states in jobs["active"].values())
+    running = sum(states[RUNNING] for states in jobs["active"].values())
+    embed.add_field(
+        name="Queues",
+        value=(f"Jobs: {queued} queued, {running} running\n"
+               f"Compute slots: {sum(sched['running'].values())}/{sched['slots']} in use, "
+               f"{sum(sched['queued'].values())} waiting · {sched['rejected']} rate-limited"),
+        inline=True
+    )
+
+    live = [w for w in workers["workers"] if w["alive"] and not w["retiring"]]
+    if workers["mode"] == "processes":
+        busy = sum(1 for w in live if w["busy"])
+        utilization = f"{busy}/{len(live)} busy ({busy / len(live):.0%})" if live else "no live workers"
+    else:
+        utilization = f"in-process, {workers['in_flight']} running"
+    embed.add_field(
+        name="Compute workers",
+        value=f"{utilization}\n{workers['calls']} calls · {workers['failures']} failed · {workers['respawns']} respawned",
+        inline=True
+    )
+
+    stalls = watchdog.stats()
+    worst = next(iter(stalls["by_where"]), None)
+    embed.add_field(
+        name="Event loop",
+        value=(f"Lag {loop_lag.last * 1000:.0f} ms (max {loop_lag.max * 1000:.0f} ms)\n"
+               f"{stalls['stalls']} stalls" + (f", most in `{worst}`" if worst else "")),
+        inline=True
+    )
+
+    embed.add_field(
+        name=f"Data ({CURRENT_SEASON})",
+        value="\n".join([f"{dataset} stored {_ago(ts)}" for dataset, ts in snap["stored"].items()]
+                        + [f"Loaded {_ago(warm['finished_at'])} in {warm['seconds']}s" if warm["finished_at"] else "Not loaded yet"]),
+        inline=False
+    )
+
+    with stage("send"):
+        await ctx.send(embed=embed)
+
+@bot.command(name="profile")
+@commands.is_owner()
+async def profile_command(ctx, *, command_line: str):
+    # !profile h2h Player; stat; line; over; KC          -> cProfile, top functions by cumulative time
+    # !profile memory h2h Player; stat; line; over; KC   -> tracemalloc, peak memory by line
+    mode, _, rest = command_line.partition(" ")
+    if mode.lower() in MODES:
+        mode = mode.lower()
+    else:
+        mode, rest = CPU, command_line
+    message = copy.copy(ctx.message)
+    message.content = ctx.prefix + rest.strip().removeprefix(ctx.prefix)
+    inner = await bot.get_context(message)
+    if inner.command is None or inner.command is ctx.command:
+        await ctx.send("❌ Use: `!profile [memory] <command> <args>`, e.g. `!profile h2h Bijan Robinson; rushing yards; 85.5; over; KC`")
+        return
+
+    newest_job = max(job_queue.jobs, default=0)
+    with profile_requests(mode) as session:
+        await bot.invoke(inner)
+        # Job commands return once queued; their tasks carry the session, so wait for them
+        started = [job.task for job in job_queue.active(owner=ctx.author.id) if job.id > newest_job]
+        if started:
+            await asyncio.wait(started)
+
+    if not session.reports:
+        await ctx.send(f"🔬 `!{inner.command.name}` made no compute calls to profile.")
+        return
+    report = discord.File(fp=io.BytesIO(session.text().encode()), filename=f"profile-{inner.command.name}-{mode}.txt")
+    with stage("send"):
+        await ctx.send(f"🔬 {mode} profile of `!{inner.command.name}`: {len(session.reports)} compute call(s)", file=report)
 
 # Run your bot
-bot.run(os.getenv("DISCORD_BOT_TOKEN"))
+if __name__ == "__main__":
+    bot.run(os.getenv("DISCORD_BOT_TOKEN"))
@@ -0,0 +1,303 @@
+# fact_table.py
+
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from data_store import store_available, weekly_store
+from derived_cache import derived_cache, inputs, loading
+from tracing import span
+
+# Seasons kept in the shared history table (same span the h2h lookups search)
+HISTORY_SEASONS: Tuple[int, ...] = tuple(range(2000, 2025))
+
+# Seasons built first while the history table isn't loaded (enough for most last-10 lookups)
+RECENT_SEASONS: Tuple[int, ...] = HISTORY_SEASONS[-2:]
+
+# Ratio stats built from two counting columns: name -> (numerator, denominator, scale)
+# Mirrors nfl_player_stats_v2.custom_stats (0 when the denominator is 0)
+DERIVED_STATS: Dict[str, Tuple[str, str, float]] = {
+    "completion_percentage": ("completions", "attempts", 100.0),
+    "yards_per_carry": ("rushing_yards", "carries", 1.0),
+    "yards_per_reception": ("receiving_yards", "receptions", 1.0),
+}
+
+# Columns that are keys, not stats
+_KEY_COLUMNS = ("season", "week")
+
+
+# ---------- Player slice
+
+class GameSlice:
+    """
+    One player's games inside a PlayerGameFacts table, oldest first.
+    `rows` is a slice (a whole player) or an index array (a filtered subset).
+    """
+
+    def __init__(self, facts: "PlayerGameFacts", rows):
+        self.facts = facts
+        self.rows = rows
+
+    def __len__(self) -> int:
+        if isinstance(self.rows, slice):
+            return self.rows.stop - self.rows.start
+        return len(self.rows)
+
+    @property
+    def empty(self) -> bool:
+        return len(self) == 0
+
+    @property
+    def seasons(self) -> np.ndarray:
+        return self.facts.season[self.rows]
+
+    @property
+    def weeks(self) -> np.ndarray:
+        return self.facts.week[self.rows]
+
+    def opponents(self) -> List[str]:
+        return self.facts.decode_teams(self.facts.opponent[self.rows])
+
+    def teams(self) -> List[str]:
+        return self.facts.decode_teams(self.facts.team[self.rows])
+
+    def positions(self) -> List[str]:
+        codes = self.facts.position[self.rows]
+        return [str(self.facts.positions[c]) for c in codes if c >= 0]
+
+    def labels(self) -> List[str]:
+        return [f"Wk {w} {s}" for s, w in zip(self.seasons.tolist(), self.weeks.tolist())]
+
+    def stat(self, name: str) -> np.ndarray:
+        return self.facts.stat_values(name, self.rows)
+
+    def stat_list(self, name: str) -> List[float]:
+        """Stat values as plain Python numbers (whole numbers come back as int)."""
+        out = []
+        for v in self.stat(name).tolist():
+            out.append(int(v) if float(v).is_integer() else round(v, 4))
+        return out
+
+    def most_common_team(self) -> Optional[str]:
+        teams = [t for t in self.teams() if t]
+        return Counter(teams).most_common(1)[0][0] if teams else None
+
+    def most_common_position(self) -> Optional[str]:
+        positions = self.positions()
+        return Counter(positions).most_common(1)[0][0] if positions else None
+
+    def between(self, first_season: int, last_season: int) -> "GameSlice":
+        """Games with first_season <= season <= last_season."""
+        if isinstance(self.rows, slice):
+            lo, hi = np.searchsorted(self.seasons, [first_season, last_season + 1])
+            start = self.rows.start
+            return GameSlice(self.facts, slice(start + int(lo), start + int(hi)))
+        s = self.seasons
+        return GameSlice(self.facts, self.rows[(s >= first_season) & (s <= last_season)])
+
+    def vs(self, opp: str) -> "GameSlice":
+        """Games against `opp`."""
+        opp_code = self.facts.team_index.get(opp)
+        if opp_code is None or self.empty:
+            return GameSlice(self.facts, np.empty(0, dtype=np.int64))
+        if isinstance(self.rows, slice):
+            return GameSlice(self.facts, np.flatnonzero(self.facts.opponent[self.rows] == opp_code) + self.rows.start)
+        return GameSlice(self.facts, self.rows[self.facts.opponent[self.rows] == opp_code])
+
+    def tail(self, n: int) -> "GameSlice":
+        """The n most recent games (still oldest first)."""
+        if isinstance(self.rows, slice):
+            return GameSlice(self.facts, slice(max(self.rows.start, self.rows.stop - n), self.rows.stop))
+        return GameSlice(self.facts, self.rows[-n:] if n > 0 else self.rows[:0])
+
+
+# ---------- Fact table
+
+class PlayerGameFacts:
+    """
+    Player-game rows from nfl weekly data with players, teams and stats integer-coded.
+
+    Rows are sorted by (player, season, week); a player's games are the CSR range
+    offsets[p]:offsets[p + 1], so a lookup is two array reads instead of a string
+    comparison over every row. Stats are stored as one contiguous float32 array each.
+    """
+
+    def __init__(self, weekly: pd.DataFrame):
+        frame = weekly[weekly["player_display_name"].notna()]
+
+        player_codes, players = pd.factorize(frame["player_display_name"], sort=True)
+        self.players = np.asarray(players, dtype=object)
+        self.player_index: Dict[str, int] = {name: i for i, name in enumerate(self.players)}
+
+        team_names = set(frame["opponent_team"].dropna()) | set(frame["recent_team"].dropna())
+        self.teams = np.asarray(sorted(team_names), dtype=object)
+        self.team_index: Dict[str, int] = {team: i for i, team in enumerate(self.teams)}
+        teams = pd.Index(self.teams)
+
+        season = frame["season"].to_numpy(dtype=np.int16)
+        week = frame["week"].to_numpy(dtype=np.int16)
+        order = np.lexsort((week, season, player_codes))
+
+        counts = np.bincount(player_codes, minlength=len(self.players))
+        self.offsets = np.zeros(len(self.players) + 1, dtype=np.int64)
+        np.cumsum(counts, out=self.offsets[1:])
+
+        self.season = np.ascontiguousarray(season[order])
+        self.week = np.ascontiguousarray(week[order])
+        self.opponent = teams.get_indexer(frame["opponent_team"]).astype(np.int16)[order]
+        self.team = teams.get_indexer(frame["recent_team"]).astype(np.int16)[order]
+
+        if "position" in frame.columns:
+            position_codes, positions = pd.factorize(frame["position"])
+        else:
+            position_codes, positions = np.full(len(frame), -1), []
+        self.positions = np.asarray(positions, dtype=object)
+        self.position = position_codes.astype(np.int8)[order]
+
+        self.stat_names: List[str] = [
+            c for c in frame.columns
+            if c not in _KEY_COLUMNS and pd.api.types.is_numeric_dtype(frame[c])
+        ]
+        self.stat_index: Dict[str, int] = {name: i for i, name in enumerate(self.stat_names)}
+        self.values = np.empty((len(self.stat_names), len(frame)), dtype=np.float32)
+        for i, name in enumerate(self.stat_names):
+            self.values[i] = frame[name].to_numpy(dtype=np.float32, na_value=np.nan)[order]
+
+    # Arrays and name tables that fully describe the table (used by snapshot.py)
+    _ARRAYS = ("offsets", "season", "week", "opponent", "team", "position", "values")
+    _NAMES = ("players", "teams", "positions", "stat_names")
+
+    def to_arrays(self) -> Tuple[Dict[str, np.ndarray], Dict[str, List[str]]]:
+        arrays = {name: getattr(self, name) for name in self._ARRAYS}
+        names = {name: [str(x) for x in getattr(self, name)] for name in self._NAMES}
+        return arrays, names
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], names: Dict[str, List[str]]) -> "PlayerGameFacts":
+        """Rebuild from to_arrays() output without re-reading weekly data (arrays may be memory-mapped)."""
+        facts = cls.__new__(cls)
+        for name in cls._ARRAYS:
+            setattr(facts, name, arrays[name])
+        facts.players = np.asarray(names["players"], dtype=object)
+        facts.teams = np.asarray(names["teams"], dtype=object)
+        facts.positions = np.asarray(names["positions"], dtype=object)
+        facts.stat_names = list(names["stat_names"])
+        facts.player_index = {name: i for i, name in enumerate(facts.players)}
+        facts.team_index = {team: i for i, team in enumerate(facts.teams)}
+        facts.stat_index = {name: i for i, name in enumerate(facts.stat_names)}
+        return facts
+
+    def __len__(self) -> int:
+        return len(self.season)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.offsets, self.season, self.week, self.opponent, self.team, self.position, self.values)
+        return int(sum(a.nbytes for a in arrays))
+
+    def has_player(self, player: str) -> bool:
+        with span("resolve_player", player=player):
+            return player in self.player_index
+
+    def has_stat(self, name: str) -> bool:
+        return name in self.stat_index or name in DERIVED_STATS
+
+    def decode_teams(self, codes: np.ndarray) -> List[str]:
+        return [str(self.teams[c]) if c >= 0 else "" for c in codes.tolist()]
+
+    def games_for(self, player: str) -> GameSlice:
+        code = self.player_index.get(player)
+        if code is None:
+            return GameSlice(self, slice(0, 0))
+        return GameSlice(self, slice(int(self.offsets[code]), int(self.offsets[code + 1])))
+
+    def games_vs(self, player: str, opp: str) -> GameSlice:
+        return self.games_for(player).vs(opp)
+
+    def stat_values(self, name: str, rows) -> np.ndarray:
+        idx = self.stat_index.get(name)
+        if idx is not None:
+            return self.values[idx, rows]
+        if name in DERIVED_STATS:
+            num_name, den_name, scale = DERIVED_STATS[name]
+            num = self.stat_values(num_name, rows)
+            den = self.stat_values(den_name, rows)
+            out = np.zeros(len(num), dtype=np.float32)
+            np.divide(num * scale, den, out=out, where=den > 0)
+            return out
+        raise KeyError(name)
+
+
+# ---------- Loading
+
+def load_weekly(seasons: Iterable[int]) -> pd.DataFrame:
+    """
+    Weekly player stats for `seasons`, read memory-mapped from the local store.
+    Seasons not stored yet are downloaded once and written there.
+    """
+    import nfl_data_py as nfl
+    seasons = sorted(set(seasons))
+    if not store_available():
+        with loading("nfl.import_weekly_data"):
+            return nfl.import_weekly_data(seasons)
+
+    missing = [s for s in seasons if not weekly_store.has_season(s)]
+    if missing:
+        with loading("nfl.import_weekly_data"):
+            fetched = nfl.import_weekly_data(missing)
+        for season, part in fetched.groupby("season"):
+            weekly_store.write_weeks(int(season), part)
+
+    frames = [weekly_store.read_season(s) for s in seasons if weekly_store.has_season(s)]
+    if not frames:
+        raise ValueError(f"No weekly data available for seasons {seasons}")
+    return pd.concat(frames, ignore_index=True)
+
+
+def load_player_game_facts(seasons: Iterable[int]) -> PlayerGameFacts:
+    """Build the fact table for the given seasons once; rebuilt only after one of them changes."""
+    key = tuple(sorted(set(seasons)))
+    return derived_cache.cached(("facts", key), inputs(key), lambda: PlayerGameFacts(load_weekly(key)))
+
+
+def history_facts() -> PlayerGameFacts:
+    return load_player_game_facts(HISTORY_SEASONS)
+
+
+_history_thread: Optional[threading.Thread] = None
+_history_lock = threading.Lock()
+
+
+def _extend_history() -> None:
+    try:
+        history_facts()
+    except Exception as e:
+        print(f"Building the history fact table failed ({e.__class__.__name__}: {e})")
+        return
+    derived_cache.discard(("facts", RECENT_SEASONS))  # the history table covers it now
+
+
+def recent_facts() -> PlayerGameFacts:
+    """
+    The history table when it is loaded; otherwise a table of RECENT_SEASONS only, with the
+    other seasons built in the background. Callers that find too few games there (or no
+    player) fall back to history_facts().
+    """
+    global _history_thread
+    if derived_cache.peek(("facts", HISTORY_SEASONS)) is not None:
+        return history_facts()
+    with _history_lock:
+        if _history_thread is None or not _history_thread.is_alive():
+            _history_thread = threading.Thread(target=_extend_history, name="history-facts", daemon=True)
+            _history_thread.start()
+    return load_player_game_facts(RECENT_SEASONS)
+
+
+def season_facts(season: int) -> PlayerGameFacts:
+    """Fact table containing `season`; callers narrow with GameSlice.between(season, season)."""
+    if season in HISTORY_SEASONS:
+        return history_facts()
+    return load_player_game_facts([season])
@@ -0,0 +1,230 @@
+# http_server.py
+#
+# Embedded HTTP server run alongside the bot (a Flask app on a daemon thread):
+#
+#   GET /metrics  Prometheus text format: command / stage latency histograms, cache hit
+#                 rates and sizes, resident memory per data set, job / scheduler queue
+#                 depth, compute workers and event-loop lag.
+#   GET /healthz  liveness: 503 if the warm-up failed or the event loop stopped answering.
+#   GET /readyz   readiness: 200 once the season context (with workers: the front end's
+#                 fact table and at least one worker) is warm.
+#   /api/...      JSON API over the bot's engines (see rest_api.py).
+#
+# Binds to BOT_HTTP_HOST:BOT_HTTP_PORT (127.0.0.1:8080 by default); port 0 disables it.
+
+import asyncio
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from flask import Flask, Response, jsonify
+
+from chart_cache import chart_cache
+from compute_workers import compute
+from derived_cache import derived_cache
+from jobs import job_queue
+from metrics import loop_lag, metrics
+from rest_api import api, bind_loop
+from result_cache import result_cache
+from scheduler import scheduler
+from season_context import is_ready, warm_up_state
+
+HTTP_HOST = os.getenv("BOT_HTTP_HOST", "127.0.0.1")
+HTTP_PORT = int(os.getenv("BOT_HTTP_PORT", "8080"))
+
+# Seconds to wait for the event loop to answer before calling it unresponsive
+LOOP_TIMEOUT = 2.0
+
+PREFIX = "nflbot_"
+
+app = Flask(__name__)
+app.register_blueprint(api)
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_server = None
+
+
+# ---------- State owned by the event loop
+
+async def _loop_stats() -> Dict[str, Any]:
+    return {"jobs": job_queue.stats(), "scheduler": scheduler.stats()}
+
+
+def _from_loop() -> Optional[Dict[str, Any]]:
+    """Job / scheduler stats read on the bot's loop (their dicts aren't thread-safe); None if it doesn't answer."""
+    if _loop is None or not _loop.is_running():
+        return None
+    try:
+        return asyncio.run_coroutine_threadsafe(_loop_stats(), _loop).result(timeout=LOOP_TIMEOUT)
+    except Exception:
+        return None
+
+
+def _ready(state: Dict[str, Any]) -> bool:
+    # With compute workers the front end only warms the fact table; the workers hold the season
+    return is_ready() and state["state"] == "ready" and compute.is_ready()
+
+
+def rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+# ---------- Prometheus text format
+
+def _fmt_labels(labels: Iterable[Tuple[str, Any]]) -> str:
+    parts = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Exposition:
+    def __init__(self):
+        self.lines: List[str] = []
+
+    def header(self, name: str, kind: str, help_text: str) -> None:
+        self.lines.append(f"# HELP {PREFIX}{name} {help_text}")
+        self.lines.append(f"# TYPE {PREFIX}{name} {kind}")
+
+    def sample(self, name: str, value: Any, labels: Iterable[Tuple[str, Any]] = ()) -> None:
+        if value is None:
+            return
+        self.lines.append(f"{PREFIX}{name}{_fmt_labels(labels)} {float(value):g}")
+
+    def gauge(self, name: str, help_text: str, values: Iterable[Tuple[Iterable[Tuple[str, Any]], Any]],
+              kind: str = "gauge") -> None:
+        self.header(name, kind, help_text)
+        for labels, value in values:
+            self.sample(name, value, labels)
+
+    def histogram(self, name: str, help_text: str) -> None:
+        self.header(name, "histogram", help_text)
+        for labels, bounds, counts, total, count in metrics.series(name):
+            cumulative = 0
+            for bound, n in zip(bounds, counts):
+                cumulative += n
+                self.sample(f"{name}_bucket", cumulative, labels + (("le", f"{bound:g}"),))
+            self.sample(f"{name}_bucket", count, labels + (("le", "+Inf"),))
+            self.sample(f"{name}_sum", total, labels)
+            self.sample(f"{name}_count", count, labels)
+
+    def text(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+
+def render_metrics() -> str:
+    out = _Exposition()
+
+    out.histogram("command_seconds", "Command latency from invocation to reply, by command, status and cache.")
+    out.histogram("stage_seconds", "Time spent per command stage, by command, stage and cache.")
+    out.histogram("loop_lag_seconds", "Event-loop lag samples.")
+    out.gauge("loop_lag_last_seconds", "Most recent event-loop lag sample.", [((), loop_lag.last)])
+    out.gauge("loop_stalls_total", "Event-loop stalls over the watchdog threshold, by blocking function.",
+              sorted(metrics.counter("loop_stalls_total").items()), "counter")
+    out.histogram("loop_stall_seconds", "How long each event-loop stall blocked the loop, by blocking function.")
+
+    caches = {
+        "derived": derived_cache.stats(),
+        "result": result_cache.stats(),
+        "chart": chart_cache.stats(),
+    }
+    out.gauge("cache_hits_total", "Cache hits.", [((("cache", c),), s["hits"]) for c, s in caches.items()], "counter")
+    out.gauge("cache_misses_total", "Cache misses.", [((("cache", c),), s["misses"]) for c, s in caches.items()], "counter")
+    out.gauge("cache_hit_ratio", "Cache hit ratio since start.", [
+        ((("cache", c),), s["hits"] / (s["hits"] + s["misses"]) if s["hits"] + s["misses"] else 0.0)
+        for c, s in caches.items()])
+    out.gauge("cache_evictions_total", "Cache evictions.", [((("cache", c),), s["evictions"]) for c, s in caches.items()], "counter")
+    out.gauge("cache_bytes", "Bytes held by each cache.", [
+        ((("cache", "derived"),), caches["derived"]["resident_bytes"]),
+        ((("cache", "result"),), caches["result"]["bytes"]),
+        ((("cache", "chart"),), caches["chart"]["bytes"]),
+    ])
+    out.gauge("cache_budget_bytes", "Size limit of each cache.", [
+        ((("cache", "derived"),), caches["derived"]["budget_bytes"]),
+        ((("cache", "result"),), caches["result"]["max_bytes"]),
+        ((("cache", "chart"),), caches["chart"]["max_bytes"]),
+    ])
+
+    out.gauge("resident_bytes", "Resident bytes of cached data, per data set and season.", [
+        ((("dataset", dataset), ("season", season)), size)
+        for (dataset, season), size in sorted(derived_cache.usage_by_dataset().items())])
+    out.gauge("process_resident_memory_bytes", "Resident set size of the bot process.", [((), rss_bytes())])
+
+    loop_stats = _from_loop()
+    out.gauge("loop_responsive", "1 if the event loop answered within the timeout.",
+              [((), 1 if loop_stats is not None else 0)])
+    if loop_stats is not None:
+        jobs = []
+        for job_type, states in loop_stats["jobs"]["active"].items():
+            jobs.extend(((("type", job_type), ("state", state)), n) for state, n in states.items())
+        out.gauge("jobs", "Active background jobs by type and state.", jobs)
+        out.gauge("jobs_finished_total", "Finished jobs by final state.", [
+            ((("state", state),), n) for state, n in loop_stats["jobs"]["finished"].items()], "counter")
+        sched = loop_stats["scheduler"]
+        out.gauge("scheduler_queued", "Requests waiting for a compute slot, by cost class.", [
+            ((("class", c),), n) for c, n in sched["queued"].items()])
+        out.gauge("scheduler_running", "Requests holding a compute slot, by cost class.", [
+            ((("class", c),), n) for c, n in sched["running"].items()])
+        out.gauge("scheduler_slots", "Compute slots.", [((), sched["slots"])])
+        out.gauge("scheduler_rejected_total", "Requests rejected by rate limits.", [((), sched["rejected"])], "counter")
+
+    workers = compute.stats()
+    out.gauge("compute_in_flight", "Compute requests sent to workers and not answered yet.", [((), workers["in_flight"])])
+    out.gauge("compute_workers", "Live compute worker processes.", [
+        ((), sum(1 for w in workers["workers"] if w["alive"]))])
+    out.gauge("compute_respawns_total", "Compute workers replaced after dying.", [((), workers["respawns"])], "counter")
+
+    state = warm_up_state()
+    out.gauge("ready", "1 once the season context (and, with workers, a compute worker) is warm.",
+              [((), 1 if _ready(state) else 0)])
+    out.gauge("warm_up_seconds", "Duration of the last warm-up.", [((), state["seconds"])])
+    return out.text()
+
+
+# ---------- Routes
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/healthz")
+def liveness():
+    state = warm_up_state()
+    responsive = _from_loop() is not None
+    alive = state["state"] != "failed" and responsive
+    body = {"status": "ok" if alive else "unhealthy", "warm_up": state["state"],
+            "loop_responsive": responsive, "loop_lag_seconds": round(loop_lag.last, 4)}
+    if state["error"]:
+        body["error"] = state["error"]
+    return jsonify(body), 200 if alive else 503
+
+
+@app.route("/readyz")
+def readiness():
+    state = warm_up_state()
+    ready = _ready(state)
+    return jsonify({"ready": ready, "compute_ready": compute.is_ready(), **state}), 200 if ready else 503
+
+
+def start_http_server(loop: asyncio.AbstractEventLoop, host: str = HTTP_HOST, port: int = HTTP_PORT) -> None:
+    """Serve the app on a daemon thread (no-op if disabled or already running)."""
+    global _loop, _server
+    _loop = loop
+    bind_loop(loop)
+    if port <= 0 or _server is not None:
+        return
+    from werkzeug.serving import make_server
+
+    try:
+        _server = make_server(host, port, app, threaded=True)
+    except OSError as e:
+        print(f"HTTP server not started on {host}:{port}: {e}")
+        return
+    threading.Thread(target=_server.serve_forever, name="http-server", daemon=True).start()
+    print(f"HTTP metrics / health on http://{host}:{port}")
@@ -0,0 +1,199 @@
+# ingest.py
+#
+# Incremental weekly ingestion: append only new (or changed) weeks of pbp and weekly
+# player data to the local store, and fold just those rows into the derived tables.
+#
+# A sync has two halves: fetch_changes downloads the season and writes the changed weeks
+# to the shared store (once per box), and apply_changes folds them into one process's
+# caches - the bot runs it in the front end and broadcasts it to every compute worker
+# (!sync, or every BOT_SYNC_MINUTES).
+#
+#   python ingest.py 2024
+
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+
+import pandas as pd
+
+import nfl_api
+from data_store import SeasonStore, content_hash, pbp_store, store_available, to_store_table, weekly_store
+from derived_cache import derived_cache, inputs
+
+
+# ---------- Mergeable aggregates
+
+class SeasonAggregates:
+    """
+    Team tables for one season kept as mergeable partial sums, so a new week is added
+    to the totals (and a re-published week is subtracted then re-added) instead of
+    rescanning the season's pbp. The prediction's defense and O-line factors read them.
+
+      defensive   - per-team yards / points allowed (nfl_api.defensive_partials)
+      oline       - per-team sacks / TFL / rush yards (nfl_api.offensive_line_partials)
+    """
+
+    def __init__(self, season: int):
+        self.season = season
+        self.weeks: List[int] = []
+        self.defensive: Optional[pd.DataFrame] = None
+        self.oline: Optional[pd.DataFrame] = None
+        self.built_at = time.time()   # store writes before this are already included
+
+    @classmethod
+    def from_store(cls, season: int) -> "SeasonAggregates":
+        """Build once from everything stored for the season."""
+        aggregates = cls(season)
+        aggregates.update(pbp_store.read_season(season))
+        return aggregates
+
+    def update(self, pbp_rows: Optional[pd.DataFrame], removed_pbp: Optional[pd.DataFrame] = None) -> None:
+        """Fold new rows into the totals; `removed_pbp` are superseded rows of re-published weeks."""
+        if removed_pbp is not None and not removed_pbp.empty:
+            self.defensive = nfl_api.merge_partials(self.defensive, -nfl_api.defensive_partials(removed_pbp))
+            self.oline = nfl_api.merge_partials(self.oline, -nfl_api.offensive_line_partials(removed_pbp))
+        if pbp_rows is not None and not pbp_rows.empty:
+            self.defensive = nfl_api.merge_partials(self.defensive, nfl_api.defensive_partials(pbp_rows))
+            self.oline = nfl_api.merge_partials(self.oline, nfl_api.offensive_line_partials(pbp_rows))
+            self.weeks = sorted(set(self.weeks) | set(int(w) for w in pbp_rows["week"].unique()))
+
+    # ----- finalized views
+
+    def defensive_df(self) -> Optional[pd.DataFrame]:
+        return None if self.defensive is None else nfl_api.finalize_defensive_stats(self.defensive)
+
+    def off_line_df(self) -> Optional[pd.DataFrame]:
+        return None if self.oline is None else nfl_api.finalize_offensive_line_metrics(self.oline)
+
+
+def season_aggregates(season: int) -> SeasonAggregates:
+    """Aggregates for a season, built from the store once and then kept current by apply_changes."""
+    return derived_cache.cached(("aggregates", season), inputs([season]), lambda: SeasonAggregates.from_store(season))
+
+
+def stored_aggregates(season: int) -> Optional[SeasonAggregates]:
+    """The season's aggregates when its pbp is in the local store, else None (callers scan pbp)."""
+    if not store_available() or not pbp_store.has_season(season):
+        return None
+    return season_aggregates(season)
+
+
+# ---------- Sync
+
+def _changed_weeks(store: SeasonStore, season: int, remote: pd.DataFrame) -> Tuple[List[int], List[int]]:
+    """
+    (new_weeks, republished_weeks): weeks not stored yet, and stored weeks whose rows
+    changed upstream - a different row count (e.g. a week synced before Monday night
+    finished) or the same rows with corrected values (stat corrections).
+    """
+    stored = set(store.weeks(season))
+    new_weeks, republished = [], []
+    for week, part in remote.groupby("week", observed=True):
+        week = int(week)
+        if week not in stored:
+            new_weeks.append(week)
+        else:
+            table = store.open_table(season, [week])
+            if (table is None or table.num_rows != len(part)
+                    or content_hash(table) != content_hash(to_store_table(part))):
+                republished.append(week)
+    return sorted(new_weeks), sorted(republished)
+
+
+def _sync_dataset(store: SeasonStore, season: int, remote: pd.DataFrame):
+    new_weeks, republished = _changed_weeks(store, season, remote)
+    removed = store.read_season(season, republished) if republished else None
+    changed = new_weeks + republished
+    rows = remote[remote["week"].isin(changed)]
+    if changed:
+        store.write_weeks(season, rows)
+    return rows, removed, new_weeks, republished
+
+
+def _touched(pbp_rows: pd.DataFrame, weekly_rows: pd.DataFrame):
+    """Weeks, teams and players present in the changed rows."""
+    weeks = set(int(w) for w in pbp_rows["week"].unique()) | set(int(w) for w in weekly_rows["week"].unique())
+    teams = set()
+    for frame, cols in ((pbp_rows, ("posteam", "defteam")), (weekly_rows, ("recent_team", "opponent_team"))):
+        for col in cols:
+            if col in frame.columns:
+                teams.update(str(t) for t in frame[col].dropna().unique())
+    players = set(weekly_rows["player_display_name"].dropna().unique()) if "player_display_name" in weekly_rows.columns else set()
+    return sorted(weeks), teams, players
+
+
+@dataclass
+class SyncChanges:
+    """What fetch_changes wrote to the store: enough for any process to update its caches."""
+    season: int
+    written: float                              # when the store writes finished
+    pbp_rows: pd.DataFrame                      # new / re-published pbp rows
+    removed_pbp: Optional[pd.DataFrame]         # stored rows they replaced
+    weeks: List[int] = field(default_factory=list)
+    teams: Set[str] = field(default_factory=set)
+    players: Set[str] = field(default_factory=set)
+    summary: Dict[str, object] = field(default_factory=dict)
+
+
+def fetch_changes(season: int) -> SyncChanges:
+    """
+    Download `season` and write only its new / re-published weeks of pbp and weekly data
+    to the store. nflverse publishes one file per season, so the download is still the
+    season file; everything after it touches only the changed weeks.
+    """
+    import nfl_data_py as nfl
+
+    remote_pbp = nfl_api.fetch_projected_pbp(season)
+    pbp_rows, removed_pbp, pbp_new, pbp_republished = _sync_dataset(pbp_store, season, remote_pbp)
+
+    remote_weekly = nfl.import_weekly_data([season])
+    weekly_rows, _, weekly_new, weekly_republished = _sync_dataset(weekly_store, season, remote_weekly)
+
+    changes = SyncChanges(season, time.time(), pbp_rows, removed_pbp)
+    if len(pbp_rows) or len(weekly_rows):
+        changes.weeks, changes.teams, changes.players = _touched(pbp_rows, weekly_rows)
+    changes.summary = {
+        "season": season,
+        "pbp_new_weeks": pbp_new,
+        "pbp_republished_weeks": pbp_republished,
+        "pbp_rows": len(pbp_rows),
+        "weekly_new_weeks": weekly_new,
+        "weekly_republished_weeks": weekly_republished,
+        "weekly_rows": len(weekly_rows),
+    }
+    return changes
+
+
+def apply_changes(changes: SyncChanges) -> List[Hashable]:
+    """
+    Fold a sync into this process's caches: the season aggregates (if built before the
+    write) take just the changed rows, and artifacts built from the changed weeks are
+    invalidated. Returns the invalidated keys.
+    """
+    if not changes.weeks:
+        return []
+    aggregates_key = ("aggregates", changes.season)
+    aggregates = derived_cache.peek(aggregates_key)
+    if aggregates is not None and aggregates.built_at < changes.written:
+        aggregates.update(changes.pbp_rows, changes.removed_pbp)
+        derived_cache.put(aggregates_key, aggregates)
+    keep = [aggregates_key] if aggregates is not None else []
+    return derived_cache.invalidate(changes.season, weeks=changes.weeks, teams=changes.teams,
+                                    players=changes.players, keep=keep)
+
+
+def sync_season(season: int) -> Dict[str, object]:
+    """Fetch and apply a sync in this process (the CLI; the bot also reaches its workers)."""
+    changes = fetch_changes(season)
+    invalidated = apply_changes(changes)
+    summary = dict(changes.summary, invalidated=invalidated)
+    print(f"Synced {season}: pbp weeks {summary['pbp_new_weeks'] + summary['pbp_republished_weeks'] or 'none'} "
+          f"({summary['pbp_rows']} rows), weekly weeks "
+          f"{summary['weekly_new_weeks'] + summary['weekly_republished_weeks'] or 'none'} "
+          f"({summary['weekly_rows']} rows), {len(invalidated)} cached artifacts invalidated")
+    return summary
+
+
+if __name__ == "__main__":
+    sync_season(int(sys.argv[1]) if len(sys.argv) > 1 else 2024)
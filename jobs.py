@@ -0,0 +1,177 @@
+# jobs.py
+#
+# Background job queue for long-running bot commands. A job is an async callable
+# that runs as its own task: the command replies with a placeholder right away, and
+# the job's state changes (queued -> running -> progress -> result) are pushed to an
+# update callback that edits that message. Each job type has its own concurrency
+# limit and timeout, and runs in a fair-share compute slot from scheduler.py, so a
+# burst of expensive scans can't hold every slot; any job can be cancelled by its owner. (Cancelling or timing out stops waiting on the
+# job; a computation already running in a thread finishes there and is dropped.)
+
+import asyncio
+import itertools
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from scheduler import Scheduler, scheduler as default_scheduler
+
+# Max jobs of a type running at once (the rest wait in the queue)
+JOB_LIMITS: Dict[str, int] = {
+    "last10": 4,
+    "h2h": 2,
+    "card": 2,
+    "nflstats": 1,
+}
+DEFAULT_LIMIT = 2
+
+# Seconds a job may run (including its time in the queue) before it is abandoned
+JOB_TIMEOUTS: Dict[str, float] = {
+    "last10": 60,
+    "h2h": 90,
+    "card": 120,
+    "nflstats": 600,   # cold multi-season ranges download seasons
+}
+DEFAULT_TIMEOUT = 120
+
+# Finished jobs kept for !jobs / lookups
+KEEP_FINISHED = 200
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED, TIMED_OUT = (
+    "queued", "running", "done", "failed", "cancelled", "timed out")
+FINISHED = (DONE, FAILED, CANCELLED, TIMED_OUT)
+
+
+@dataclass
+class Job:
+    id: int
+    type: str
+    owner: int
+    label: str
+    guild: Optional[int] = None
+    state: str = QUEUED
+    progress: str = ""
+    result: Any = None
+    error: Optional[str] = None
+    created: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    task: Optional[asyncio.Task] = field(default=None, repr=False)
+    _notify: Optional[Callable[[], None]] = field(default=None, repr=False)
+    _loop: Optional[asyncio.AbstractEventLoop] = field(default=None, repr=False)
+
+    def report(self, text: str) -> None:
+        """Set the progress text (safe to call from the job's worker threads)."""
+        def apply():
+            self.progress = text
+            if self._notify is not None:
+                self._notify()
+        if self._loop is None:
+            apply()
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is self._loop:
+            apply()
+        else:
+            self._loop.call_soon_threadsafe(apply)
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.time()) - self.created
+
+
+UpdateCallback = Callable[[Job], Awaitable[None]]
+
+
+class JobQueue:
+    def __init__(self, limits: Dict[str, int] = JOB_LIMITS, timeouts: Dict[str, float] = JOB_TIMEOUTS,
+                 scheduler: Scheduler = default_scheduler):
+        self.limits = limits
+        self.timeouts = timeouts
+        self.scheduler = scheduler
+        self._ids = itertools.count(1)
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.jobs: Dict[int, Job] = {}
+        self.counts: Dict[str, int] = {state: 0 for state in FINISHED}
+
+    def _semaphore(self, job_type: str) -> asyncio.Semaphore:
+        if job_type not in self._semaphores:
+            self._semaphores[job_type] = asyncio.Semaphore(self.limits.get(job_type, DEFAULT_LIMIT))
+        return self._semaphores[job_type]
+
+    def submit(self, job_type: str, owner: int, label: str,
+               work: Callable[[Job], Awaitable[Any]],
+               on_update: Optional[UpdateCallback] = None, guild: Optional[int] = None) -> Job:
+        """Queue `work(job)`; returns the Job immediately. `on_update(job)` is awaited on every change."""
+        job = Job(id=next(self._ids), type=job_type, owner=owner, label=label, guild=guild)
+        job._loop = asyncio.get_running_loop()
+        self.jobs[job.id] = job
+        job.task = asyncio.create_task(self._run(job, work, on_update), name=f"job-{job.id}-{job_type}")
+        self._prune()
+        return job
+
+    async def _run(self, job: Job, work, on_update: Optional[UpdateCallback]) -> None:
+        async def notify():
+            if on_update is None:
+                return
+            try:
+                await on_update(job)
+            except Exception as e:  # a failed message edit must not kill the job
+                print(f"Job {job.id} update failed: {e.__class__.__name__}: {e}")
+
+        job._notify = lambda: asyncio.ensure_future(notify())
+        timeout = self.timeouts.get(job.type, DEFAULT_TIMEOUT)
+        await notify()
+
+        async def run_when_admitted():
+            # Type limit first, then a fair-share compute slot (see scheduler.py)
+            async with self._semaphore(job.type), self.scheduler.slot(job.type, job.owner, job.guild):
+                job.state, job.started = RUNNING, time.time()
+                await notify()
+                return await work(job)
+
+        try:
+            job.result = await asyncio.wait_for(run_when_admitted(), timeout)
+            job.state = DONE
+        except asyncio.TimeoutError:
+            job.state, job.error = TIMED_OUT, f"took longer than {timeout:g}s"
+        except asyncio.CancelledError:
+            job.state = CANCELLED
+        except Exception as e:
+            job.state, job.error = FAILED, f"{e.__class__.__name__}: {e}"
+        finally:
+            job.finished = time.time()
+            job._notify = None
+            self.counts[job.state] = self.counts.get(job.state, 0) + 1
+        await notify()
+
+    def cancel(self, job_id: int, owner: Optional[int] = None) -> bool:
+        """Cancel a queued or running job (only the owner's, if `owner` is given)."""
+        job = self.jobs.get(job_id)
+        if job is None or job.state in FINISHED or (owner is not None and job.owner != owner):
+            return False
+        job.task.cancel()
+        return True
+
+    def active(self, owner: Optional[int] = None) -> List[Job]:
+        return [j for j in self.jobs.values()
+                if j.state not in FINISHED and (owner is None or j.owner == owner)]
+
+    def _prune(self) -> None:
+        finished = [j for j in self.jobs.values() if j.state in FINISHED]
+        for job in sorted(finished, key=lambda j: j.finished)[:-KEEP_FINISHED or None]:
+            del self.jobs[job.id]
+
+    def stats(self) -> Dict[str, Any]:
+        by_type: Dict[str, Dict[str, int]] = {}
+        for job in self.jobs.values():
+            if job.state in (QUEUED, RUNNING):
+                counts = by_type.setdefault(job.type, {QUEUED: 0, RUNNING: 0})
+                counts[job.state] += 1
+        return {"active": by_type, "finished": dict(self.counts)}
+
+
+job_queue = JobQueue()
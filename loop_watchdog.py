@@ -0,0 +1,109 @@
+# loop_watchdog.py
+#
+# Watchdog for the bot's event loop. The loop-lag sampler (metrics.LoopLag) beats every
+# LAG_INTERVAL; a watchdog thread checks the beat and, when it is more than
+# BOT_LOOP_STALL_MS late, the loop is blocked by whatever it is running: the watchdog
+# logs that code's stack (once per stall) and, when the loop gets going again, records
+# the stall under the repo function that was on top of the stack:
+#
+#   loop_stalls_total{where}     stalls over the threshold
+#   loop_stall_seconds{where}    how long each one blocked the loop
+#
+# `where` is file:function of the innermost frame from this repo, e.g.
+# "discord_bot.py:last10", which is usually the command path doing work on the loop.
+
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from metrics import loop_lag, metrics
+
+STALL_THRESHOLD = float(os.getenv("BOT_LOOP_STALL_MS", "250")) / 1000
+
+# Stalls kept for !perf
+KEEP_STALLS = 20
+
+_REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _where(frames: List[traceback.FrameSummary]) -> str:
+    """Innermost frame from this repo (not the stdlib / site-packages), as file:function."""
+    for frame in reversed(frames):
+        path = os.path.abspath(frame.filename)
+        if path.startswith(_REPO_DIR) and "site-packages" not in path and path != os.path.abspath(__file__):
+            return f"{os.path.basename(path)}:{frame.name}"
+    return f"{os.path.basename(frames[-1].filename)}:{frames[-1].name}" if frames else "unknown"
+
+
+class LoopWatchdog:
+    def __init__(self, threshold: float = STALL_THRESHOLD):
+        self.threshold = threshold
+        self.stalls: Deque[Dict[str, object]] = deque(maxlen=KEEP_STALLS)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, loop: asyncio.AbstractEventLoop) -> None:
+        """Start watching `loop` (loop_lag must be sampling on it). No-op if already started."""
+        if self._thread is not None or self.threshold <= 0:
+            return
+        self._loop = loop
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    def _task_name(self) -> Optional[str]:
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            return None
+        return task.get_name() if task is not None else None
+
+    def _watch(self) -> None:
+        stalled_beat: Optional[float] = None   # beat of the stall being tracked
+        stall: Dict[str, object] = {}
+        while True:
+            time.sleep(min(self.threshold, loop_lag.interval) / 2)
+            beat = loop_lag.beat
+            late = time.monotonic() - beat - loop_lag.interval
+
+            if stalled_beat is not None and beat != stalled_beat:
+                # The loop is running again: record how long it was blocked
+                seconds = max(stall["seconds"], beat - stalled_beat - loop_lag.interval)
+                stall["seconds"] = round(seconds, 3)
+                metrics.inc("loop_stalls_total", where=stall["where"])
+                metrics.observe("loop_stall_seconds", seconds, where=stall["where"])
+                stalled_beat = None
+
+            if stalled_beat is None and late > self.threshold and loop_lag.thread_id is not None:
+                frame = sys._current_frames().get(loop_lag.thread_id)
+                frames = traceback.extract_stack(frame) if frame is not None else []
+                stall = {
+                    "at": time.time(),
+                    "where": _where(frames),
+                    "task": self._task_name(),
+                    "seconds": round(late, 3),
+                }
+                self.stalls.append(stall)
+                stalled_beat = beat
+                print(f"Event loop blocked for {late:.2f}s+ in {stall['where']} (task {stall['task']}):\n"
+                      + "".join(traceback.format_list(frames[-12:])))
+            elif stalled_beat is not None:
+                stall["seconds"] = round(late, 3)
+
+    def stats(self) -> Dict[str, object]:
+        counts = {dict(labels)["where"]: n for labels, n in metrics.counter("loop_stalls_total").items()}
+        return {
+            "threshold": self.threshold,
+            "stalls": sum(counts.values()),
+            "by_where": dict(sorted(counts.items(), key=lambda kv: -kv[1])),
+            "recent": list(self.stalls),
+            "lag_last": loop_lag.last,
+            "lag_max": loop_lag.max,
+        }
+
+
+watchdog = LoopWatchdog()
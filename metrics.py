@@ -0,0 +1,238 @@
+# metrics.py
+#
+# Latency histograms for bot commands. Each command invocation gets a CommandTimer
+# (started in the before-invoke hook and held in a context variable, so it follows the
+# command into its background job and worker threads). Code along the way times its
+# part with `with stage("compute"):` and reports cache lookups with note_cache(); when
+# the command finishes, its total and per-stage times are recorded into histograms
+# labelled by command, stage, status and cache hit/miss.
+#
+# Stages: data_load (warm-up wait, fact table), parse, queue (scheduler / job queue),
+# compute, render, send.
+#
+# Every command is also a trace (tracing.py): each stage is a span under it.
+#
+# LoopLag samples event-loop lag (how late a periodic sleep wakes up) into loop_lag_seconds;
+# its heartbeat is what loop_watchdog.py checks for stalls. Plain counters (Metrics.inc)
+# hold event counts such as loop_stalls_total.
+
+import asyncio
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from tracing import finish_trace, span, start_trace
+
+# Upper bounds in seconds (the last bucket is everything above)
+BUCKETS: Tuple[float, ...] = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+HIT, MISS, NONE = "hit", "miss", "none"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def merge(self, other: "Histogram") -> None:
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.sum += other.sum
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> float:
+        """Estimate by linear interpolation inside the bucket holding the q-th observation."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if seen + n >= rank and n:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / n, self.max)
+            seen += n
+        return self.max
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self.counters: Dict[str, Dict[Labels, float]] = {}
+
+    def inc(self, name: str, amount: float = 1, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + amount
+
+    def counter(self, name: str) -> Dict[Labels, float]:
+        with self._lock:
+            return dict(self.counters.get(name, {}))
+
+    def observe(self, name: str, seconds: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(seconds)
+
+    def summary(self, name: str, by: Optional[Tuple[str, ...]] = None) -> List[Dict[str, object]]:
+        """
+        One row per label set: labels, count, mean, max and p50/p95/p99 (seconds).
+        With `by`, label sets are merged on just those labels (e.g. by=("command",)).
+        """
+        with self._lock:
+            groups: Dict[Labels, Histogram] = {}
+            for labels, h in self.histograms.get(name, {}).items():
+                if by is not None:
+                    labels = tuple((k, v) for k, v in labels if k in by)
+                merged = groups.setdefault(labels, Histogram(h.buckets))
+                merged.merge(h)
+            rows = []
+            for labels, h in groups.items():
+                row: Dict[str, object] = dict(labels)
+                row.update(count=h.count, mean=h.sum / h.count if h.count else 0.0, max=h.max)
+                for q in QUANTILES:
+                    row[f"p{int(q * 100)}"] = h.quantile(q)
+                rows.append(row)
+        return sorted(rows, key=lambda r: -r["count"])
+
+    def series(self, name: str) -> List[Tuple[Labels, Tuple[float, ...], List[int], float, int]]:
+        """Copy of each label set's histogram: (labels, bucket bounds, counts, sum, count)."""
+        with self._lock:
+            return [(labels, h.buckets, list(h.counts), h.sum, h.count)
+                    for labels, h in self.histograms.get(name, {}).items()]
+
+
+metrics = Metrics()
+
+
+# ---------- Event-loop lag
+
+LAG_INTERVAL = 0.5   # seconds between samples
+
+
+class LoopLag:
+    def __init__(self):
+        self.last = 0.0
+        self.max = 0.0
+        self.interval = LAG_INTERVAL
+        self.beat = time.monotonic()        # last time the loop ran the sampler (watchdog heartbeat)
+        self.thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def _sample(self, interval: float) -> None:
+        self.thread_id = threading.get_ident()
+        while True:
+            start = time.perf_counter()
+            self.beat = time.monotonic()
+            await asyncio.sleep(interval)
+            lag = max(0.0, time.perf_counter() - start - interval)
+            self.last, self.max = lag, max(self.max, lag)
+            metrics.observe("loop_lag_seconds", lag)
+
+    def start(self, interval: float = LAG_INTERVAL) -> None:
+        """Start sampling on the running loop (no-op if already started)."""
+        if self._task is None:
+            self.interval = interval
+            self._task = asyncio.get_running_loop().create_task(self._sample(interval), name="loop-lag")
+
+
+loop_lag = LoopLag()
+
+
+# ---------- Per-command timing
+
+class CommandTimer:
+    def __init__(self, command: str):
+        self.command = command
+        self.start = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.cache: Dict[str, str] = {}     # stage -> hit / miss
+        self.deferred = False               # finished later by its background job
+        self.finished = False
+        self.trace = start_trace(f"!{command}", command=command)
+        self._lock = threading.Lock()
+
+    def add(self, stage_name: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[stage_name] = self.stages.get(stage_name, 0.0) + seconds
+
+    def note_cache(self, stage_name: str, hit: bool) -> None:
+        with self._lock:
+            # Any miss makes the stage a miss
+            if not hit or self.cache.get(stage_name) != MISS:
+                self.cache[stage_name] = HIT if hit else MISS
+
+    def cache_status(self) -> str:
+        if not self.cache:
+            return NONE
+        return MISS if MISS in self.cache.values() else HIT
+
+    def finish(self, status: str = "ok") -> None:
+        if self.finished:
+            return
+        self.finished = True
+        total = time.perf_counter() - self.start
+        cache = self.cache_status()
+        metrics.observe("command_seconds", total, command=self.command, status=status, cache=cache)
+        for stage_name, seconds in self.stages.items():
+            metrics.observe("stage_seconds", seconds, command=self.command, stage=stage_name,
+                            cache=self.cache.get(stage_name, NONE))
+        finish_trace(self.trace, status=status, cache=cache)
+
+
+_current: contextvars.ContextVar[Optional[CommandTimer]] = contextvars.ContextVar("command_timer", default=None)
+_stage: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("command_stage", default=None)
+
+
+def start_command(command: str) -> CommandTimer:
+    timer = CommandTimer(command)
+    _current.set(timer)
+    return timer
+
+
+def current_timer() -> Optional[CommandTimer]:
+    return _current.get()
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """Time the block as stage `name` of the current command (no-op outside a command)."""
+    timer = _current.get()
+    start = time.perf_counter()
+    token = _stage.set(name)
+    try:
+        with span(name):
+            yield
+    finally:
+        _stage.reset(token)
+        if timer is not None:
+            timer.add(name, time.perf_counter() - start)
+
+
+def note_cache(hit: bool, stage_name: Optional[str] = None) -> None:
+    """Record a cache lookup against the current stage of the current command."""
+    timer = _current.get()
+    name = stage_name or _stage.get()
+    if timer is not None and name is not None:
+        timer.note_cache(name, hit)
@@ -5,12 +5,78 @@ import config
 from config import defensive_rushing_factors
 
 
-import nfl_data_py as nfl
 import pandas as pd
-
-def load_data(season):
-    print("Loading play-by-play data...")
-    return nfl.import_pbp_data([season])
+from data_store import pbp_store, store_available
+from derived_cache import derived_cache, inputs, loading
+
+# Play-by-play columns the bot actually reads (nflverse pbp ships 370+)
+PBP_COLUMNS = [
+    'game_id', 'play_id', 'season_type', 'week',
+    'posteam', 'defteam', 'play_type',
+    'rush_attempt', 'pass_attempt', 'complete_pass', 'interception', 'sack', 'qb_hit',
+    'yards_gained', 'rushing_yards', 'air_yards', 'yards_after_catch', 'yardline_100',
+    'score_differential',
+    'passer_player_id', 'passer_player_name',
+    'rusher_player_id', 'rusher_player_name',
+    'receiver_player_id', 'receiver_player_name', 'receiver',
+    'touchdown', 'td_team', 'field_goal_result', 'extra_point_result', 'two_point_conv_result',
+]
+
+# Repeated string columns (teams, names, ids, results) that compress well as categoricals
+PBP_CATEGORICAL_COLUMNS = [
+    'game_id', 'season_type', 'posteam', 'defteam', 'play_type', 'td_team',
+    'passer_player_id', 'passer_player_name',
+    'rusher_player_id', 'rusher_player_name',
+    'receiver_player_id', 'receiver_player_name', 'receiver',
+    'field_goal_result', 'extra_point_result', 'two_point_conv_result',
+]
+
+def compact_pbp(pbp):
+    """
+    Convert team/name columns to categoricals and downcast numerics in place.
+    Returns (pbp, bytes_before, bytes_after).
+    """
+    before = int(pbp.memory_usage(deep=True).sum())
+    for col in pbp.columns:
+        if col in PBP_CATEGORICAL_COLUMNS:
+            pbp[col] = pbp[col].astype('category')
+        elif pd.api.types.is_float_dtype(pbp[col]):
+            pbp[col] = pd.to_numeric(pbp[col], downcast='float')
+        elif pd.api.types.is_integer_dtype(pbp[col]):
+            pbp[col] = pd.to_numeric(pbp[col], downcast='integer')
+    after = int(pbp.memory_usage(deep=True).sum())
+    return pbp, before, after
+
+def fetch_projected_pbp(season):
+    """Download a season of pbp (PBP_COLUMNS only) and compact it."""
+    import nfl_data_py as nfl
+    with loading(f"nfl.import_pbp_data({season})"):
+        pbp = nfl.import_pbp_data([season], columns=PBP_COLUMNS, include_participation=False)
+    pbp, before, after = compact_pbp(pbp)
+    saved = 1 - after / before if before else 0
+    print(f"Projected PBP {season}: {len(pbp.columns)} columns, "
+          f"{before / 1e6:.1f} MB -> {after / 1e6:.1f} MB ({saved:.0%} saved by compaction)")
+    return pbp
+
+def load_data(season, projected=False):
+    """
+    projected=False: the full nflverse frame.
+    projected=True: only PBP_COLUMNS, compacted (a fraction of the RAM, so several seasons can stay resident).
+    Projected seasons are read through the local memory-mapped store, downloading on first use.
+    """
+    import nfl_data_py as nfl
+    if not projected:
+        print("Loading play-by-play data...")
+        return nfl.import_pbp_data([season])
+
+    if not store_available():
+        print("Loading play-by-play data...")
+        return fetch_projected_pbp(season)
+
+    if not pbp_store.has_season(season):
+        print("Loading play-by-play data...")
+        pbp_store.write_weeks(season, fetch_projected_pbp(season))
+    return pbp_store.read_season(season)
 
 def check_team_exists(pbp, team):
     available_offense_teams = pbp['posteam'].dropna().unique()
@@ -30,20 +96,38 @@ def calculate_offensive_stats(pbp, team):
 
     return pass_rate, rush_rate
 
-def calculate_offensive_line_metrics(pbp):
+# Team aggregates are split into mergeable partial sums (one frame per chunk of plays)
+# and a cheap finalize step (rates + ranks), so new weeks or seasons can be added
+# to existing totals instead of recomputing from every play.
+
+def merge_partials(a, b):
+    """Add two partial-sum frames indexed by team (either may be None)."""
+    if a is None:
+        return b
+    if b is None:
+        return a
+    return a.add(b, fill_value=0)
+
+def offensive_line_partials(pbp):
     sacks_allowed = pbp[(pbp['posteam'].notnull()) & (pbp['sack'] == 1)]
-    sacks_by_team = sacks_allowed.groupby('posteam').size()
+    sacks_by_team = sacks_allowed.groupby('posteam', observed=True).size()
 
     tfl_plays = pbp[(pbp['posteam'].notnull()) & (pbp['rush_attempt'] == 1) & (pbp['yards_gained'] < 0)]
-    tfl_by_team = tfl_plays.groupby('posteam').size()
+    tfl_by_team = tfl_plays.groupby('posteam', observed=True).size()
 
-    rush_yards_by_team = pbp[pbp['rush_attempt'] == 1].groupby('posteam')['yards_gained'].sum()
+    rush_yards_by_team = pbp[pbp['rush_attempt'] == 1].groupby('posteam', observed=True)['yards_gained'].sum()
 
-    off_line_df = pd.DataFrame({
+    partials = pd.DataFrame({
         'sacks_allowed': sacks_by_team,
         'tfl_allowed': tfl_by_team,
         'rush_yards': rush_yards_by_team
     }).fillna(0)
+    partials.index = partials.index.astype(str)
+    partials.index.name = 'posteam'
+    return partials
+
+def finalize_offensive_line_metrics(partials):
+    off_line_df = partials.copy()
 
     epsilon = 0.0001 #avoid divison by 0
     off_line_df['off_line_metric'] = (off_line_df['sacks_allowed'] + off_line_df['tfl_allowed']) / (off_line_df['rush_yards'] + epsilon)
@@ -51,43 +135,36 @@ def calculate_offensive_line_metrics(pbp):
 
     return off_line_df
 
-def calculate_defensive_stats(pbp):
-    team_stats = []
-    teams = pbp['defteam'].dropna().unique()
-
-    for team in teams:
-        defense_plays = pbp[pbp['defteam'] == team]
-
-        rush_def = defense_plays[defense_plays['rush_attempt'] == 1]
-        pass_def = defense_plays[defense_plays['pass_attempt'] == 1]
-
-        rush_yards = rush_def['yards_gained'].sum()
-        pass_yards = pass_def['yards_gained'].sum()
-        total_yards = rush_yards + pass_yards
-
-        touchdowns = defense_plays[defense_plays['touchdown'] == 1]
-        touchdown_points = touchdowns['td_team'].apply(lambda x: 6 if pd.notna(x) else 0).sum()
-
-        field_goals = defense_plays[defense_plays['field_goal_result'] == 'made']
-        field_goal_points = 3 * len(field_goals)
-
-        extra_points = defense_plays[defense_plays['extra_point_result'] == 'good']
-        extra_point_points = len(extra_points)
-
-        two_pt_plays = defense_plays[defense_plays['two_point_conv_result'] == 'success']
-        two_pt_points = 2 * len(two_pt_plays)
-
-        total_points_allowed = touchdown_points + field_goal_points + extra_point_points + two_pt_points
-
-        team_stats.append({
-            'team': team,
-            'rush_yards_allowed': rush_yards,
-            'pass_yards_allowed': pass_yards,
-            'total_yards_allowed': total_yards,
-            'points_allowed': total_points_allowed
-        })
+def calculate_offensive_line_metrics(pbp):
+    return finalize_offensive_line_metrics(offensive_line_partials(pbp))
+
+def defensive_partials(pbp):
+    defense_plays = pbp[pbp['defteam'].notna()]
+    by_team = defense_plays['defteam']
+
+    rush_yards = defense_plays['yards_gained'].where(defense_plays['rush_attempt'] == 1, 0)
+    pass_yards = defense_plays['yards_gained'].where(defense_plays['pass_attempt'] == 1, 0)
+
+    points = (
+        6 * ((defense_plays['touchdown'] == 1) & defense_plays['td_team'].notna()).astype(int)
+        + 3 * (defense_plays['field_goal_result'] == 'made').astype(int)
+        + (defense_plays['extra_point_result'] == 'good').astype(int)
+        + 2 * (defense_plays['two_point_conv_result'] == 'success').astype(int)
+    )
+
+    partials = pd.DataFrame({
+        'rush_yards_allowed': rush_yards.groupby(by_team, observed=True).sum(),
+        'pass_yards_allowed': pass_yards.groupby(by_team, observed=True).sum(),
+        'points_allowed': points.groupby(by_team, observed=True).sum(),
+    })
+    partials.index = partials.index.astype(str)
+    partials.index.name = 'team'
+    return partials
+
+def finalize_defensive_stats(partials):
+    df = partials.reset_index()
+    df.insert(3, 'total_yards_allowed', df['rush_yards_allowed'] + df['pass_yards_allowed'])
 
-    df = pd.DataFrame(team_stats)
     df['rush_rank'] = df['rush_yards_allowed'].rank(method='min')
     df['pass_rank'] = df['pass_yards_allowed'].rank(method='min')
     df['total_rank'] = df['total_yards_allowed'].rank(method='min')
@@ -95,6 +172,110 @@ def calculate_defensive_stats(pbp):
 
     return df
 
+def calculate_defensive_stats(pbp):
+    return finalize_defensive_stats(defensive_partials(pbp))
+
+def offensive_partials(pbp):
+    offense_plays = pbp[pbp['posteam'].notna()]
+    by_team = offense_plays['posteam']
+    partials = pd.DataFrame({
+        'plays': by_team.groupby(by_team, observed=True).size(),
+        'pass_plays': (offense_plays['pass_attempt'] == 1).groupby(by_team, observed=True).sum(),
+        'rush_plays': (offense_plays['rush_attempt'] == 1).groupby(by_team, observed=True).sum(),
+    })
+    partials.index = partials.index.astype(str)
+    partials.index.name = 'posteam'
+    return partials
+
+def finalize_offensive_stats(partials):
+    df = partials.copy()
+    plays = df['plays'].where(df['plays'] > 0)
+    df['pass_rate'] = (df['pass_plays'] / plays).fillna(0)
+    df['rush_rate'] = (df['rush_plays'] / plays).fillna(0)
+    return df
+
+# ---------- Multi-season (streamed) team metrics
+#
+# Seasons are read one week file at a time from the local store (one season at a time
+# when it has to be downloaded), reduced to per-team partial sums and dropped, so
+# 2000-2024 trends need memory for one chunk plus 32-row partials per season.
+
+def iter_pbp_chunks(season):
+    """Yield a season's projected pbp one stored week at a time."""
+    if not store_available():
+        yield load_data(season, projected=True)
+        return
+    if not pbp_store.has_season(season):
+        print("Loading play-by-play data...")
+        pbp_store.write_weeks(season, fetch_projected_pbp(season))
+    for week in pbp_store.weeks(season):
+        yield pbp_store.read_season(season, [week])
+
+def season_team_partials(season):
+    """{'offense', 'oline', 'defense'} partial sums for one season, cached until that season changes."""
+    def compute():
+        offense = oline = defense = None
+        for chunk in iter_pbp_chunks(season):
+            offense = merge_partials(offense, offensive_partials(chunk))
+            oline = merge_partials(oline, offensive_line_partials(chunk))
+            defense = merge_partials(defense, defensive_partials(chunk))
+        return {'offense': offense, 'oline': oline, 'defense': defense}
+    return derived_cache.cached(('team_partials', season), inputs([season]), compute)
+
+def _merged_partials(seasons, kind):
+    partials = None
+    for season in seasons:
+        partials = merge_partials(partials, season_team_partials(season)[kind])
+    return partials
+
+def calculate_offensive_stats_seasons(seasons, team):
+    """(pass_rate, rush_rate) for `team` over all of `seasons` combined."""
+    offense = finalize_offensive_stats(_merged_partials(seasons, 'offense'))
+    if team not in offense.index:
+        return 0, 0
+    return offense.loc[team, 'pass_rate'], offense.loc[team, 'rush_rate']
+
+def calculate_offensive_line_metrics_seasons(seasons):
+    return finalize_offensive_line_metrics(_merged_partials(seasons, 'oline'))
+
+def calculate_defensive_stats_seasons(seasons):
+    """
+    Defensive stats over `seasons` as averages per season each team played (a team that
+    joined or moved mid-range isn't compared on fewer seasons), ranked on the averages.
+    """
+    totals, played = None, None
+    for season in seasons:
+        partials = season_team_partials(season)['defense']
+        totals = merge_partials(totals, partials)
+        played = merge_partials(played, pd.Series(1, index=partials.index))
+    return finalize_defensive_stats(totals.div(played, axis=0))
+
+def team_trend(seasons, team):
+    """
+    One row per season for `team`: pass/rush rate, O-line metric + rank and defensive
+    yards / points allowed + ranks (ranks are within that season). Seasons the team
+    didn't play under this abbreviation are left out.
+    """
+    rows = []
+    for season in seasons:
+        partials = season_team_partials(season)
+        offense = finalize_offensive_stats(partials['offense'])
+        oline = finalize_offensive_line_metrics(partials['oline'])
+        defense = finalize_defensive_stats(partials['defense']).set_index('team')
+        if team not in offense.index or team not in defense.index:
+            continue
+        row = {'season': season,
+               'pass_rate': offense.loc[team, 'pass_rate'],
+               'rush_rate': offense.loc[team, 'rush_rate']}
+        if team in oline.index:
+            row['off_line_metric'] = oline.loc[team, 'off_line_metric']
+            row['off_line_rank'] = oline.loc[team, 'off_line_rank']
+        for col in ('rush_yards_allowed', 'rush_rank', 'pass_yards_allowed', 'pass_rank',
+                    'points_allowed', 'points_allowed_rank'):
+            row[col] = defense.loc[team, col]
+        rows.append(row)
+    return pd.DataFrame(rows).set_index('season') if rows else pd.DataFrame()
+
 def print_stats(team, season, pass_rate, rush_rate, off_line_df, user_def_row):
     print(f"\n--- {team} Stats for {season} Season ---")
     print(f"Pass Rate:            {pass_rate:.2%}")
@@ -152,7 +333,7 @@ def main():
     season = 2024
     user_team = input("Enter NFL team abbreviation (e.g., NE, DAL, ARI): ").upper()
 
-    pbp = load_data(season)
+    pbp = load_data(season, projected=True)
 
     exists, all_teams = check_team_exists(pbp, user_team)
     if not exists:
@@ -187,7 +368,6 @@ def rb_nfl_algorithm():
 
 
     # print(defensive_rush_factor_scale)
-rb_nfl_algorithm()
 
 
 if __name__ == "__main__":
@@ -1,6 +1,7 @@
-import nfl_data_py as nfl
+import numpy as np
 import pandas as pd
 from collections import defaultdict
+from fact_table import history_facts, season_facts
 
 def custom_stats(player, statLine):
     #Completion Percentage (QB)
@@ -38,16 +39,13 @@ def custom_stats(player, statLine):
 #############    Season Summary Stats           #############
 def season_stats(playerName,  statLine, year):
     statLine = statLine.lower().replace(' ', '_')  # Normalize stat line name
-    schedule = nfl.import_weekly_data([year])   # gets the season table
-    player = schedule[schedule['player_display_name'] == playerName] # Filter by player name
+    player = season_facts(year).games_for(playerName).between(year, year)  # player's games that season
 
-    display_stat = custom_stats(player, statLine)  # Get the display stat name
+    display_stat = statLine  # ratio stats are derived by the fact table
 
     #ditionary the stats
     stats_dictionary = defaultdict(list)
-    for _, row in player.iterrows():
-        team = row['opponent_team']
-        stat_value = row[display_stat]
+    for team, stat_value in zip(player.opponents(), player.stat_list(display_stat)):
         stats_dictionary[team].append(stat_value)
 
     return dict(stats_dictionary) #opponent team : [stat values] (duplicates listed by team)
@@ -56,18 +54,13 @@ def season_stats(playerName,  statLine, year):
 #############    Player vs Team Stats Average           #############
 def player_vs_team_average(oppTeam, playerName, statLine):
     statLine = statLine.lower().replace(' ', '_')  # Normalize stat line name
-    all_data = nfl.import_weekly_data(list(range(2000, 2025)))
-    player_games = all_data[(all_data['player_display_name'] == playerName) & (all_data['opponent_team'] == oppTeam)].copy()
+    player_games = history_facts().games_vs(playerName, oppTeam)
 
-    display_stat = custom_stats(player_games, statLine)  # Get the display stat name
+    if player_games.empty:
+        return {}
 
-    stats_dictionary = defaultdict(list)
-    for _, row in player_games.iterrows():
-        team = row['opponent_team']
-        stat_value = row[display_stat]
-        stats_dictionary[team].append(stat_value)
-
-    avg_stats = {team: sum(values) / len(values) if values else 0 for team, values in stats_dictionary.items()}
+    values = player_games.stat(statLine)
+    avg_stats = {oppTeam: float(values.mean())}
 
     return avg_stats
 
@@ -78,20 +71,14 @@ def player_vs_team_average(oppTeam, playerName, statLine):
 #############    Player vs Team History           #############
 def player_vs_team(oppTeam, playerName, statLine):
     statLine = statLine.lower().replace(' ', '_')  # Normalize stat line name
-    all_data = nfl.import_weekly_data(list(range(2000, 2025)))
-    player_games = all_data[(all_data['player_display_name'] == playerName) & (all_data['opponent_team'] == oppTeam)]
-
-    display_stat = custom_stats(player_games, statLine)  # Get the display stat name
+    player_games = history_facts().games_vs(playerName, oppTeam)
 
-    stats_dictionary = defaultdict(list)
-    for _, row in player_games.iterrows():
-        team = row['opponent_team']
-        stat_value = row[display_stat]
-        stats_dictionary[team].append(stat_value)
+    if player_games.empty:
+        return {}
 
-    # print(player_games[['player_display_name', 'opponent_team', 'week', 'season']]) uncomment to see games
+    # print(list(zip(player_games.labels(), player_games.opponents()))) uncomment to see games
 
-    return dict(stats_dictionary) #opponent team : [stat values] (duplicates listed by team)
+    return {oppTeam: player_games.stat_list(statLine)} #opponent team : [stat values] (duplicates listed by team)
 
 
 
@@ -100,21 +87,17 @@ def player_vs_team(oppTeam, playerName, statLine):
 #############    Last 10 Games                  #############
 def L10_Average(playerName, statLine, year):
     statLine = statLine.lower().replace(' ', '_')  # Normalize stat name
-    schedule = nfl.import_weekly_data([year])
-    player = schedule[schedule['player_display_name'] == playerName]
+    player = season_facts(year).games_for(playerName).between(year, year)
 
     if player.empty:
         return 0
 
-    player_sorted = player.sort_values(by='week', ascending=False).head(10)
-
-    # Apply custom stats before averaging
-    display_stat = custom_stats(player_sorted, statLine)
+    player_sorted = player.tail(10)
 
-    if display_stat not in player_sorted.columns:
+    if not player_sorted.facts.has_stat(statLine):
         return 0
 
-    avg = player_sorted[display_stat].mean()
+    avg = float(np.nanmean(player_sorted.stat(statLine)))
     return avg
 
 
@@ -1,7 +1,6 @@
-import nfl_data_py as nfl
 from config import defensive_rushing_factors, defensive_passing_factors, defensive_points_factors, factors_by_position_stat
 from predictionHelpers import playerAverage, calculate_gamescript, get_defensive_stat_rank, olineRanking, passRushRate, pointsAllowed, playerRZUsage, playerNameAbrev, calculate_rb_rating, get_player_position, get_player_carries, get_player_yards_per_carry
-from nfl_api import calculate_defensive_stats, calculate_offensive_line_metrics
+from season_context import get_context
 
 ### Prediction Code #####
 def get_defense_score(rank, factor_type="rushing"):
@@ -93,12 +92,14 @@ def bias_adjust_stat(stat_type, base_stat, pos, factor_values):
 # opp = "KC"
 # player_team = "ATL"
 
-pbp = nfl.import_pbp_data([2024])
-defensive_df = calculate_defensive_stats(pbp)
-off_line_df = calculate_offensive_line_metrics(pbp)
-rosters = nfl.import_weekly_rosters([2024])
+# pbp, defensive / O-line tables and rosters come from the warmed season context
+# (loaded in the background at startup, not at import time)
 
 def predict_stat(player_name, stat_type, opp_team, player_team):
+    context = get_context()
+    pbp, rosters = context.pbp, context.rosters
+    defensive_df, off_line_df = context.defensive_df, context.off_line_df
+
     pos = get_player_position(pbp, player_name)
     pos = pos.upper()
 
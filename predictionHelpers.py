@@ -1,17 +1,12 @@
-import nfl_data_py as nfl
 from config import defensive_rushing_factors, defensive_passing_factors, defensive_points_factors
 from nfl_api import calculate_defensive_stats, calculate_offensive_line_metrics, calculate_offensive_stats
 import pandas as pd
-
-playerName = "Bijan Robinson" 
-statLine = "rushing_yards"  
-opponentTeam = "KC"
-playerTeam = "ATL"
-pbp = nfl.import_pbp_data([2024])
+from derived_cache import loading
 
 
 #### BaseLine Stat Calculation ####
 def playerAverage(name, stat):
+    import nfl_data_py as nfl
     statLine = stat.lower().replace(' ', '_')
     schedule = nfl.import_weekly_data([2024])
     player = schedule[schedule['player_display_name'] == name] 
@@ -57,9 +52,6 @@ def playerNameAbrev(pbp, full_name, player_name_cols):
         print(f"Using abbreviation '{abbrev_name}' for filtering.")
         return abbrev_name
 
-player_name_columns = ['rusher_player_name', 'passer_player_name']
-abbrevName = playerNameAbrev(pbp, playerName, player_name_columns)
-
 
 ############################## Prediction Methods for RB ##############################
 
@@ -154,11 +146,6 @@ def calculate_rb_rating(player_name, pbp, player_team, offensive_line_df, defens
 
 
 
-defensive_df = calculate_defensive_stats(pbp)
-off_line_df = calculate_offensive_line_metrics(pbp)
-calculate_rb_rating(playerName, pbp, playerTeam, off_line_df, defensive_df)
-
-
 
 # oline_ranking: nfl_api -> calculate_offensive_line_metrics(pbp)
 def olineRanking(pbp, playerTeam):
@@ -223,7 +210,9 @@ def pointsAllowed(pbp, opponentTeam):
 #Get player ID 
 def get_player_id(player_name, team):
     # Import player data (automatically loads data for available seasons)
-    df = nfl.import_players()
+    import nfl_data_py as nfl
+    with loading("get_player_id: nfl.import_players"):
+        df = nfl.import_players()
 
     # Search for the player based on name and team
     player_data = df[(df['display_name'] == player_name) & (df['latest_team'] == team)]
@@ -242,6 +231,7 @@ def get_player_position(pbp, player_name):
 
     # Simplified example: pbp usually doesn't have player position directly, so you might have to load roster
     # Here is a placeholder approach
+    import nfl_data_py as nfl
     roster = roster = nfl.import_seasonal_rosters([2024])  # requires nfl_data_py roster import
     roster = roster[roster['player_name'].str.lower() == player_name.lower()]
 
@@ -376,3 +366,17 @@ def calculate_weapons_grade(pbp: pd.DataFrame, player_team: str) -> float:
     grade = min(max(grade, 0.0), 1.0)  # clip to [0,1]
     return grade
 
+
+if __name__ == "__main__":
+    # Example run (kept out of import so importing this module does no downloads)
+    import nfl_data_py as nfl
+    playerName = "Bijan Robinson"
+    playerTeam = "ATL"
+    pbp = nfl.import_pbp_data([2024])
+
+    player_name_columns = ['rusher_player_name', 'passer_player_name']
+    abbrevName = playerNameAbrev(pbp, playerName, player_name_columns)
+
+    defensive_df = calculate_defensive_stats(pbp)
+    off_line_df = calculate_offensive_line_metrics(pbp)
+    print(calculate_rb_rating(playerName, pbp, playerTeam, off_line_df, defensive_df))
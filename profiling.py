@@ -0,0 +1,137 @@
+# profiling.py
+#
+# On-demand profiles of real requests. An owner runs `!profile <command ...>` (cProfile:
+# top functions by cumulative time) or `!profile memory <command ...>` (tracemalloc:
+# peak traced memory and the lines holding the most at the peak); the command runs as
+# usual, and every compute call it makes is run under the profiler - in the compute
+# worker process that serves it, or on its thread in-process - skipping the result
+# cache so the work actually happens. The reports come back as a text attachment.
+#
+# Only one profile runs at a time per process: cProfile (3.12+) and tracemalloc are
+# process-wide.
+
+import contextvars
+import cProfile
+import io
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+CPU, MEMORY = "cpu", "memory"
+MODES = (CPU, MEMORY)
+
+# Functions / lines listed per report
+PROFILE_TOP = 40
+
+# Frames kept per tracemalloc allocation (more = slower, better attribution)
+TRACEMALLOC_FRAMES = 10
+
+# Seconds between checks for a new memory peak while a memory profile runs
+PEAK_SAMPLE_INTERVAL = 0.2
+
+_lock = threading.Lock()
+
+
+class ProfileSession:
+    def __init__(self, mode: str):
+        if mode not in MODES:
+            raise ValueError(f"unknown profile mode {mode!r} (expected one of {', '.join(MODES)})")
+        self.mode = mode
+        self.reports: List[Tuple[str, str]] = []   # (label, report text)
+
+    def record(self, label: str, report: str) -> None:
+        self.reports.append((label, report))
+
+    def text(self) -> str:
+        return "\n\n".join(f"===== {label} =====\n{report}" for label, report in self.reports)
+
+
+_session: contextvars.ContextVar[Optional[ProfileSession]] = contextvars.ContextVar("profile_session", default=None)
+
+
+@contextmanager
+def profile_requests(mode: str) -> Iterator[ProfileSession]:
+    """Profile the compute calls made inside the block (and the tasks it starts)."""
+    session = ProfileSession(mode)
+    token = _session.set(session)
+    try:
+        yield session
+    finally:
+        _session.reset(token)
+
+
+def current_session() -> Optional[ProfileSession]:
+    return _session.get()
+
+
+# ---------- Running under a profiler (worker process or thread)
+
+def _cpu(fn: Callable, args: tuple, kwargs: dict) -> Tuple[Any, str]:
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    result = profiler.runcall(fn, *args, **kwargs)
+    elapsed = time.perf_counter() - start
+
+    out = io.StringIO()
+    out.write(f"wall {elapsed:.3f}s; top {PROFILE_TOP} functions by cumulative time\n")
+    pstats.Stats(profiler, stream=out).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_TOP)
+    return result, out.getvalue()
+
+
+def _memory(fn: Callable, args: tuple, kwargs: dict) -> Tuple[Any, str]:
+    started_here = not tracemalloc.is_tracing()
+    if started_here:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    tracemalloc.reset_peak()
+    baseline = tracemalloc.get_traced_memory()[0]
+
+    # tracemalloc reports the peak size but not what made it up: snapshot whenever the
+    # traced total passes the previous high-water mark and keep the biggest
+    peak: Dict[str, Any] = {"bytes": 0, "snapshot": None}
+    done = threading.Event()
+
+    def watch():
+        while not done.wait(PEAK_SAMPLE_INTERVAL):
+            current = tracemalloc.get_traced_memory()[0]
+            if current > peak["bytes"] * 1.1:
+                peak["bytes"], peak["snapshot"] = current, tracemalloc.take_snapshot()
+
+    watcher = threading.Thread(target=watch, name="tracemalloc-peak", daemon=True)
+    watcher.start()
+    start = time.perf_counter()
+    try:
+        result = fn(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        done.set()
+        watcher.join()
+        current, high = tracemalloc.get_traced_memory()
+        if current >= peak["bytes"]:
+            peak["bytes"], peak["snapshot"] = current, tracemalloc.take_snapshot()
+    finally:
+        done.set()
+        watcher.join()
+        if started_here:
+            tracemalloc.stop()
+
+    out = io.StringIO()
+    out.write(f"wall {elapsed:.3f}s; peak {(high - baseline) / 2**20:.1f} MB above start "
+              f"({high / 2**20:.1f} MB traced); near-peak snapshot {peak['bytes'] / 2**20:.1f} MB\n")
+    out.write(f"top {PROFILE_TOP} lines by memory held at that snapshot "
+              "(process-wide: includes other threads' allocations)\n")
+    snapshot = peak["snapshot"].filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ))
+    for stat in snapshot.statistics("lineno")[:PROFILE_TOP]:
+        frame = stat.traceback[0]
+        out.write(f"{stat.size / 2**20:9.2f} MB {stat.count:9d} blocks  {frame.filename}:{frame.lineno}\n")
+    return result, out.getvalue()
+
+
+def run_profiled(mode: str, fn: Callable, *args, **kwargs) -> Tuple[Any, str]:
+    """Call fn(*args, **kwargs) under the `mode` profiler; returns (result, report)."""
+    with _lock:
+        return (_cpu if mode == CPU else _memory)(fn, args, kwargs)
@@ -0,0 +1,222 @@
+# rest_api.py
+#
+# JSON API over the same engines as the bot commands, served by http_server.py. Requests
+# run on the bot's event loop through compute.call, so they share its warm season data,
+# result cache and compute workers, and take fair-share compute slots like any Discord
+# user (as the user "http-api").
+#
+#   GET|POST /api/predict_over_under   player, stat, line, opponent[, season]
+#   GET|POST /api/last10               player, stat, line, oa
+#   GET|POST /api/h2h                  player, stat, line, oa, opponent
+#   GET|POST /api/nflstats             team[, seasons]   e.g. seasons=2018-2024
+#   POST     /api/batch/<endpoint>     {"props": [{...}, ...]}  -> {"results": [...]}
+#
+# Batch results are in request order; each is {"ok": true, "result": ...} or
+# {"ok": false, "error": "..."}.
+
+import asyncio
+import concurrent.futures
+import dataclasses
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from flask import Blueprint, jsonify, request
+
+from compute_workers import compute
+from scheduler import scheduler
+from season_context import CURRENT_SEASON
+
+# Props per batch request, and how many of them run at once
+MAX_BATCH = 100
+BATCH_CONCURRENCY = 4
+
+# Seconds a request may take before the API gives up on it
+REQUEST_TIMEOUT = 120
+
+API_USER = "http-api"
+
+# Seasons with play-by-play (same bounds as !nflstats)
+FIRST_SEASON = 1999
+
+api = Blueprint("api", __name__, url_prefix="/api")
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def bind_loop(loop: asyncio.AbstractEventLoop) -> None:
+    global _loop
+    _loop = loop
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def _jsonable(value: Any) -> Any:
+    if dataclasses.is_dataclass(value) and not isinstance(value, type):
+        return _jsonable(dataclasses.asdict(value))
+    if isinstance(value, dict):
+        return {str(k): _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if hasattr(value, "item"):  # numpy scalar
+        return value.item()
+    return value
+
+
+# ---------- Parameter parsing (one prop -> (compute op, args, kwargs)), in the Flask thread
+
+def _field(params: Dict[str, Any], name: str, cast: Callable = str, default: Any = None) -> Any:
+    value = params.get(name, default)
+    if value is None:
+        raise BadRequest(f"missing '{name}'")
+    try:
+        return cast(value)
+    except BadRequest as e:
+        raise BadRequest(f"invalid '{name}': {e}")
+    except (TypeError, ValueError):
+        raise BadRequest(f"invalid '{name}': {value!r}")
+
+
+def _over_under(params: Dict[str, Any]) -> str:
+    oa = _field(params, "oa").lower()
+    if oa not in ("over", "under"):
+        raise BadRequest("'oa' must be 'over' or 'under'")
+    return oa
+
+
+def _season(value: Any) -> int:
+    season = int(value)
+    if not FIRST_SEASON <= season <= CURRENT_SEASON:
+        raise BadRequest(f"play-by-play is available for {FIRST_SEASON}-{CURRENT_SEASON}")
+    return season
+
+
+def _seasons(text: str) -> List[int]:
+    # Bounds are checked before the range is built: "1-999999999" must not become a list
+    first, _, last = str(text).partition("-")
+    first, last = _season(first), _season(last or first)
+    return list(range(min(first, last), max(first, last) + 1))
+
+
+def _predict_over_under(p):
+    return "predict_over_under", (), {
+        "player_name": _field(p, "player"), "stat_line": _field(p, "stat"),
+        "line_value": _field(p, "line", float), "opponent_team": _field(p, "opponent").upper(),
+        "season": _field(p, "season", _season, 2024),
+    }
+
+
+def _last10(p):
+    return "last10", (_field(p, "player"), _field(p, "stat"), _field(p, "line", float), _over_under(p)), {}
+
+
+def _h2h(p):
+    return "h2h", (_field(p, "player"), _field(p, "stat"), _field(p, "line", float), _over_under(p),
+                   _field(p, "opponent").upper()), {}
+
+
+def _nflstats(p):
+    return "team_stats", (_field(p, "team").upper(), _field(p, "seasons", _seasons, "2024")), {}
+
+
+# endpoint -> (parser, scheduler command)
+ENDPOINTS: Dict[str, Tuple[Callable[[Dict[str, Any]], Tuple[str, tuple, dict]], str]] = {
+    "predict_over_under": (_predict_over_under, "predict_over_under"),
+    "last10": (_last10, "last10"),
+    "h2h": (_h2h, "h2h"),
+    "nflstats": (_nflstats, "nflstats"),
+}
+
+
+# ---------- Execution (on the bot's loop)
+
+Call = Tuple[str, tuple, dict]
+
+
+def _parse(endpoint: str, params: Any) -> Call:
+    if not isinstance(params, dict):
+        raise BadRequest("each prop must be an object")
+    parse, _ = ENDPOINTS[endpoint]
+    return parse(params)
+
+
+async def _run_one(endpoint: str, call: Call) -> Any:
+    _, command = ENDPOINTS[endpoint]
+    op, args, kwargs = call
+    async with scheduler.slot(command, API_USER, None):
+        return await compute.call(op, *args, **kwargs)
+
+
+async def _run_batch(endpoint: str, calls: List[Any]) -> List[Dict[str, Any]]:
+    """`calls` holds a parsed call per prop, or the error its parsing raised."""
+    limit = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def one(call):
+        if isinstance(call, Exception):
+            return {"ok": False, "error": f"{call.__class__.__name__}: {call}"}
+        async with limit:
+            try:
+                return {"ok": True, "result": _jsonable(await _run_one(endpoint, call))}
+            except Exception as e:
+                return {"ok": False, "error": f"{e.__class__.__name__}: {e}"}
+
+    return list(await asyncio.gather(*(one(c) for c in calls)))
+
+
+def _on_loop(coro, timeout: float):
+    if _loop is None or not _loop.is_running():
+        coro.close()
+        raise RuntimeError("bot event loop not running")
+    future = asyncio.run_coroutine_threadsafe(coro, _loop)
+    try:
+        return future.result(timeout=timeout)
+    except concurrent.futures.TimeoutError:
+        future.cancel()
+        raise
+
+
+def _params() -> Dict[str, Any]:
+    if request.method == "POST":
+        return request.get_json(silent=True) or {}
+    return request.args.to_dict()
+
+
+# ---------- Routes
+
+@api.route("/<endpoint>", methods=["GET", "POST"])
+def single(endpoint: str):
+    if endpoint not in ENDPOINTS:
+        return jsonify({"error": f"unknown endpoint '{endpoint}'", "endpoints": sorted(ENDPOINTS)}), 404
+    try:
+        call = _parse(endpoint, _params())
+    except BadRequest as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        result = _on_loop(_run_one(endpoint, call), REQUEST_TIMEOUT)
+    except concurrent.futures.TimeoutError:
+        return jsonify({"error": f"timed out after {REQUEST_TIMEOUT}s"}), 504
+    except Exception as e:
+        return jsonify({"error": f"{e.__class__.__name__}: {e}"}), 500
+    return jsonify({"result": _jsonable(result)})
+
+
+@api.route("/batch/<endpoint>", methods=["POST"])
+def batch(endpoint: str):
+    if endpoint not in ENDPOINTS:
+        return jsonify({"error": f"unknown endpoint '{endpoint}'", "endpoints": sorted(ENDPOINTS)}), 404
+    props = (request.get_json(silent=True) or {}).get("props")
+    if not isinstance(props, list) or not props:
+        return jsonify({"error": "body must be {\"props\": [...]}"}), 400
+    if len(props) > MAX_BATCH:
+        return jsonify({"error": f"at most {MAX_BATCH} props per request"}), 400
+    calls = []
+    for params in props:
+        try:
+            calls.append(_parse(endpoint, params))
+        except BadRequest as e:
+            calls.append(e)
+    try:
+        results = _on_loop(_run_batch(endpoint, calls), REQUEST_TIMEOUT * max(1, len(props) // BATCH_CONCURRENCY))
+    except concurrent.futures.TimeoutError:
+        return jsonify({"error": "batch timed out"}), 504
+    return jsonify({"results": results})
@@ -0,0 +1,213 @@
+# result_cache.py
+#
+# Result cache shared by every bot / worker process on the box: one SQLite file next to
+# the local store (WAL mode, so readers don't block the writer). Prediction, hit-rate and
+# team-stat results computed by any process serve all of them; rendered images already
+# have their own shared disk cache (chart_cache.py).
+#
+# Keys include the store's write time for each season the operation reads (from its
+# season / seasons argument, else the current season, plus the fact table's history
+# seasons for the player commands), so ingesting a new or corrected week of any of them
+# makes older results unreachable; they then age out by TTL or by the size limit (least
+# recently used first).
+
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from data_store import STORE_DIR, pbp_store, store_available, weekly_store
+from fact_table import HISTORY_SEASONS
+
+RESULT_CACHE_PATH = os.getenv("NFL_RESULT_CACHE", os.path.join(STORE_DIR, "results.sqlite"))
+RESULT_CACHE_MB = float(os.getenv("RESULT_CACHE_MB", "128"))
+
+# Seconds a result stays valid, per compute operation; unlisted operations are not cached
+RESULT_TTLS: Dict[str, float] = {
+    "last10": 3600,
+    "h2h": 6 * 3600,
+    "h2h_last_10": 6 * 3600,
+    "prop_card": 3600,
+    "predict_over_under": 3600,
+    "predict_stat": 3600,
+    "team_stats": 6 * 3600,
+    "team_names": 24 * 3600,
+}
+
+# Where an operation takes the season(s) it reads: op -> (position, keyword). Unlisted
+# operations, and calls leaving the argument to its default, read the current season.
+SEASON_ARGS: Dict[str, Tuple[int, str]] = {
+    "team_stats": (1, "seasons"),
+    "team_names": (0, "season"),
+    "predict_over_under": (4, "season"),
+    "prop_card": (5, "season"),
+}
+
+# Operations that fall back to the previous season's play-by-play early in a season
+READS_PREVIOUS = {"predict_over_under", "prop_card"}
+
+# Operations that read every season of the player fact table (fact_table.HISTORY_SEASONS)
+READS_HISTORY = {"last10", "h2h", "h2h_last_10", "prop_card", "predict_over_under"}
+
+# Last-used times are only rewritten when older than this (keeps hits read-mostly)
+TOUCH_INTERVAL = 60
+
+_MISSING = object()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key     TEXT PRIMARY KEY,
+    op      TEXT NOT NULL,
+    value   BLOB NOT NULL,
+    size    INTEGER NOT NULL,
+    expires REAL NOT NULL,
+    used    REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_used ON results (used);
+"""
+
+
+def data_version(season: int) -> str:
+    """
+    Identifies the locally stored data for a season ('remote' without a local store): the
+    time of each dataset's last write, which changes with new and re-published weeks alike.
+    """
+    if not store_available():
+        return "remote"
+    return f"{season}:{pbp_store.version(season)}:{weekly_store.version(season)}"
+
+
+def seasons_read(op: str, args: tuple, kwargs: dict, current: int) -> List[int]:
+    """Seasons of local data operation `op` reads when called with these arguments."""
+    value = None
+    if op in SEASON_ARGS:
+        position, name = SEASON_ARGS[op]
+        value = kwargs.get(name, args[position] if len(args) > position else None)
+    if value is None:
+        seasons = [current]
+    elif isinstance(value, (list, tuple)):
+        seasons = [int(s) for s in value]
+    else:
+        seasons = [int(value)]
+    if op in READS_PREVIOUS:
+        seasons += [s - 1 for s in seasons]
+    if op in READS_HISTORY:
+        seasons += HISTORY_SEASONS
+    return sorted(set(seasons))
+
+
+def data_versions(seasons: Iterable[int]) -> str:
+    """data_version of each season, for keys of results that read several."""
+    return ";".join(data_version(season) for season in seasons)
+
+
+def result_key(op: str, args: tuple, kwargs: dict, version: str) -> str:
+    payload = json.dumps({"op": op, "args": args, "kwargs": kwargs, "data": version},
+                         sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, path: str = RESULT_CACHE_PATH, max_bytes: int = int(RESULT_CACHE_MB * 1024 * 1024)):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()   # one connection per thread
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _count(self, attr: str, n: int = 1) -> None:
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + n)
+
+    def get(self, key: str, default: Any = _MISSING) -> Any:
+        """Cached value for `key`, or `default` when missing or expired."""
+        now = time.time()
+        try:
+            conn = self._conn()
+            row = conn.execute("SELECT value, expires, used FROM results WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] <= now:
+                conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                row = None
+            if row is not None and now - row[2] > TOUCH_INTERVAL:
+                conn.execute("UPDATE results SET used = ? WHERE key = ?", (now, key))
+        except sqlite3.Error as e:
+            print(f"Result cache read failed: {e}")
+            row = None
+        if row is None:
+            self._count("misses")
+            return default
+        self._count("hits")
+        return pickle.loads(row[0])
+
+    def put(self, key: str, op: str, value: Any, ttl: float) -> None:
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(blob) > self.max_bytes:
+            return
+        now = time.time()
+        try:
+            conn = self._conn()
+            conn.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                         (key, op, blob, len(blob), now + ttl, now))
+            self._evict(conn, now)
+        except sqlite3.Error as e:
+            print(f"Result cache write failed: {e}")
+            return
+        self._count("stores")
+
+    def _evict(self, conn: sqlite3.Connection, now: float) -> None:
+        """Drop expired rows, then least recently used ones until under the size limit."""
+        conn.execute("DELETE FROM results WHERE expires <= ?", (now,))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for key, size in conn.execute("SELECT key, size FROM results ORDER BY used").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            total -= size
+            evicted += 1
+        self._count("evictions", evicted)
+
+    def clear(self) -> None:
+        self._conn().execute("DELETE FROM results")
+
+    def stats(self) -> Dict[str, Optional[float]]:
+        try:
+            entries, size = self._conn().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        except sqlite3.Error:
+            entries, size = None, None
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "entries": entries,
+                "bytes": size,
+                "max_bytes": self.max_bytes,
+            }
+
+
+result_cache = ResultCache()
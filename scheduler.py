@@ -0,0 +1,237 @@
+# scheduler.py
+#
+# Admission control and fair scheduling for bot commands.
+#
+# Every command has a cost class (cheap lookups, renders, multi-season scans):
+#
+#   - Rate limits: token buckets per user and per guild for each class. A request a
+#     few seconds over its limit is deferred; further over, it is rejected with the
+#     time until it may retry.
+#   - Compute slots: work runs in a fixed number of slots handed out by weighted fair
+#     queuing. Each request gets a virtual finish tag advanced by its cost, per user and
+#     per guild, so a user (or guild) sending many heavy requests queues behind
+#     everyone else instead of ahead of them. One slot is reserved for cheap commands,
+#     so predictions stay fast while scans are backed up.
+
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Hashable, List, Optional, Tuple
+
+CHEAP, RENDER, SCAN = "cheap", "render", "scan"
+
+# Command (and job type) -> cost class; unlisted commands are not scheduled
+COMMAND_CLASSES: Dict[str, str] = {
+    "predict_over_under": CHEAP,
+    "predict_stat": CHEAP,
+    "last10": RENDER,
+    "card": SCAN,
+    "h2h": SCAN,
+    "h2hl10": SCAN,
+    "nflstats": SCAN,
+}
+
+# Virtual-time cost of one request (relative CPU)
+COSTS: Dict[str, float] = {CHEAP: 1.0, RENDER: 3.0, SCAN: 5.0}
+
+# (requests per minute, burst) per class
+USER_LIMITS: Dict[str, Tuple[float, int]] = {CHEAP: (20, 5), RENDER: (8, 3), SCAN: (4, 2)}
+GUILD_LIMITS: Dict[str, Tuple[float, int]] = {CHEAP: (120, 20), RENDER: (40, 8), SCAN: (20, 5)}
+
+# Requests that would be allowed within this many seconds wait instead of being rejected
+DEFER_SECONDS = 5.0
+
+# Concurrent compute slots; one is kept for CHEAP requests
+COMPUTE_SLOTS = int(os.getenv("BOT_COMPUTE_SLOTS", "4"))
+
+# Heavy requests one user may have in progress at once (queued or running)
+MAX_PENDING_PER_USER = 3
+
+# Seconds between sweeps dropping per-user / per-guild state that has gone back to its default
+PRUNE_INTERVAL = 60.0
+
+
+class RateLimited(Exception):
+    def __init__(self, cost_class: str, retry_after: float, reason: str):
+        super().__init__(reason)
+        self.cost_class = cost_class
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    def __init__(self, per_minute: float, burst: int):
+        self.rate = per_minute / 60.0
+        self.capacity = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self) -> float:
+        """Seconds until a token is available (0 if one is available now)."""
+        self._refill()
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self) -> None:
+        """Take a token, going into debt if needed (the caller waits out the debt)."""
+        self._refill()
+        self.tokens -= 1
+
+    def is_full(self, now: float) -> bool:
+        """True once refilled to capacity: indistinguishable from a new bucket."""
+        return self.tokens + (now - self.updated) * self.rate >= self.capacity
+
+
+class Scheduler:
+    def __init__(self, slots: int = COMPUTE_SLOTS):
+        self.slots = max(slots, 1)
+        self.heavy_slots = max(self.slots - 1, 1)
+        self._buckets: Dict[Tuple[str, Hashable, str], TokenBucket] = {}
+        self._pruned = time.monotonic()
+
+        self._vtime = 0.0
+        self._user_tags: Dict[Hashable, float] = {}
+        self._guild_tags: Dict[Hashable, float] = {}
+        self._waiting: List[Tuple[float, int, str, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._running: Dict[str, int] = {CHEAP: 0, RENDER: 0, SCAN: 0}
+
+        self.admitted = 0
+        self.deferred = 0
+        self.rejected = 0
+
+    # ---------- Rate limits
+
+    def _bucket(self, scope: str, key: Hashable, cost_class: str) -> TokenBucket:
+        bucket_key = (scope, key, cost_class)
+        bucket = self._buckets.get(bucket_key)
+        if bucket is None:
+            per_minute, burst = (USER_LIMITS if scope == "user" else GUILD_LIMITS)[cost_class]
+            bucket = self._buckets[bucket_key] = TokenBucket(per_minute, burst)
+        return bucket
+
+    def _prune(self) -> None:
+        """Forget full buckets and finish tags already behind virtual time (both equal a fresh start)."""
+        now = time.monotonic()
+        if now - self._pruned < PRUNE_INTERVAL:
+            return
+        self._pruned = now
+        for key in [k for k, b in self._buckets.items() if b.is_full(now)]:
+            del self._buckets[key]
+        for tags in (self._user_tags, self._guild_tags):
+            for key in [k for k, tag in tags.items() if tag <= self._vtime]:
+                del tags[key]
+
+    def admit(self, command: str, user: Hashable, guild: Optional[Hashable], pending: int = 0) -> float:
+        """
+        Charge the request against the user's and guild's limits. Returns seconds to defer
+        (0 to run now); raises RateLimited when it is too far over. `pending` is how many
+        of the user's earlier requests are still in progress.
+        """
+        self._prune()
+        cost_class = COMMAND_CLASSES.get(command)
+        if cost_class is None:
+            return 0.0
+        if cost_class != CHEAP and pending >= MAX_PENDING_PER_USER:
+            self.rejected += 1
+            raise RateLimited(cost_class, 0.0,
+                              f"you already have {MAX_PENDING_PER_USER} requests in progress; wait for one to finish")
+
+        buckets = [self._bucket("user", user, cost_class)]
+        if guild is not None:
+            buckets.append(self._bucket("guild", guild, cost_class))
+        wait = max(b.wait_time() for b in buckets)
+        if wait > DEFER_SECONDS:
+            self.rejected += 1
+            raise RateLimited(cost_class, wait, f"too many {cost_class} requests")
+        for b in buckets:
+            b.take()
+        if wait > 0:
+            self.deferred += 1
+        self.admitted += 1
+        return wait
+
+    # ---------- Fair compute slots
+
+    def _can_run(self, cost_class: str) -> bool:
+        total = sum(self._running.values())
+        if total >= self.slots:
+            return False
+        return cost_class == CHEAP or self._running[RENDER] + self._running[SCAN] < self.heavy_slots
+
+    def _tag(self, cost_class: str, user: Hashable, guild: Optional[Hashable]) -> float:
+        cost = COSTS[cost_class]
+        user_finish = max(self._vtime, self._user_tags.get(user, 0.0)) + cost
+        self._user_tags[user] = user_finish
+        finish = user_finish
+        if guild is not None:
+            guild_finish = max(self._vtime, self._guild_tags.get(guild, 0.0)) + cost
+            self._guild_tags[guild] = guild_finish
+            finish = max(finish, guild_finish)
+        return finish
+
+    def _dispatch(self) -> None:
+        """Start waiting requests in finish-tag order while slots allow."""
+        skipped = []
+        while self._waiting:
+            tag, seq, cost_class, future = heapq.heappop(self._waiting)
+            if future.done():  # cancelled while queued
+                continue
+            if not self._can_run(cost_class):
+                skipped.append((tag, seq, cost_class, future))
+                if sum(self._running.values()) >= self.slots:
+                    break
+                continue
+            self._running[cost_class] += 1
+            self._vtime = max(self._vtime, tag - COSTS[cost_class])
+            future.set_result(None)
+        for item in skipped:
+            heapq.heappush(self._waiting, item)
+
+    @asynccontextmanager
+    async def slot(self, command: str, user: Hashable, guild: Optional[Hashable]):
+        """Hold a compute slot for the duration of the block (no-op for unscheduled commands)."""
+        cost_class = COMMAND_CLASSES.get(command)
+        if cost_class is None:
+            yield
+            return
+
+        tag = self._tag(cost_class, user, guild)
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiting, (tag, next(self._seq), cost_class, future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._running[cost_class] -= 1  # got the slot just as it was cancelled
+                self._dispatch()
+            raise
+        try:
+            yield
+        finally:
+            self._running[cost_class] -= 1
+            self._dispatch()
+
+    def stats(self) -> Dict[str, object]:
+        queued: Dict[str, int] = {CHEAP: 0, RENDER: 0, SCAN: 0}
+        for _, _, cost_class, future in self._waiting:
+            if not future.done():
+                queued[cost_class] += 1
+        return {
+            "slots": self.slots,
+            "running": dict(self._running),
+            "queued": queued,
+            "admitted": self.admitted,
+            "deferred": self.deferred,
+            "rejected": self.rejected,
+        }
+
+
+scheduler = Scheduler()
@@ -0,0 +1,194 @@
+# season_context.py
+#
+# Everything the commands need for the current season, loaded once by a background
+# warm-up instead of at import time. Modules import without side effects; the bot
+# starts the warm-up after connecting, and commands that arrive early wait on it.
+#
+# When compute runs in worker processes the front end only warms the fact table (used to
+# validate player and stat names), memory-mapped from the snapshot when there is one;
+# the workers hold the full context.
+
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+import pandas as pd
+
+from derived_cache import derived_cache, inputs
+from fact_table import HISTORY_SEASONS, PlayerGameFacts, history_facts
+from ingest import SeasonAggregates, stored_aggregates
+
+CURRENT_SEASON = 2024
+
+
+@dataclass
+class SeasonContext:
+    season: int
+    season_used: int                      # pbp season actually loaded (may fall back to season - 1)
+    pbp_message: str
+    pbp: Optional[pd.DataFrame]
+    defensive_df: Optional[pd.DataFrame]
+    off_line_df: Optional[pd.DataFrame]
+    facts: PlayerGameFacts
+    rosters: Optional[pd.DataFrame]
+    aggregates: Optional[SeasonAggregates] = None   # team partial sums behind the two tables (needs the local store)
+
+
+def _load_rosters(season: int) -> Optional[pd.DataFrame]:
+    import nfl_data_py as nfl
+    try:
+        return nfl.import_weekly_rosters([season])
+    except Exception:
+        return None
+
+
+def _build_context(season: int) -> SeasonContext:
+    from OverUnderPrediction import _season_tables
+
+    pbp, used, msg, defensive_df, off_line_df = _season_tables(season)
+    rosters = derived_cache.cached(("rosters", season), inputs([season]), lambda: _load_rosters(season))
+    aggregates = stored_aggregates(season) if used == season else None
+    return SeasonContext(
+        season=season,
+        season_used=used,
+        pbp_message=msg,
+        pbp=pbp,
+        defensive_df=defensive_df,
+        off_line_df=off_line_df,
+        facts=history_facts(),
+        rosters=rosters,
+        aggregates=aggregates,
+    )
+
+
+def get_context(season: int = CURRENT_SEASON) -> SeasonContext:
+    """The season's context; built once (callers during warm-up wait for that build)."""
+    return derived_cache.cached(
+        ("context", season),
+        inputs([season, season - 1]),
+        lambda: _build_context(season),
+        depends_on=[("pbp", season), ("facts", HISTORY_SEASONS)],
+    )
+
+
+def _install(context: SeasonContext) -> None:
+    """
+    Register a restored context (and its parts) in the dependency cache under the same
+    keys, inputs and dependencies a normal build uses, so invalidation still works.
+    """
+    season, used = context.season, context.season_used
+    pbp_key = ("pbp", season)
+    seed = derived_cache.cached
+    seed(pbp_key, inputs([season, season - 1]), lambda: (context.pbp, used, context.pbp_message))
+    tables_depend_on = [pbp_key]
+    if context.aggregates is not None:
+        seed(("aggregates", season), inputs([season]), lambda: context.aggregates)
+        tables_depend_on.append(("aggregates", season))
+    if context.defensive_df is not None:
+        seed(("defensive", season), inputs([used]), lambda: context.defensive_df, depends_on=tables_depend_on)
+    if context.off_line_df is not None:
+        seed(("oline", season), inputs([used]), lambda: context.off_line_df, depends_on=tables_depend_on)
+    seed(("facts", HISTORY_SEASONS), inputs(HISTORY_SEASONS), lambda: context.facts)
+    if context.rosters is not None:
+        seed(("rosters", season), inputs([season]), lambda: context.rosters)
+    if context.rosters is None:
+        return  # get_context reassembles from the seeded parts and reloads rosters
+    seed(("context", season), inputs([season, season - 1]), lambda: context,
+         depends_on=[pbp_key, ("facts", HISTORY_SEASONS)])
+
+
+def _restore_or_build(season: int) -> SeasonContext:
+    """Restore the season from its snapshot when one is current, otherwise build it."""
+    from snapshot import load_snapshot
+
+    context = load_snapshot(season)
+    if context is None:
+        return get_context(season)
+    _install(context)
+    return get_context(season)
+
+
+# ---------- Background warm-up
+
+_ready = threading.Event()
+# Set on the loop that started the warm-up, so waiting commands don't park executor threads
+_ready_async: Optional[asyncio.Event] = None
+_ready_loop: Optional[asyncio.AbstractEventLoop] = None
+_state: Dict[str, Any] = {"state": "cold", "season": None, "seconds": None, "error": None, "finished_at": None,
+                          "facts_only": False}
+
+
+def _restore_facts(season: int) -> None:
+    """Front-end warm-up: the history fact table only (from the snapshot when usable)."""
+    from snapshot import load_snapshot_facts
+
+    facts = load_snapshot_facts(season)
+    if facts is not None:
+        derived_cache.cached(("facts", HISTORY_SEASONS), inputs(HISTORY_SEASONS), lambda: facts)
+    history_facts()
+
+
+def _warm_up(season: int, facts_only: bool) -> None:
+    start = time.perf_counter()
+    try:
+        if facts_only:
+            _restore_facts(season)
+            _state["error"] = None
+        else:
+            context = _restore_or_build(season)
+            _state["error"] = None if context.pbp is not None else context.pbp_message
+        _state["state"] = "ready"
+    except Exception as e:
+        _state["state"] = "failed"
+        _state["error"] = f"{e.__class__.__name__}: {e}"
+    finally:
+        _state["seconds"] = round(time.perf_counter() - start, 2)
+        _state["finished_at"] = time.time()
+        _ready.set()
+        if _ready_loop is not None:
+            try:
+                _ready_loop.call_soon_threadsafe(_ready_async.set)
+            except RuntimeError:  # loop already closed
+                pass
+    print(f"Warm-up {_state['state']} for {season} in {_state['seconds']}s"
+          + (f" ({_state['error']})" if _state["error"] else ""))
+
+
+def start_warm_up(season: int = CURRENT_SEASON, facts_only: bool = False) -> None:
+    """
+    Start loading the season context on a background thread (no-op if already started);
+    with `facts_only`, just the fact table (the compute workers hold the rest).
+    """
+    global _ready_async, _ready_loop
+    if _state["state"] != "cold":
+        return
+    try:
+        _ready_loop = asyncio.get_running_loop()
+        _ready_async = asyncio.Event()
+    except RuntimeError:  # started outside an event loop
+        pass
+    _state.update(state="warming", season=season, facts_only=facts_only)
+    threading.Thread(target=_warm_up, args=(season, facts_only), name="season-warm-up", daemon=True).start()
+
+
+def warm_up_state() -> Dict[str, Any]:
+    return dict(_state)
+
+
+def is_ready() -> bool:
+    return _ready.is_set()
+
+
+async def wait_until_ready(timeout: Optional[float] = None) -> bool:
+    """Await the warm-up without blocking the event loop. True once it has finished."""
+    if _ready.is_set() or _state["state"] == "cold":
+        return _ready.is_set()
+    if _ready_loop is not asyncio.get_running_loop():
+        return await asyncio.to_thread(_ready.wait, timeout)
+    try:
+        await asyncio.wait_for(_ready_async.wait(), timeout)
+    except asyncio.TimeoutError:
+        pass
+    return _ready.is_set()
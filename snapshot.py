@@ -0,0 +1,256 @@
+# snapshot.py
+#
+# Save the fully warmed SeasonContext to a versioned on-disk bundle and restore it on
+# startup in seconds instead of rebuilding for minutes. A bundle is a directory of
+# Parquet / NumPy files plus manifest.json with a schema hash per file; it is ignored
+# (and the context rebuilt) when the format or the pbp projection changed, or when any
+# store season it was built from (the season, the previous one for the pbp fallback,
+# the fact table's history) has been written since.
+#
+# Play-by-play isn't copied into the bundle when the local store has it: it is reopened
+# from the memory-mapped store, so every process restoring it shares the same pages.
+#
+#   python snapshot.py 2024
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+import nfl_api
+from data_store import STORE_DIR, pbp_store, store_available, weekly_store
+from fact_table import HISTORY_SEASONS, PlayerGameFacts
+from ingest import SeasonAggregates
+
+# Bump when the bundle layout or any saved structure changes
+SNAPSHOT_VERSION = 3
+
+SNAPSHOT_DIR = os.getenv("NFL_SNAPSHOT_DIR", os.path.join(STORE_DIR, "snapshots"))
+
+# SeasonContext frames -> file stem
+_FRAMES = {
+    "pbp": "pbp",
+    "defensive_df": "defensive",
+    "off_line_df": "oline",
+    "rosters": "rosters",
+}
+
+# SeasonAggregates frames -> file stem
+_AGGREGATE_FRAMES = {
+    "defensive": "agg_defensive",
+    "oline": "agg_oline",
+}
+
+
+def _hash(obj) -> str:
+    return hashlib.sha1(json.dumps(obj, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _frame_schema_hash(df: pd.DataFrame) -> str:
+    index = [str(n) for n in df.index.names]
+    return _hash({"index": index, "columns": [[str(c), str(t)] for c, t in df.dtypes.items()]})
+
+
+def _array_schema_hash(arr: np.ndarray) -> str:
+    return _hash({"dtype": str(arr.dtype), "ndim": arr.ndim})
+
+
+def _store_versions(season: int) -> Dict[str, Dict[str, Optional[float]]]:
+    """Write times of every store season the bundle is built from (JSON keys: season as str)."""
+    if not store_available():
+        return {}
+    return {
+        "pbp": {str(s): pbp_store.version(s) for s in (season - 1, season)},
+        "weekly": {str(s): weekly_store.version(s) for s in sorted(set(HISTORY_SEASONS) | {season})},
+    }
+
+
+def _pbp_in_store(season_used: int) -> bool:
+    return store_available() and pbp_store.has_season(season_used)
+
+
+def bundle_dir(season: int, root: str = SNAPSHOT_DIR) -> str:
+    return os.path.join(root, f"season_{season}_v{SNAPSHOT_VERSION}")
+
+
+# ---------- Save
+
+def save_snapshot(context, root: str = SNAPSHOT_DIR) -> str:
+    """Write `context` (a SeasonContext) to its bundle directory. Returns the path."""
+    start = time.perf_counter()
+    final = bundle_dir(context.season, root)
+    tmp = final + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    files: Dict[str, Dict[str, str]] = {}
+
+    def write_frame(stem: str, df: Optional[pd.DataFrame]) -> None:
+        if df is None:
+            return
+        try:
+            df.to_parquet(os.path.join(tmp, stem + ".parquet"))
+        except Exception as e:  # e.g. mixed-type roster columns; rebuilt on restore instead
+            print(f"Snapshot: skipped {stem} ({e.__class__.__name__}: {e})")
+            return
+        files[stem + ".parquet"] = {"kind": "frame", "schema": _frame_schema_hash(df)}
+
+    pbp_from_store = _pbp_in_store(context.season_used)
+    for attr, stem in _FRAMES.items():
+        if attr == "pbp" and pbp_from_store:
+            continue
+        write_frame(stem, getattr(context, attr))
+
+    # Identity index: the fact table's integer arrays + name tables
+    arrays, names = context.facts.to_arrays()
+    for name, arr in arrays.items():
+        np.save(os.path.join(tmp, f"facts_{name}.npy"), arr)
+        files[f"facts_{name}.npy"] = {"kind": "array", "schema": _array_schema_hash(arr)}
+    with open(os.path.join(tmp, "facts_names.json"), "w") as f:
+        json.dump(names, f)
+    files["facts_names.json"] = {"kind": "names", "schema": _hash(sorted(names))}
+
+    aggregates = context.aggregates
+    if aggregates is not None:
+        for attr, stem in _AGGREGATE_FRAMES.items():
+            write_frame(stem, getattr(aggregates, attr))
+
+    manifest = {
+        "version": SNAPSHOT_VERSION,
+        "season": context.season,
+        "season_used": context.season_used,
+        "pbp_message": context.pbp_message,
+        "pbp_columns_hash": _hash(nfl_api.PBP_COLUMNS),
+        "store_versions": _store_versions(context.season),
+        "pbp_from_store": pbp_from_store,
+        "aggregate_weeks": aggregates.weeks if aggregates is not None else None,
+        "created": time.time(),
+        "files": files,
+    }
+    with open(os.path.join(tmp, "manifest.json"), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    shutil.rmtree(final, ignore_errors=True)
+    os.replace(tmp, final)
+    print(f"Snapshot for {context.season} written to {final} in {time.perf_counter() - start:.1f}s")
+    return final
+
+
+# ---------- Restore
+
+def _check(manifest: dict, season: int) -> Optional[str]:
+    """Why the bundle can't be used, or None if it can."""
+    if manifest.get("version") != SNAPSHOT_VERSION:
+        return f"format v{manifest.get('version')} != v{SNAPSHOT_VERSION}"
+    if manifest.get("season") != season:
+        return "season mismatch"
+    if manifest.get("pbp_columns_hash") != _hash(nfl_api.PBP_COLUMNS):
+        return "pbp column projection changed"
+    if manifest.get("store_versions") != _store_versions(season):
+        return "local store was written since (new weeks or corrections)"
+    if manifest.get("pbp_from_store") and not _pbp_in_store(manifest["season_used"]):
+        return "play-by-play is no longer in the local store"
+    return None
+
+
+def _manifest(season: int, root: str) -> Optional[dict]:
+    """The bundle's manifest if it is usable for `season`, else None."""
+    manifest_path = os.path.join(bundle_dir(season, root), "manifest.json")
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    reason = _check(manifest, season)
+    if reason:
+        print(f"Snapshot for {season} not used: {reason}")
+        return None
+    return manifest
+
+
+def _load_facts(path: str, files: dict) -> PlayerGameFacts:
+    """Fact table over the bundle's arrays, memory-mapped (shared through the page cache)."""
+    arrays = {}
+    for name in PlayerGameFacts._ARRAYS:
+        file = f"facts_{name}.npy"
+        arr = np.load(os.path.join(path, file), mmap_mode="r")
+        if _array_schema_hash(arr) != files[file]["schema"]:
+            raise ValueError(f"schema mismatch in {file}")
+        arrays[name] = arr
+    with open(os.path.join(path, "facts_names.json")) as f:
+        names = json.load(f)
+    return PlayerGameFacts.from_arrays(arrays, names)
+
+
+def load_snapshot_facts(season: int, root: str = SNAPSHOT_DIR) -> Optional[PlayerGameFacts]:
+    """Just the bundle's fact table (for a front end that only validates names), or None."""
+    try:
+        manifest = _manifest(season, root)
+        return _load_facts(bundle_dir(season, root), manifest["files"]) if manifest else None
+    except Exception as e:
+        print(f"Snapshot facts for {season} not used: {e.__class__.__name__}: {e}")
+        return None
+
+
+def load_snapshot(season: int, root: str = SNAPSHOT_DIR):
+    """
+    SeasonContext restored from the bundle, or None when there is no usable bundle
+    (missing, incompatible or stale) and the caller should rebuild.
+    """
+    from season_context import SeasonContext
+
+    path = bundle_dir(season, root)
+    start = time.perf_counter()
+    try:
+        manifest = _manifest(season, root)
+        if manifest is None:
+            return None
+
+        files = manifest["files"]
+
+        def read_frame(stem: str) -> Optional[pd.DataFrame]:
+            name = stem + ".parquet"
+            if name not in files:
+                return None
+            df = pd.read_parquet(os.path.join(path, name))
+            if _frame_schema_hash(df) != files[name]["schema"]:
+                raise ValueError(f"schema mismatch in {name}")
+            return df
+
+        facts = _load_facts(path, files)
+
+        aggregates = None
+        if manifest.get("aggregate_weeks") is not None:
+            aggregates = SeasonAggregates(season)
+            aggregates.weeks = manifest["aggregate_weeks"]
+            for attr, stem in _AGGREGATE_FRAMES.items():
+                setattr(aggregates, attr, read_frame(stem))
+
+        context = SeasonContext(
+            season=season,
+            season_used=manifest["season_used"],
+            pbp_message=manifest["pbp_message"] + " (restored from snapshot)",
+            pbp=pbp_store.read_season(manifest["season_used"]) if manifest["pbp_from_store"] else read_frame("pbp"),
+            defensive_df=read_frame("defensive"),
+            off_line_df=read_frame("oline"),
+            facts=facts,
+            rosters=read_frame("rosters"),
+            aggregates=aggregates,
+        )
+    except Exception as e:
+        print(f"Snapshot for {season} not used: {e.__class__.__name__}: {e}")
+        return None
+
+    print(f"Restored {season} snapshot in {time.perf_counter() - start:.1f}s")
+    return context
+
+
+if __name__ == "__main__":
+    from season_context import get_context
+
+    save_snapshot(get_context(int(sys.argv[1]) if len(sys.argv) > 1 else 2024))
@@ -0,0 +1,77 @@
+# startup_benchmark.py
+#
+# Measures how long each bot module takes to import in a fresh interpreter and which
+# heavyweight libraries it drags in. Fails (exit 1) if discord_bot exceeds the budget
+# or imports a library that should only load on first use.
+#
+#   python startup_benchmark.py            # default budget
+#   python startup_benchmark.py 0.8        # budget in seconds
+
+import json
+import subprocess
+import sys
+
+# Import-time budget for the bot entry point, in seconds
+DEFAULT_BUDGET = 1.5
+
+MODULES = [
+    "config",
+    "nfl_api",
+    "fact_table",
+    "chart_render",
+    "bot_mehtods",
+    "nfl_player_stats_v2",
+    "predictionHelpers",
+    "OverUnderPrediction",
+    "prediction",
+    "season_context",
+    "discord_bot",
+]
+
+# Libraries that must not load at import time (only on first chart / first download)
+LAZY = ["matplotlib", "seaborn", "nfl_data_py"]
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(module):
+    proc = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(module=module, lazy=LAZY)],
+        capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        return {"seconds": None, "loaded": [], "error": proc.stderr.strip().splitlines()[-1:]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def main():
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_BUDGET
+    failed = False
+
+    print(f"{'module':22s} {'import (s)':>10s}  eager heavy libs")
+    for module in MODULES:
+        result = measure(module)
+        if result["seconds"] is None:
+            print(f"{module:22s} {'error':>10s}  {result['error']}")
+            failed = True
+            continue
+        print(f"{module:22s} {result['seconds']:10.3f}  {', '.join(result['loaded']) or '-'}")
+        if module == "discord_bot":
+            if result["seconds"] > budget:
+                print(f"discord_bot import took {result['seconds']:.3f}s (budget {budget:.3f}s)")
+                failed = True
+            if result["loaded"]:
+                print(f"discord_bot eagerly imports {', '.join(result['loaded'])}")
+                failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+# tracing.py
+#
+# Lightweight per-request tracing. Each bot command is a trace with a root span; code
+# along the way opens child spans with `with span("name"):` - the metrics stages
+# (data_load, parse, queue, compute, render, send), player-name resolution, every
+# nfl_data_py download / local-store read and every predict_over_under factor. Spans
+# follow the command through its background job and worker threads (context variables),
+# and compute worker processes send theirs back with the result.
+#
+# When a command finishes its spans are handed to a background thread that appends them
+# to BOT_TRACE_FILE as JSON lines (one span per line; empty disables tracing), so the
+# event loop never waits on the disk:
+#
+#   {"trace": "9f..", "span": "3a..", "parent": "77..", "name": "compute",
+#    "start": 1729353600.123, "seconds": 0.412, "pid": 1234, "attrs": {...}}
+#
+# To look at them as a flame graph:
+#
+#   python tracing.py data/traces.jsonl > trace.json            Chrome trace events (Perfetto, speedscope)
+#   python tracing.py data/traces.jsonl --folded > stacks.txt   folded stacks (flamegraph.pl, speedscope)
+#   python tracing.py data/traces.jsonl --command last10 --slowest 20
+
+import atexit
+import contextvars
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+# Defaults to the data store root (data_store.STORE_DIR, not imported: the store is traced)
+_STORE_DIR = os.getenv("NFL_DATA_STORE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+TRACE_FILE = os.getenv("BOT_TRACE_FILE", os.path.join(_STORE_DIR, "traces.jsonl"))
+
+# The file is rotated to <file>.1 once it grows past this
+TRACE_MAX_MB = float(os.getenv("BOT_TRACE_MAX_MB", "64"))
+
+# Finished traces waiting for the writer thread; more are dropped (and counted)
+MAX_PENDING = 1000
+
+
+def _new_id() -> str:
+    return os.urandom(8).hex()
+
+
+class Span:
+    __slots__ = ("name", "span_id", "parent_id", "start", "seconds", "attrs", "_t0")
+
+    def __init__(self, name: str, parent_id: Optional[str] = None, **attrs: Any):
+        self.name = name
+        self.span_id = _new_id()
+        self.parent_id = parent_id
+        self.start = time.time()
+        self.seconds: Optional[float] = None
+        self.attrs = attrs
+        self._t0 = time.perf_counter()
+
+    def end(self) -> None:
+        if self.seconds is None:
+            self.seconds = time.perf_counter() - self._t0
+
+    def to_dict(self, trace_id: str) -> Dict[str, Any]:
+        return {"trace": trace_id, "span": self.span_id, "parent": self.parent_id, "name": self.name,
+                "start": round(self.start, 6), "seconds": round(self.seconds or 0.0, 6),
+                "pid": os.getpid(), "attrs": self.attrs}
+
+
+class Trace:
+    def __init__(self, name: str, **attrs: Any):
+        self.trace_id = _new_id()
+        self.root = Span(name, **attrs)
+        self.spans: List[Dict[str, Any]] = []
+        self.finished = False
+        self._lock = threading.Lock()
+
+    def add(self, span: Span) -> None:
+        record = span.to_dict(self.trace_id)
+        with self._lock:
+            if not self.finished:
+                self.spans.append(record)
+                return
+        # Ended after its command (e.g. a background write): still worth recording
+        _writer.write([record])
+
+    def adopt(self, records: List[Dict[str, Any]], parent_id: str) -> None:
+        """Add spans recorded elsewhere (a worker process); their roots go under `parent_id`."""
+        for record in records:
+            record = dict(record, trace=self.trace_id)
+            if record["parent"] is None:
+                record["parent"] = parent_id
+            with self._lock:
+                self.spans.append(record)
+
+    def finish(self, **attrs: Any) -> List[Dict[str, Any]]:
+        """End the root span; returns every span of the trace (root first)."""
+        self.root.attrs.update(attrs)
+        self.root.end()
+        with self._lock:
+            self.finished = True
+            return [self.root.to_dict(self.trace_id)] + self.spans
+
+
+class _Writer:
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.dropped = 0
+        self._queue: "queue.Queue[List[Dict[str, Any]]]" = queue.Queue(MAX_PENDING)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def write(self, records: List[Dict[str, Any]]) -> None:
+        """Queue spans for the writer thread; never blocks the caller."""
+        if not self.path or not records:
+            return
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+                    self._thread.start()
+        try:
+            self._queue.put_nowait(records)
+        except queue.Full:
+            self.dropped += len(records)
+
+    def _run(self) -> None:
+        while True:
+            batches = [self._queue.get()]
+            while True:
+                try:
+                    batches.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._append([r for records in batches for r in records])
+            except Exception as e:
+                print(f"Trace not written to {self.path}: {e.__class__.__name__}: {e}")
+            finally:
+                for _ in batches:
+                    self._queue.task_done()
+
+    def _append(self, records: List[Dict[str, Any]]) -> None:
+        text = "".join(json.dumps(r, default=str) + "\n" for r in records)
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                os.replace(self.path, self.path + ".1")
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(text)
+        except OSError as e:
+            print(f"Trace not written to {self.path}: {e}")
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """Wait (up to `timeout` seconds) for queued spans to reach the file."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+
+_writer = _Writer(TRACE_FILE, int(TRACE_MAX_MB * 1024 * 1024))
+atexit.register(_writer.flush)
+
+_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("trace", default=None)
+_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("trace_span", default=None)
+
+
+def enabled() -> bool:
+    return bool(_writer.path)
+
+
+def start_trace(name: str, **attrs: Any) -> Optional[Trace]:
+    """Start a trace for the current request (None when tracing is disabled)."""
+    if not enabled():
+        return None
+    trace = Trace(name, **attrs)
+    _trace.set(trace)
+    _span.set(trace.root)
+    return trace
+
+
+def finish_trace(trace: Optional[Trace], **attrs: Any) -> None:
+    """End `trace` and append its spans to the trace file."""
+    if trace is not None and not trace.finished:
+        _writer.write(trace.finish(**attrs))
+
+
+def current_trace() -> Optional[Trace]:
+    return _trace.get()
+
+
+@contextmanager
+def span(name: str, **attrs: Any) -> Iterator[Optional[Span]]:
+    """Time the block as a child of the current span (no-op outside a trace)."""
+    trace = _trace.get()
+    if trace is None:
+        yield None
+        return
+    parent = _span.get()
+    current = Span(name, parent.span_id if parent is not None else trace.root.span_id, **attrs)
+    token = _span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.attrs["error"] = e.__class__.__name__
+        raise
+    finally:
+        _span.reset(token)
+        current.end()
+        trace.add(current)
+
+
+# ---------- Across processes
+
+@contextmanager
+def collect(name: str, **attrs: Any) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Record the block's spans without writing them, for a process that sends them back to
+    the traced request. The list is filled when the block exits; its root has no parent.
+    """
+    records: List[Dict[str, Any]] = []
+    trace = Trace(name, **attrs)
+    trace_token, span_token = _trace.set(trace), _span.set(trace.root)
+    try:
+        yield records
+    finally:
+        _span.reset(span_token)
+        _trace.reset(trace_token)
+        records.extend(trace.finish())
+
+
+def adopt(records: List[Dict[str, Any]]) -> None:
+    """Attach spans collected in another process under the current span."""
+    trace, parent = _trace.get(), _span.get()
+    if trace is not None and parent is not None and records:
+        trace.adopt(records, parent.span_id)
+
+
+# ---------- Viewing
+
+def read_traces(path: str) -> Dict[str, List[Dict[str, Any]]]:
+    traces: Dict[str, List[Dict[str, Any]]] = {}
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                record = json.loads(line)
+                traces.setdefault(record["trace"], []).append(record)
+    return traces
+
+
+def _root(spans: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    ids = {s["span"] for s in spans}
+    return next((s for s in spans if s["parent"] not in ids), None)
+
+
+def chrome_events(traces: Dict[str, List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Complete ("X") trace events, one row (tid) per trace."""
+    events = []
+    for row, spans in enumerate(traces.values(), start=1):
+        for s in spans:
+            events.append({"name": s["name"], "ph": "X", "ts": s["start"] * 1e6, "dur": s["seconds"] * 1e6,
+                           "pid": 1, "tid": row, "args": dict(s["attrs"], trace=s["trace"], pid=s["pid"])})
+    return events
+
+
+def folded_stacks(traces: Dict[str, List[Dict[str, Any]]]) -> Dict[str, float]:
+    """'root;child;grandchild' -> self time in milliseconds, summed over traces."""
+    stacks: Dict[str, float] = {}
+    for spans in traces.values():
+        by_id = {s["span"]: s for s in spans}
+        child_time: Dict[str, float] = {}
+        for s in spans:
+            if s["parent"] in by_id:
+                child_time[s["parent"]] = child_time.get(s["parent"], 0.0) + s["seconds"]
+        for s in spans:
+            path, node = [], s
+            while node is not None:
+                path.append(node["name"])
+                node = by_id.get(node["parent"])
+            key = ";".join(reversed(path))
+            self_ms = max(0.0, s["seconds"] - child_time.get(s["span"], 0.0)) * 1000
+            stacks[key] = stacks.get(key, 0.0) + self_ms
+    return stacks
+
+
+def main(argv: List[str]) -> None:
+    if not argv or argv[0].startswith("-"):
+        print("usage: python tracing.py TRACE_FILE [--folded] [--command NAME] [--slowest N]")
+        sys.exit(2)
+    path, args = argv[0], argv[1:]
+    traces = read_traces(path)
+
+    if "--command" in args:
+        name = args[args.index("--command") + 1]
+        traces = {t: spans for t, spans in traces.items()
+                  if (_root(spans) or {}).get("attrs", {}).get("command") == name}
+    if "--slowest" in args:
+        n = int(args[args.index("--slowest") + 1])
+        ranked = sorted(traces.items(), key=lambda kv: -((_root(kv[1]) or {}).get("seconds", 0.0)))
+        traces = dict(ranked[:n])
+
+    if "--folded" in args:
+        for stack, ms in sorted(folded_stacks(traces).items()):
+            print(f"{stack} {max(1, round(ms))}")
+    else:
+        json.dump({"traceEvents": chrome_events(traces), "displayTimeUnit": "ms"}, sys.stdout)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])